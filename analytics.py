@@ -0,0 +1,89 @@
+from itertools import chain
+
+import numpy as np
+
+
+def load_history(db):
+    """Вся история одним запросом в массивы (server_id, epoch, load).
+
+    Порядок (server_id, timestamp) берется из индекса, поэтому замеры
+    уже сгруппированы по серверам и отсортированы по времени.
+    """
+    cur = db.cursor()
+    cur.row_factory = None
+    cur.execute("""
+        SELECT server_id, CAST(strftime('%s', timestamp) AS INTEGER), load_value
+        FROM server_load_history
+        WHERE strftime('%s', timestamp) IS NOT NULL
+        ORDER BY server_id, timestamp
+    """)
+    flat = np.fromiter(chain.from_iterable(cur), dtype=np.float64)
+    table = flat.reshape(-1, 3)
+    return table[:, 0].astype(np.int64), table[:, 1], table[:, 2]
+
+
+def _group_percentile(sorted_values, starts, counts, q):
+    # Линейная интерполяция, как np.percentile, но сразу для всех групп
+    position = starts + (counts - 1) * (q / 100.0)
+    lower = np.floor(position).astype(np.int64)
+    upper = np.ceil(position).astype(np.int64)
+    fraction = position - lower
+    return sorted_values[lower] * (1 - fraction) + sorted_values[upper] * fraction
+
+
+def fleet_stats(server_ids, epochs, loads, threshold=80, alpha=0.3, z_threshold=3.0):
+    """Статистика по всем серверам за один проход векторными операциями.
+
+    Возвращает словарь server_id -> метрики: p50/p95/p99, EWMA, секунды
+    выше порога, z-оценка последнего замера и флаг аномалии.
+    """
+    if len(loads) == 0:
+        return {}
+
+    ids, starts, counts = np.unique(server_ids, return_index=True, return_counts=True)
+    groups = np.repeat(np.arange(len(ids)), counts)
+    ends = starts + counts - 1
+
+    # Перцентили: сортировка нагрузки внутри каждой группы
+    sorted_loads = loads[np.lexsort((loads, groups))]
+    percentiles = {
+        q: _group_percentile(sorted_loads, starts, counts, q) for q in (50, 95, 99)
+    }
+
+    # EWMA в замкнутой форме: вес замера зависит от расстояния до конца группы
+    distance = ends[groups] - np.arange(len(loads))
+    weights = alpha * (1 - alpha) ** distance
+    weights[starts] = (1 - alpha) ** (counts - 1)
+    ewma = np.bincount(groups, weights=weights * loads, minlength=len(ids))
+
+    # Время выше порога: интервал до следующего замера той же группы
+    intervals = np.zeros_like(epochs)
+    intervals[:-1] = np.diff(epochs)
+    intervals[ends] = 0
+    above = np.bincount(
+        groups, weights=intervals * (loads > threshold), minlength=len(ids)
+    )
+
+    # z-оценка последнего замера относительно среднего по серверу
+    mean = np.bincount(groups, weights=loads, minlength=len(ids)) / counts
+    variance = np.bincount(groups, weights=loads ** 2, minlength=len(ids)) / counts - mean ** 2
+    std = np.sqrt(np.maximum(variance, 0))
+    last = loads[ends]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        z_score = np.where(std > 0, (last - mean) / std, 0.0)
+
+    return {
+        int(server_id): {
+            'samples': int(counts[i]),
+            'last': float(last[i]),
+            'mean': round(float(mean[i]), 2),
+            'p50': round(float(percentiles[50][i]), 2),
+            'p95': round(float(percentiles[95][i]), 2),
+            'p99': round(float(percentiles[99][i]), 2),
+            'ewma': round(float(ewma[i]), 2),
+            'seconds_above_threshold': int(above[i]),
+            'z_score': round(float(z_score[i]), 2),
+            'anomaly': bool(abs(z_score[i]) > z_threshold),
+        }
+        for i, server_id in enumerate(ids)
+    }
@@ -1,16 +1,38 @@
-from flask import Flask, render_template, request, redirect, url_for, flash, session, jsonify
+from flask import Flask, render_template, request, redirect, url_for, flash, session, jsonify, Response, g
+from werkzeug.datastructures import MultiDict
 import sqlite3
 import hashlib
 import os
 import json
-from threading import Thread
 from functools import wraps
 from config import Config
 import time
-from datetime import datetime , timedelta
-from Crypto.Cipher import AES
-from Crypto.Util.Padding import pad, unpad
-import base64
+import atexit
+import threading
+from datetime import datetime , timedelta, date
+import signal
+import sys
+from ingest import IngestQueue, QueueFull, store_samples, validate_sample
+from listener import TCPListener, UDPListener
+import retention
+import rollups
+import analytics
+import database
+import wire
+from snapshot import ServerSnapshot
+from broadcast import Broadcaster
+from placement import PlacementIndex
+from ratelimit import RateLimiter, RateLimited
+from registrations import registrations_page, export_registrations_csv, delete_registrations
+import bulk
+from database import get_db
+from history import create_backend, dump_cursor, load_cursor
+from archive import BlockArchive
+from heartbeat import HeartbeatWatchdog
+from httpcache import CachedBody, cached_response, compress_response, file_hash
+import vendor_assets
+from cluster import ChangeFeed, LeaderLease, Scheduler, bump_generation
+from instrumentation import registry
 
 app = Flask(__name__)
 app.config.from_object(Config)
@@ -31,194 +53,534 @@ def login_required(f):
     return decorated_function
 
 def encrypt_data(data: dict) -> str:
-    """Шифрование данных с использованием AES"""
-    # Преобразуем словарь в строку JSON
-    json_data = json.dumps(data)
-    
-    # Создаем ключ из секрета
-    key = hashlib.sha256(app.config['SECRET_KEY'].encode()).digest()
-    
-    # Создаем объект шифрования
-    cipher = AES.new(key, AES.MODE_CBC)
-    
-    # Шифруем данные с дополнением
-    ct_bytes = cipher.encrypt(pad(json_data.encode(), AES.block_size))
-    
-    # Объединяем IV и зашифрованные данные
-    iv = cipher.iv
-    encrypted_data = iv + ct_bytes
-    
-    # Кодируем в base64 для передачи
-    return base64.b64encode(encrypted_data).decode('utf-8')
+    """Шифрование данных с использованием AES (legacy-формат)"""
+    return wire.encrypt_json(data, app.config['SECRET_KEY'])
 
 def decrypt_data(encrypted_data: str) -> dict:
-    """Дешифрование данных с использованием AES"""
-    # Декодируем из base64
-    encrypted_data = base64.b64decode(encrypted_data)
-    
-    # Извлекаем IV и зашифрованные данные
-    iv = encrypted_data[:AES.block_size]
-    ct = encrypted_data[AES.block_size:]
-    
-    # Создаем ключ из секрета
-    key = hashlib.sha256(app.config['SECRET_KEY'].encode()).digest()
-    
-    # Создаем объект дешифрования
-    cipher = AES.new(key, AES.MODE_CBC, iv=iv)
-    
-    # Дешифруем данные и убираем дополнение
-    pt = unpad(cipher.decrypt(ct), AES.block_size)
-    
-    # Преобразуем JSON обратно в словарь
-    return json.loads(pt.decode('utf-8'))
+    """Дешифрование данных с использованием AES (legacy-формат)"""
+    return wire.decrypt_json(encrypted_data, app.config['SECRET_KEY'])
 
+# Хранилище истории нагрузки (SQLite или файлы через mmap)
+history_store = create_backend(app.config)
 
+# Сжатые блоки истории для долгих диапазонов графиков и выгрузки
+archive = BlockArchive(app.config['ARCHIVE_BLOCK_SECONDS']) if app.config['ARCHIVE_BLOCK_SECONDS'] else None
 
-def get_db():
-    """соединение с БД"""
-    db = sqlite3.connect(app.config['DATABASE_PATH'])
-    db.row_factory = sqlite3.Row
-    return db
+# Снимок серверов и недавней истории для публичных страниц
+snapshot = ServerSnapshot(
+    get_db,
+    history_window=app.config['HISTORY_WINDOW'],
+    history=history_store
+)
 
-def init_db():
-    """инициализация БД"""
+def load_placement_state():
+    """Серверы, число регистраций и id последней заявки для индекса размещения"""
+    db = get_db()
     try:
-        db = get_db()
-        with app.open_resource('schema.sql') as f:
-            db.cursor().executescript(f.read().decode('utf-8'))
-        
-        # Проверяем, есть ли уже администраторы
-        admin_count = db.execute("SELECT COUNT(*) FROM users WHERE is_admin = 1").fetchone()[0]
-        
-        if admin_count == 0:
-            hashed_pw = hash_password(app.config['ADMIN_PASSWORD'])
-            db.execute(
-                "INSERT INTO users (username, password_hash, is_admin) VALUES (?, ?, ?)",
-                ('admin', hashed_pw, 1)
-            )
-            db.commit()
-            print("Создан администратор по умолчанию: admin/"+app.config['ADMIN_PASSWORD'])
-    except Exception as e:
-        print(f"Ошибка инициализации БД: {e}")
-        raise
+        # Счетчики и id последней учтенной заявки - из одного снимка БД
+        rows = db.execute(
+            "SELECT server_id, COUNT(*), MAX(id) FROM registrations GROUP BY server_id"
+        ).fetchall()
     finally:
-        if 'db' in locals():
-            db.close()
+        db.close()
+    counts = {row[0]: row[1] for row in rows}
+    return snapshot.servers(), counts, max((row[2] for row in rows), default=0)
 
-def check_db_exists():
-    if not os.path.exists(app.config['DATABASE_PATH']):
-        return False
-    
+# Индекс автоматического размещения игроков по нагрузке
+placement = PlacementIndex(
+    load_placement_state,
+    pending_weight=app.config['PLACEMENT_PENDING_WEIGHT'],
+    ttl=app.config['SNAPSHOT_TTL']
+)
+
+# Рассылка новых замеров подключенным дашбордам (SSE)
+broadcaster = Broadcaster(
+    max_clients=app.config['STREAM_MAX_CLIENTS'],
+    buffer_size=app.config['STREAM_CLIENT_BUFFER']
+)
+
+def on_samples_stored(samples):
+    """Обработка замеров, записанных в БД"""
+    if app.config.get('MULTIPROCESS'):
+        # Все процессы, включая этот, получат замеры через ChangeFeed
+        return
+    publish_samples(samples)
+
+def publish_samples(samples):
+    """Учет новых замеров в кэшах процесса и рассылка дашбордам"""
+    watchdog.beat({s['server_id'] for s in samples})
+    snapshot.apply_samples(samples)
+    placement.apply_samples(samples)
+    broadcaster.publish([
+        {
+            'server_id': s['server_id'],
+            'load': s['load'],
+            'timestamp': s['timestamp'],
+            'label': s['timestamp'][11:16]
+        }
+        for s in samples
+    ])
+
+# Ограничение частоты регистраций и приема замеров
+registration_limits = app.config['REGISTRATION_LIMITS']
+limiter = RateLimiter(dict(app.config['RATE_LIMITS'], **{
+    'register': [
+        (registration_limits['MAX_REQUESTS_PER_DAY'], 24 * 3600),
+        (1, registration_limits['MIN_SECONDS_BETWEEN']),
+    ],
+    # Все попытки, включая отклоненные - для блокировки перебора
+    'register_attempts': [(registration_limits['MAX_REQUESTS_PER_DAY'] * 2, 24 * 3600)],
+}))
+
+# Очередь отложенной записи замеров от агентов
+ingest_queue = IngestQueue(
+    get_db,
+    max_size=app.config['INGEST_QUEUE_MAX'],
+    batch_size=app.config['INGEST_BATCH_SIZE'],
+    flush_interval=app.config['INGEST_FLUSH_INTERVAL_MS'] / 1000,
+    history_window=app.config['HISTORY_WINDOW'],
+    rollup_tiers=app.config['ROLLUP_TIERS'],
+    on_stored=on_samples_stored,
+    history=history_store,
+    archive=archive
+)
+ingest_queue.register_shutdown()
+# Прием кадров по UDP/TCP, запускается в create_app() при заданных портах
+listeners = []
+
+def ensure_default_admin(db):
+    """Создание администратора по умолчанию при первом запуске"""
+    # Проверяем, есть ли уже администраторы
+    admin_count = db.execute("SELECT COUNT(*) FROM users WHERE is_admin = 1").fetchone()[0]
+
+    if admin_count == 0:
+        hashed_pw = hash_password(app.config['ADMIN_PASSWORD'])
+        db.execute(
+            "INSERT INTO users (username, password_hash, is_admin) VALUES (?, ?, ?)",
+            ('admin', hashed_pw, 1)
+        )
+        db.commit()
+        print("Создан администратор по умолчанию: admin/"+app.config['ADMIN_PASSWORD'])
+
+database.init_app(app, on_bootstrap=ensure_default_admin)
+
+# Метрики, вычисляемые при выдаче /metrics
+registry.gauge_callback('ingest_queue_depth', lambda: len(ingest_queue))
+registry.gauge_callback('stream_clients', lambda: len(broadcaster))
+registry.gauge_callback('stream_dropped_clients_total', lambda: broadcaster.dropped)
+registry.gauge_callback('snapshot_version', lambda: snapshot.version)
+
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+
+@app.after_request
+def record_request_metrics(response):
+    started = g.pop('request_started', None)
+    if started is not None:
+        endpoint = request.endpoint or 'unknown'
+        registry.observe('http_request_duration_seconds', time.perf_counter() - started,
+                         endpoint=endpoint)
+        registry.inc('http_requests_total', endpoint=endpoint, method=request.method,
+                     status=str(response.status_code))
+    return response
+
+@app.after_request
+def compress_and_cache(response):
+    # Статика с хэшем содержимого в URL не меняется - кэшируем надолго
+    if request.endpoint == 'static' and request.args.get('v') and response.status_code == 200:
+        response.cache_control.no_cache = None
+        response.cache_control.public = True
+        response.cache_control.max_age = app.config['STATIC_MAX_AGE']
+        response.cache_control.immutable = True
+        return response
+    return compress_response(response, request, app.config['GZIP_MIN_SIZE'], app.config['GZIP_LEVEL'])
+
+@app.url_defaults
+def static_version(endpoint, values):
+    """Хэш содержимого в URL статики: ?v= меняется вместе с файлом"""
+    if endpoint == 'static' and 'filename' in values and 'v' not in values:
+        version = file_hash(os.path.join(app.static_folder, values['filename']))
+        if version:
+            values['v'] = version
+
+@app.context_processor
+def asset_helpers():
+    def asset_url(name):
+        """Библиотека из static/vendor, а пока ее не скачали - с CDN"""
+        filename = vendor_assets.local_path(name)
+        return url_for('static', filename=filename) if filename else vendor_assets.cdn_url(name)
+    return {'asset_url': asset_url}
+
+def send_cached(entry):
+    return cached_response(entry, request, app.config['GZIP_MIN_SIZE'], app.config['GZIP_LEVEL'])
+
+@app.route('/metrics')
+def metrics():
+    """Метрики процесса в текстовом формате Prometheus"""
+    return Response(registry.render(), mimetype='text/plain; version=0.0.4')
+
+def set_servers_stale(server_ids, stale):
+    """Пометка серверов молчащими (или снова на связи) в БД и кэшах"""
+    db = get_db()
     try:
-        db = get_db()
-        tables = db.execute("""
-            SELECT name FROM sqlite_master 
-            WHERE type='table' 
-            AND name IN ('servers', 'registrations', 'server_load_history', 'users')
-        """).fetchall()
-        return len(tables) == 4
-    except:
-        return False
+        db.executemany(
+            "UPDATE servers SET is_stale = ? WHERE id = ?",
+            [(int(stale), server_id) for server_id in server_ids]
+        )
+        bump_generation(db, 'servers')
+        db.commit()
     finally:
         db.close()
+    for server_id in server_ids:
+        snapshot.set_stale(server_id, stale)
+        placement.set_stale(server_id, stale)
+    app.logger.info(f"Серверы {'без связи' if stale else 'снова на связи'}: {sorted(server_ids)}")
 
-def background_updater():
-    """Фоновая задача для периодического обновления"""
-    while True:
-        try:
-            db = get_db()
-            # Можно добавить дополнительную логику проверки
-            db.close()
-        except Exception as e:
-            print(f"Background error: {e}")
-        time.sleep(5)
-def reset_limits_task():
-    """Фоновая задача для сброса лимитов"""
-    while True:
-        try:
-            with app.app_context():
-                db = get_db()
-                # Удаляем записи старше 24 часов
-                db.execute("""
-                    DROP TABLE IF EXISTS registration_limits
-                """)
-                db.execute("""CREATE TABLE registration_limits (
-                    ip_address TEXT PRIMARY KEY,
-                    request_count INTEGER DEFAULT 1,
-                    first_request_time TEXT NOT NULL,
-                    last_request_time TEXT NOT NULL
-                    )""")
-                db.commit()
-                app.logger.info("Старые лимиты очищены")
-        except Exception as e:
-            app.logger.error(f"Ошибка сброса лимитов: {str(e)}", exc_info=True)
-        finally:
-            if db:
-                db.close()
-            time.sleep(3600*24)  # Проверяем каждый час*24
+# Серверы, агенты которых замолчали дольше HEARTBEAT_TIMEOUT
+watchdog = HeartbeatWatchdog(
+    app.config['HEARTBEAT_TIMEOUT'],
+    on_stale=lambda server_ids: set_servers_stale(server_ids, True),
+    on_alive=lambda server_ids: set_servers_stale(server_ids, False)
+)
+# Список серверов изменился - сверить его с отслеживаемыми
+servers_changed = threading.Event()
+servers_changed.set()
+
+def heartbeat_watchdog_task():
+    """Фоновая задача для пометки молчащих серверов"""
+    if servers_changed.is_set():
+        servers_changed.clear()
+        watchdog.sync({server['id']: bool(server['is_stale']) for server in snapshot.servers()})
+    watchdog.tick()
+
+def history_retention_task():
+    """Фоновая задача для удаления истории старше окна хранения"""
+    db = get_db()
+    try:
+        deleted = history_store.purge(
+            db,
+            app.config['HISTORY_RETENTION_HOURS'],
+            app.config['HISTORY_PURGE_BATCH']
+        )
+        deleted += retention.purge_expired(
+            db,
+            app.config['METRICS_RETENTION_HOURS'],
+            app.config['HISTORY_PURGE_BATCH'],
+            table='server_metrics'
+        )
+        deleted += rollups.purge_expired(db, app.config['ROLLUP_TIERS'])
+        if archive is not None:
+            deleted += archive.purge(db, app.config['ARCHIVE_RETENTION_HOURS'])
+        if deleted:
+            app.logger.info(f"Удалено устаревших замеров: {deleted}")
+    finally:
+        db.close()
+
+def rate_limit_snapshot_task():
+    """Фоновая задача для сохранения счетчиков лимитов"""
+    limiter.save(app.config['RATE_LIMIT_SNAPSHOT_PATH'])
+
+# Фоновые задачи; при нескольких процессах их выполняет только лидер
+scheduler = Scheduler()
+scheduler.add('heartbeat_watchdog', heartbeat_watchdog_task, app.config['HEARTBEAT_CHECK_INTERVAL'])
+scheduler.add('history_retention', history_retention_task, app.config['HISTORY_PURGE_INTERVAL'])
+scheduler.add('rate_limit_snapshot', rate_limit_snapshot_task, app.config['RATE_LIMIT_SNAPSHOT_INTERVAL'])
+
+def on_cache_invalidated(names):
+    """Кэши, измененные другим процессом"""
+    if 'servers' in names:
+        snapshot.invalidate()
+        servers_changed.set()
+    if 'servers' in names or 'registrations' in names:
+        placement.invalidate()
+
+# Изменения от других процессов (только в режиме нескольких процессов)
+change_feed = ChangeFeed(
+    get_db,
+    history_store,
+    on_samples=publish_samples,
+    on_invalidate=on_cache_invalidated,
+    on_registrations=placement.apply_registrations,
+    interval=app.config['CHANGE_FEED_INTERVAL']
+)
+
+def create_app(multiprocess=False):
+    """Подготовка приложения к обслуживанию запросов.
+
+    multiprocess=True - для запуска под gunicorn в нескольких процессах:
+    фоновые задачи выполняет процесс, владеющий арендой лидера, а кэши
+    в памяти синхронизируются через ChangeFeed.
+    """
+    app.config['MULTIPROCESS'] = multiprocess
+    if multiprocess:
+        # gthread: поток на соединение, поэтому потоки стримов ограничены с запасом
+        broadcaster.max_clients = max(min(
+            app.config['STREAM_MAX_CLIENTS'],
+            app.config['WORKER_THREADS'] - app.config['STREAM_RESERVED_THREADS']
+        ), 0)
+    # Создание/миграция схемы один раз при старте
+    database.bootstrap()
+    # Счетчики лимитов переживают перезапуск
+    limiter.load(app.config['RATE_LIMIT_SNAPSHOT_PATH'])
+    if multiprocess:
+        scheduler.lease = LeaderLease(get_db, ttl=app.config['LEADER_LEASE_TTL'])
+        # В одном процессе каждая запись уже обновляет снимок, перечитывать по таймеру незачем
+        snapshot.ttl = app.config['SNAPSHOT_TTL']
+        change_feed.start()
+    scheduler.start()
+    if app.config['INGEST_MODE'] == 'write_behind':
+        ingest_queue.start()
+    for listener_class, port in ((UDPListener, app.config['INGEST_UDP_PORT']),
+                                 (TCPListener, app.config['INGEST_TCP_PORT'])):
+        if port is not None:
+            listener = listener_class(app.config['INGEST_LISTEN_HOST'], port,
+                                      app.config['SECRET_KEY'], ingest_frame_samples,
+                                      admit=lambda client: limiter.hit('ingest_client', client))
+            listener.start()
+            listeners.append(listener)
+    atexit.register(shutdown)
+    return app
+
+def shutdown():
+    """Штатная остановка процесса"""
+    # Сначала перестаем принимать, потом сбрасываем очередь
+    while listeners:
+        listeners.pop().stop()
+    ingest_queue.stop()
+    if scheduler.is_leader:
+        limiter.save(app.config['RATE_LIMIT_SNAPSHOT_PATH'])
+    if scheduler.lease is not None:
+        scheduler.lease.release()
 
 @app.before_request
-def ensure_db_exists():
-    if not check_db_exists():
-        os.makedirs(os.path.dirname(app.config['DATABASE_PATH']), exist_ok=True)
-        init_db()
 def block_suspicious_ips():
-    if request.endpoint == 'register':
-        ip = request.remote_addr
+    if request.endpoint == 'register' and request.method == 'POST':
+        try:
+            limiter.hit('register_attempts', request.remote_addr)
+        except RateLimited as e:
+            return "Превышен лимит запросов", 429, {'Retry-After': str(e.retry_after)}
+
+def rate_limited(retry_after):
+    response = jsonify({"status": "error", "message": "Rate limit exceeded"})
+    response.headers['Retry-After'] = str(retry_after)
+    return response, 429
+
+def limit_ingest(samples):
+    """Замеры в пределах лимита своих серверов и Retry-After для остальных"""
+    counts = {}
+    for sample in samples:
+        counts[sample['server_id']] = counts.get(sample['server_id'], 0) + 1
+    blocked = {}
+    for server_id, count in counts.items():
+        try:
+            limiter.hit('ingest_server', server_id, cost=count)
+        except RateLimited as e:
+            blocked[server_id] = e.retry_after
+    allowed = [s for s in samples if s['server_id'] not in blocked]
+    if blocked:
+        registry.inc('ingest_rejected_samples_total', len(samples) - len(allowed), reason='rate_limited')
+    return allowed, max(blocked.values(), default=0)
+
+def ingest_within_limit(samples, rejected=0):
+    """Запись замеров в пределах лимита; по остальным серверам - их список и Retry-After.
+
+    429 - только если лимит исчерпан у всех серверов запроса, иначе
+    замеры серверов в пределах лимита (уже учтенные) не должны пропадать.
+    """
+    valid_count = len(samples)
+    valid_ids = {sample['server_id'] for sample in samples}
+    samples, retry_after = limit_ingest(samples)
+    if not samples:
+        return rate_limited(retry_after)
+
+    # Замеры отброшенных лимитом серверов агент досылает после Retry-After
+    response = ingest_samples(samples, {
+        "accepted": len(samples),
+        "rejected": rejected,
+        "rate_limited": valid_count - len(samples),
+        "rate_limited_servers": sorted(valid_ids - {sample['server_id'] for sample in samples})
+    })
+    if retry_after and not isinstance(response, tuple):
+        response.headers['Retry-After'] = str(retry_after)
+    return response
+
+def read_agent_samples():
+    """Извлечение и дешифрование замеров из запроса агента.
+
+    Принимает бинарный кадр (application/octet-stream) и legacy JSON.
+    None - если данных нет, исключение - если расшифровать не удалось.
+    """
+    if request.mimetype == wire.FRAME_MIMETYPE:
+        frame = request.get_data()
+        if not frame:
+            return None
+        return wire.decode_frame(frame, app.config['SECRET_KEY'])
+
+    encrypted_data = (request.get_json(silent=True) or {}).get('data')
+    if not encrypted_data:
+        return None
+    data = decrypt_data(encrypted_data)
+    if isinstance(data, dict) and 'samples' in data:
+        return data['samples']
+    return [data]
+
+def submit_samples(samples):
+    """Запись проверенных замеров: в очередь (QueueFull - места нет) или сразу в БД"""
+    if app.config['INGEST_MODE'] == 'write_behind':
+        try:
+            ingest_queue.put_many(samples)
+        except QueueFull:
+            registry.inc('ingest_rejected_samples_total', len(samples), reason='queue_full')
+            raise
+    else:
         db = get_db()
-        suspicious = db.execute(
-            "SELECT 1 FROM registration_limits WHERE ip_address = ? AND request_count > ?",
-            (ip, app.config['REGISTRATION_LIMITS']['MAX_REQUESTS_PER_DAY'] * 2)
-        ).fetchone()
-        if suspicious:
-            return "Превышен лимит запросов", 429
+        try:
+            store_samples(db, samples, app.config['HISTORY_WINDOW'], app.config['ROLLUP_TIERS'],
+                          history_store, archive)
+            on_samples_stored(samples)
+        finally:
+            db.close()
+    registry.inc('ingest_samples_total', len(samples))
+
+def ingest_samples(samples, extra=None):
+    """Сохранение проверенных замеров (через очередь или сразу в БД)"""
+    body = {"status": "success"}
+    body.update(extra or {})
+    try:
+        submit_samples(samples)
+    except QueueFull:
+        response = jsonify({"status": "error", "message": "Ingest queue is full"})
+        response.headers['Retry-After'] = '1'
+        return response, 429
+    except Exception as e:
+        return jsonify({"status": "error", "message": str(e)}), 500
+    return jsonify(body)
+
+def ingest_frame_samples(raw_samples, client):
+    """Замеры кадра из ingest-listener: проверки и запись как у /api/update_load_batch.
+
+    Лимит на адрес (ingest_client) проверяет listener до расшифровки.
+    Ответа агенту нет, поэтому исход - исключение: RateLimited,
+    QueueFull или ValueError (пустой, слишком большой или битый пакет).
+    """
+    if not raw_samples:
+        raise ValueError('No samples provided')
+    if len(raw_samples) > app.config['INGEST_MAX_BATCH']:
+        raise ValueError('Batch is too large')
+
+    samples = []
+    for raw in raw_samples:
+        try:
+            samples.append(validate_sample(raw))
+        except ValueError:
+            continue
+    if len(samples) < len(raw_samples):
+        registry.inc('ingest_rejected_samples_total', len(raw_samples) - len(samples), reason='invalid')
+    if not samples:
+        raise ValueError('Invalid samples')
+
+    samples, retry_after = limit_ingest(samples)
+    if not samples:
+        raise RateLimited(retry_after)
+    submit_samples(samples)
 
 @app.route('/api/update_load', methods=['POST'])
 def update_load():
     """API для обновления нагрузки с автоматической чисткой старых данных"""
+    # Лимит проверяем до дешифрования - оно самое дорогое
+    try:
+        limiter.hit('ingest_client', request.remote_addr)
+    except RateLimited as e:
+        return rate_limited(e.retry_after)
+
     try:
         # Получаем и дешифруем данные
-        encrypted_data = request.json.get('data')
-        if not encrypted_data:
+        raw_samples = read_agent_samples()
+        if not raw_samples:
             return jsonify({"status": "error", "message": "No data provided"}), 400
-            
-        data = decrypt_data(encrypted_data)
-        
-        db = get_db()
+    except Exception:
+        registry.inc('ingest_decrypt_failures_total')
+        return jsonify({"status": "error", "message": "Decryption failed"}), 400
+    if len(raw_samples) > app.config['INGEST_MAX_BATCH']:
+        return jsonify({"status": "error", "message": "Batch is too large"}), 413
+
+    try:
+        samples = [validate_sample(raw) for raw in raw_samples]
+    except ValueError as e:
+        registry.inc('ingest_rejected_samples_total', len(raw_samples), reason='invalid')
+        return jsonify({"status": "error", "message": str(e)}), 400
+
+    return ingest_within_limit(samples)
+
+@app.route('/api/update_load_batch', methods=['POST'])
+def update_load_batch():
+    """API для пакетной загрузки замеров одного или нескольких серверов"""
+    try:
+        limiter.hit('ingest_client', request.remote_addr)
+    except RateLimited as e:
+        return rate_limited(e.retry_after)
+
+    try:
+        raw_samples = read_agent_samples()
+        if raw_samples is None:
+            return jsonify({"status": "error", "message": "No data provided"}), 400
+    except Exception:
+        registry.inc('ingest_decrypt_failures_total')
+        return jsonify({"status": "error", "message": "Decryption failed"}), 400
+
+    if not isinstance(raw_samples, list) or not raw_samples:
+        return jsonify({"status": "error", "message": "No samples provided"}), 400
+    if len(raw_samples) > app.config['INGEST_MAX_BATCH']:
+        return jsonify({"status": "error", "message": "Batch is too large"}), 413
+
+    # Битые замеры отбрасываем по одному, чтобы не блокировать весь пакет
+    samples = []
+    for raw in raw_samples:
         try:
-            # Обновляем текущую нагрузку
-            db.execute(
-                "UPDATE servers SET current_load = ? WHERE id = ?",
-                (data['load'], data['server_id'])
-            )
-            
-            # Добавляем новое значение в историю
-            db.execute(
-                """INSERT INTO server_load_history 
-                (server_id, load_value, timestamp) 
-                VALUES (?, ?, ?)""",
-                (data['server_id'], data['load'], data['timestamp'])
-            )
-            
-            # Чистим старые данные
-            db.execute("""
-                DELETE FROM server_load_history 
-                WHERE id NOT IN (
-                    SELECT id FROM server_load_history 
-                    WHERE server_id = ? 
-                    ORDER BY timestamp DESC 
-                    LIMIT 40
-                ) AND server_id = ?
-            """, (data['server_id'], data['server_id']))
-            
-            db.commit()
-            return jsonify({"status": "success"})
-        except Exception as e:
-            return jsonify({"status": "error", "message": str(e)}), 500
+            samples.append(validate_sample(raw))
+        except ValueError:
+            continue
+    if not samples:
+        registry.inc('ingest_rejected_samples_total', len(raw_samples), reason='invalid')
+        return jsonify({"status": "error", "message": "Invalid samples"}), 400
+
+    # Замеры серверов сверх лимита отбрасываем, остальные принимаем
+    valid_count = len(samples)
+    if valid_count < len(raw_samples):
+        registry.inc('ingest_rejected_samples_total', len(raw_samples) - valid_count, reason='invalid')
+    return ingest_within_limit(samples, rejected=len(raw_samples) - valid_count)
+
+@app.route('/api/stream')
+def stream():
+    """Server-Sent Events: новые замеры нагрузки по мере поступления"""
+    subscriber = broadcaster.subscribe()
+    if subscriber is None:
+        response = jsonify({"status": "error", "message": "Too many stream clients"})
+        response.headers['Retry-After'] = '30'
+        return response, 503
+
+    keepalive = app.config['STREAM_KEEPALIVE']
+
+    def generate():
+        try:
+            yield 'retry: 5000\n\n'
+            while True:
+                events = subscriber.get(timeout=keepalive)
+                if events is None:
+                    # Клиент не успевал читать - отключаем, браузер переподключится
+                    break
+                if not events:
+                    yield ': keepalive\n\n'
+                    continue
+                yield ''.join(f'data: {json.dumps(event)}\n\n' for event in events)
         finally:
-            db.close()
-    except Exception as e:
-        return jsonify({"status": "error", "message": "Decryption failed"}), 400
+            broadcaster.unsubscribe(subscriber)
+
+    return Response(generate(), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
+    })
 
 @app.route('/login', methods=['GET', 'POST'])
 def login():
@@ -265,35 +627,172 @@ def logout():
     flash('Вы вышли из системы', 'success')
     return redirect(url_for('index'))
 
+def iso_date(value):
+    """Дата ГГГГ-ММ-ДД из параметра запроса (ValueError - параметр игнорируется)"""
+    return date.fromisoformat(value.strip()).isoformat()
+
+def registration_filters(source=None):
+    """Фильтры таблицы заявок из параметров запроса (или формы)"""
+    source = request.args if source is None else source
+    return {
+        'server_id': source.get('server_id', type=int),
+        'nickname': source.get('nickname', '').strip() or None,
+        'ip': source.get('ip', '').strip() or None,
+        'date_from': source.get('date_from', type=iso_date),
+        'date_to': source.get('date_to', type=iso_date),
+    }
+
 @app.route('/admin')
 @login_required
 def admin():
+    filters = registration_filters()
     db = get_db()
-    servers = db.execute("SELECT * FROM servers").fetchall()
-    registrations = db.execute("""
-        SELECT r.id, r.nickname, r.request_ip, r.registration_date, 
-               s.ip_address, s.purpose 
-        FROM registrations r 
-        JOIN servers s ON r.server_id = s.id
-        ORDER BY r.registration_date DESC
-    """).fetchall()
-    db.close()
+    try:
+        servers = db.execute("SELECT * FROM servers").fetchall()
+        registrations, next_cursor = registrations_page(
+            db, app.config['ADMIN_PAGE_SIZE'], request.args.get('cursor'), **filters
+        )
+    except ValueError:
+        flash('Некорректная ссылка на страницу', 'danger')
+        return redirect(url_for('admin'))
+    finally:
+        db.close()
     
-    return render_template('admin.html', servers=servers, registrations=registrations)
+    return render_template('admin.html', servers=servers, registrations=registrations,
+                           next_cursor=next_cursor, filters=filters)
+
+@app.route('/admin/api/registrations')
+@login_required
+def api_registrations():
+    """Страница заявок в JSON (keyset-пагинация по cursor)"""
+    limit = min(request.args.get('limit', app.config['ADMIN_PAGE_SIZE'], type=int),
+                app.config['ADMIN_PAGE_SIZE_MAX'])
+    if limit <= 0:
+        return jsonify({"status": "error", "message": "Invalid limit"}), 400
+    db = get_db()
+    try:
+        rows, next_cursor = registrations_page(
+            db, limit, request.args.get('cursor'), **registration_filters()
+        )
+    except ValueError as e:
+        return jsonify({"status": "error", "message": str(e)}), 400
+    finally:
+        db.close()
+    return jsonify({"items": [dict(row) for row in rows], "next_cursor": next_cursor})
+
+@app.route('/admin/registrations.csv')
+@login_required
+def export_registrations():
+    """Выгрузка заявок (с учетом фильтров) в CSV потоком"""
+    filters = registration_filters()
+
+    def generate():
+        db = get_db()
+        try:
+            yield from export_registrations_csv(db, **filters)
+        finally:
+            db.close()
+
+    return Response(generate(), mimetype='text/csv', headers={
+        'Content-Disposition': 'attachment; filename=registrations.csv'
+    })
    
+@app.route('/admin/history/<int:server_id>.csv')
+@login_required
+def export_history(server_id):
+    """Выгрузка исходных замеров сервера из архива за ?from=&to= (epoch) потоком"""
+    if archive is None:
+        return jsonify({"status": "error", "message": "History archive is disabled"}), 404
+    try:
+        end = int(request.args.get('to', time.time()))
+        start = int(request.args.get('from', end - 24 * 3600))
+    except ValueError:
+        return jsonify({"status": "error", "message": "Invalid range"}), 400
+
+    def generate():
+        db = get_db()
+        try:
+            yield 'epoch,timestamp,load\n'
+            lines = []
+            # Блоки декодируются по мере выдачи - выгрузка за год не грузится в память
+            for epoch, load in archive.iter_range(db, server_id, start, end):
+                lines.append(f'{epoch},{wire.from_epoch(epoch)},{load}\n')
+                if len(lines) >= 1000:
+                    yield ''.join(lines)
+                    lines.clear()
+            yield ''.join(lines)
+        finally:
+            db.close()
+
+    return Response(generate(), mimetype='text/csv', headers={
+        'Content-Disposition': f'attachment; filename=server_{server_id}_history.csv'
+    })
+
+@app.route('/admin/analytics')
+@login_required
+def admin_analytics():
+    """Статистика нагрузки по всему парку серверов.
+
+    Считается по архиву за последние hours часов (ANALYTICS_WINDOW_HOURS).
+    Без архива (ARCHIVE_BLOCK_SECONDS = None) источник - таблица истории,
+    а в ней только последние HISTORY_WINDOW замеров каждого сервера.
+    """
+    try:
+        threshold = float(request.args.get('threshold', app.config['ANALYTICS_LOAD_THRESHOLD']))
+        hours = float(request.args.get('hours', app.config['ANALYTICS_WINDOW_HOURS']))
+    except ValueError:
+        return jsonify({"status": "error", "message": "Invalid threshold"}), 400
+    if not 0 < hours <= app.config['ARCHIVE_RETENTION_HOURS']:
+        return jsonify({"status": "error", "message": "Invalid hours"}), 400
+
+    def build():
+        db = get_db()
+        try:
+            if archive is not None:
+                end = time.time()
+                ids = [row[0] for row in db.execute("SELECT id FROM servers ORDER BY id")]
+                server_ids, epochs, loads = archive.arrays(db, ids, end - hours * 3600, end)
+            else:
+                server_ids, epochs, loads = history_store.arrays(db)
+        finally:
+            db.close()
+        stats = analytics.fleet_stats(
+            server_ids, epochs, loads,
+            threshold=threshold,
+            alpha=app.config['ANALYTICS_EWMA_ALPHA'],
+            z_threshold=app.config['ANALYTICS_Z_THRESHOLD']
+        )
+        return {
+            'threshold': threshold,
+            'source': 'archive' if archive is not None else 'history',
+            'hours': hours if archive is not None else None,
+            'servers': stats,
+            'anomalies': [server_id for server_id, row in stats.items() if row['anomaly']]
+        }
+
+    # Кэш только для стандартных окон и порога: произвольные значения из
+    # строки запроса копили бы в кэше по расчету на каждую комбинацию
+    if threshold != app.config['ANALYTICS_LOAD_THRESHOLD'] or hours not in app.config['ANALYTICS_CACHED_WINDOWS']:
+        return jsonify(build())
+    # Пересчитываем только после очередной записи замеров (смены версии снимка)
+    return jsonify(snapshot.cached(('analytics', hours), build))
+
 @app.route('/admin/update_load', methods=['POST'])
 @login_required
 def update_server_load():  # Переименовал для соответствия
     db = get_db()
     try:
-        server_id = request.form['server_id']
+        server_id = int(request.form['server_id'])
         load_value = int(request.form['load_value'])
         
         db.execute(
             "UPDATE servers SET current_load = ? WHERE id = ?",
             (load_value, server_id)
         )
+        bump_generation(db, 'servers')
         db.commit()
+        snapshot.set_load(server_id, load_value)
+        placement.set_load(server_id, load_value)
         flash('Нагрузка сервера обновлена', 'success')
     except (ValueError, KeyError):
         flash('Некорректные данные', 'danger')
@@ -330,11 +829,11 @@ def delete_server(server_id):
             flash('Нельзя удалить сервер с активными регистрациями', 'danger')
             return redirect(url_for('admin'))
         
-        # Удаляем историю нагрузки
-        db.execute(
-            "DELETE FROM server_load_history WHERE server_id = ?",
-            (server_id,)
-        )
+        # Удаляем историю нагрузки, агрегаты и метрики
+        history_store.delete_server(db, server_id)
+        if archive is not None:
+            archive.delete_servers(db, [server_id])
+        retention.delete_servers(db, [server_id])
         
         # Удаляем сам сервер
         db.execute(
@@ -342,7 +841,11 @@ def delete_server(server_id):
             (server_id,)
         )
         
+        bump_generation(db, 'servers')
         db.commit()
+        snapshot.remove_server(server_id)
+        placement.remove_server(server_id)
+        watchdog.forget(server_id)
         flash('Сервер успешно удален', 'success')
     except sqlite3.Error as e:
         db.rollback()
@@ -359,18 +862,29 @@ def add_server():
     ip = request.form.get('ip_address', '').strip()
     purpose = request.form.get('purpose', '').strip()
     is_available = request.form.get('is_available') == 'on'
+    capacity = request.form.get('capacity', '').strip()
     
     if not ip or not purpose:
         flash('Заполните все обязательные поля', 'danger')
         return redirect(url_for('admin'))
+    if capacity and (not capacity.isdigit() or int(capacity) <= 0):
+        flash('Вместимость должна быть положительным числом', 'danger')
+        return redirect(url_for('admin'))
     
     try:
         db = get_db()
-        db.execute(
-            "INSERT INTO servers (ip_address, purpose, is_available) VALUES (?, ?, ?)",
-            (ip, purpose, is_available)
+        cur = db.execute(
+            "INSERT INTO servers (ip_address, purpose, is_available, capacity) VALUES (?, ?, ?, ?)",
+            (ip, purpose, is_available, int(capacity) if capacity else None)
         )
+        bump_generation(db, 'servers')
         db.commit()
+        server = db.execute(
+            "SELECT * FROM servers WHERE id = ?", (cur.lastrowid,)
+        ).fetchone()
+        snapshot.add_server(server)
+        placement.add_server(dict(server))
+        watchdog.track(server['id'])
         flash('Сервер успешно добавлен', 'success')
     except sqlite3.IntegrityError:
         flash('Сервер с таким IP уже существует', 'danger')
@@ -383,34 +897,181 @@ def add_server():
 
 @app.route('/')
 def index():
-    db = get_db()
-    try:
-        servers = db.execute("SELECT * FROM servers").fetchall()
-        return render_template('index.html', servers=servers)
-    finally:
-        db.close()
+    # Страница зависит только от снимка и признака администратора в меню
+    is_admin = bool(session.get('is_admin'))
+    entry = snapshot.cached(
+        ('index', is_admin),
+        lambda: CachedBody(render_template('index.html', servers=snapshot.servers()),
+                           'text/html', snapshot.last_modified())
+    )
+    response = send_cached(entry)
+    response.vary.add('Cookie')
+    return response
+
 @app.route('/about')
 def about():
     return render_template('about.html')
 
 @app.route('/get_chart_data/<int:server_id>')
 def get_chart_data(server_id):
-    db = get_db()
+    # Диапазон и разрешение заданы - отдаем агрегаты
+    if 'from' in request.args or 'resolution' in request.args:
+        return get_chart_rollups(server_id)
+
+    def build():
+        # Замеры за последние сутки (тот же формат сравнения, что и в SQL)
+        since = (datetime.utcnow() - timedelta(days=1)).strftime('%Y-%m-%d %H:%M:%S')
+        history = [(ts, load) for ts, load in snapshot.history(server_id) if ts >= since]
+        return CachedBody(json.dumps({
+            'labels': [ts[11:16] for ts, _ in history],
+            'data': [load for _, load in history]
+        }), 'application/json', snapshot.last_modified(server_id))
+
+    # Опрос без новых замеров получает 304 без тела
+    return send_cached(snapshot.cached(('chart', server_id), build, server_id=server_id))
+
+def parse_server_ids(value):
+    """Список id из параметра вида 1,2,3 (пустой - все серверы)"""
+    return [int(part) for part in value.split(',') if part.strip()] if value else None
+
+@app.route('/api/history')
+def fleet_history():
+    """Недавняя история нескольких (или всех) серверов в колонках.
+
+    ?servers=1,2,3 - только эти серверы; ?since=<cursor> - только замеры,
+    записанные после курсора из прошлого ответа. Без since отдаются
+    последние замеры из снимка. Время - целые epoch-секунды (UTC).
+    """
     try:
-        history = db.execute("""
-            SELECT load_value, strftime('%H:%M', timestamp) as time
-            FROM server_load_history
-            WHERE server_id = ? AND timestamp >= datetime('now', '-1 day')
-            ORDER BY timestamp
-        """, (server_id,)).fetchall()
-        
-        chart_data = {
-            'labels': [row['time'] for row in history],
-            'data': [row['load_value'] for row in history]
+        server_ids = parse_server_ids(request.args.get('servers'))
+        limit = min(request.args.get('limit', app.config['HISTORY_API_LIMIT'], type=int),
+                    app.config['HISTORY_API_LIMIT'])
+        cursor = load_cursor(request.args['since']) if request.args.get('since') else None
+        if limit <= 0 or (server_ids and len(server_ids) > 500):
+            raise ValueError
+        # Позицию берем до чтения снимка: замер между ними придет повторно, но не потеряется
+        db = get_db()
+        try:
+            series, position, more = history_store.since(db, cursor, server_ids, limit)
+        finally:
+            db.close()
+    except ValueError:
+        return jsonify({"status": "error", "message": "Invalid servers, limit or since"}), 400
+
+    if cursor is None:
+        since = (datetime.utcnow() - timedelta(days=1)).strftime('%Y-%m-%d %H:%M:%S')
+        wanted = set(server_ids) if server_ids else None
+        for server in snapshot.servers():
+            if wanted is None or server['id'] in wanted:
+                history = [(ts, load) for ts, load in snapshot.history(server['id']) if ts >= since]
+                series[server['id']] = ([wire.to_epoch(ts) for ts, _ in history],
+                                        [load for _, load in history])
+
+    return jsonify({
+        'cursor': dump_cursor(position),
+        'more': more,
+        'servers': {
+            str(server_id): {'t': [int(epoch) for epoch in epochs], 'load': loads}
+            for server_id, (epochs, loads) in series.items()
         }
-        return json.dumps(chart_data)
+    })
+
+def get_chart_rollups(server_id):
+    """График по агрегатам: ?from=&to= (epoch), resolution=auto|raw|1m|15m|1h, points="""
+    tiers = app.config['ROLLUP_TIERS']
+    now = int(time.time())
+    try:
+        end = int(request.args.get('to', now))
+        start = int(request.args.get('from', end - 24 * 3600))
+        max_points = int(request.args.get('points', app.config['CHART_MAX_POINTS']))
+    except ValueError:
+        return jsonify({"status": "error", "message": "Invalid range"}), 400
+    if start >= end or not 0 < max_points <= app.config['CHART_POINTS_LIMIT']:
+        return jsonify({"status": "error", "message": "Invalid range"}), 400
+
+    requested = request.args.get('resolution', 'auto')
+    if requested == 'raw':
+        # Сырые замеры - только в пределах бюджета точек, длинные диапазоны - через агрегаты
+        if (end - start) / app.config['RAW_SAMPLE_INTERVAL'] > max_points:
+            return jsonify({"status": "error", "message": "Range is too long for raw resolution"}), 400
+        return get_chart_raw(server_id, start, end)
+    by_name = {name: resolution for resolution, name in rollups.RESOLUTION_NAMES.items()}
+    if requested == 'auto':
+        resolution = rollups.choose_resolution(start, end, max_points, tiers, now)
+    elif requested in by_name and by_name[requested] in dict(tiers):
+        resolution = by_name[requested]
+    else:
+        return jsonify({"status": "error", "message": "Unknown resolution"}), 400
+
+    db = get_db()
+    try:
+        rows = rollups.query_rollups(db, server_id, start, end, resolution)
+    finally:
+        db.close()
+
+    label_format = '%H:%M' if end - start <= 24 * 3600 else '%d.%m %H:%M'
+    return jsonify({
+        'resolution': rollups.RESOLUTION_NAMES.get(resolution, str(resolution)),
+        'labels': [
+            datetime.utcfromtimestamp(row['bucket']).strftime(label_format) for row in rows
+        ],
+        'timestamps': [row['bucket'] for row in rows],
+        'data': [round(row['avg_load'], 1) for row in rows],
+        'min': [row['min_load'] for row in rows],
+        'max': [row['max_load'] for row in rows],
+        'count': [row['count'] for row in rows]
+    })
+
+def get_chart_raw(server_id, start, end):
+    """Исходные замеры без агрегации: из архива блоков, а без него - из истории"""
+    db = get_db()
+    try:
+        epochs, loads = archive.range(db, server_id, start, end) if archive else ((), ())
+        if not len(epochs):
+            epochs, loads = history_store.range(db, server_id, start, end)
+    finally:
+        db.close()
+
+    label_format = '%H:%M' if end - start <= 24 * 3600 else '%d.%m %H:%M'
+    return jsonify({
+        'resolution': 'raw',
+        'labels': [datetime.utcfromtimestamp(epoch).strftime(label_format) for epoch in epochs.tolist()],
+        'timestamps': epochs.tolist(),
+        'data': loads.tolist()
+    })
+
+@app.route('/get_metrics/<int:server_id>')
+def get_metrics(server_id):
+    """Последние известные значения дополнительных метрик сервера"""
+    db = get_db()
+    try:
+        rows = db.execute(
+            "SELECT metric, value, timestamp FROM server_metrics_latest WHERE server_id = ?",
+            (server_id,)
+        ).fetchall()
     finally:
         db.close()
+    return jsonify({
+        row['metric']: {'value': row['value'], 'timestamp': row['timestamp']} for row in rows
+    })
+
+# Попыток автоматического размещения, если выбранный сервер уже заполнен
+PLACEMENT_ATTEMPTS = 3
+
+def insert_registration(db, ip, nickname, server_id):
+    """Заявка на сервер, если он доступен и не заполнен; id заявки или None.
+
+    Проверка и вставка - одна инструкция SQL под блокировкой записи,
+    поэтому два процесса не займут последнее место одновременно.
+    """
+    cur = db.execute("""
+        INSERT INTO registrations (request_ip, nickname, server_id)
+        SELECT ?, ?, id FROM servers
+        WHERE id = ? AND is_available = 1 AND is_stale = 0
+          AND (capacity IS NULL
+               OR capacity > (SELECT COUNT(*) FROM registrations WHERE server_id = servers.id))
+    """, (ip, nickname, server_id))
+    return cur.lastrowid if cur.rowcount else None
 
 @app.route('/register', methods=['GET', 'POST'])
 def register():
@@ -424,64 +1085,69 @@ def register():
             flash('Заполните все поля', 'danger')
             return redirect(url_for('register'))
             
+        reserved_id = None
         try:
             db = get_db()
-            now = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-            
-            # Проверка лимитов
-            limit = db.execute(
-                """SELECT request_count, 
-                          julianday('now') - julianday(first_request_time) as days_passed
-                   FROM registration_limits 
-                   WHERE ip_address = ?""",
-                (ip,)
-            ).fetchone()
-            
-            if limit:
-                if limit['days_passed'] < 1 and \
-                   limit['request_count'] >= app.config['REGISTRATION_LIMITS']['MAX_REQUESTS_PER_DAY']:
-                    flash('Превышен лимит заявок за сутки', 'danger')
-                    return redirect(url_for('register'))
-                
-                # Обновляем счетчик
-                db.execute(
-                    """UPDATE registration_limits 
-                    SET request_count = request_count + 1, 
-                        last_request_time = ? 
-                    WHERE ip_address = ?""",
-                    (now, ip)
-                )
-            else:
-                # Новая запись
-                db.execute(
-                    """INSERT INTO registration_limits 
-                    (ip_address, first_request_time, last_request_time) 
-                    VALUES (?, ?, ?)""",
-                    (ip, now, now)
-                )
             
             # Проверка ника
             if len(nickname) < 3 or len(nickname) > 80:
                 flash('Никнейм должен быть от 3 до 80 символов', 'danger')
                 return redirect(url_for('register'))
-            
-            # Проверка сервера
-            server = db.execute(
-                "SELECT id FROM servers WHERE id = ? AND is_available = 1",
-                (server_id,)
-            ).fetchone()
-            
-            if not server:
-                flash('Выбранный сервер недоступен', 'danger')
+
+            # Проверка лимитов; заявка учитывается только после успешной вставки
+            try:
+                limiter.check('register', ip)
+            except RateLimited as e:
+                flash(f'Превышен лимит заявок, повторите через {e.retry_after} сек.', 'danger')
                 return redirect(url_for('register'))
             
-            # Создаем заявку
-            db.execute(
-                "INSERT INTO registrations (request_ip, nickname, server_id) VALUES (?, ?, ?)",
-                (ip, nickname, server_id)
-            )
-            
+            if server_id == 'auto':
+                # Автоматический выбор наименее загруженного сервера; место
+                # перепроверяет вставка - другой процесс мог занять его раньше
+                purpose = request.form.get('purpose', '').strip()
+                registration_id = None
+                for _ in range(PLACEMENT_ATTEMPTS):
+                    reserved_id = placement.place(purpose)
+                    if reserved_id is None:
+                        break
+                    registration_id = insert_registration(db, ip, nickname, reserved_id)
+                    if registration_id is not None:
+                        break
+                    placement.reject(reserved_id)
+                    reserved_id = None
+                if registration_id is None:
+                    flash('Нет доступных серверов с таким назначением', 'danger')
+                    return redirect(url_for('register'))
+            else:
+                # Проверка сервера
+                try:
+                    reserved_id = int(server_id)
+                except ValueError:
+                    reserved_id = None
+                if reserved_id is None or not placement.reserve(reserved_id):
+                    reserved_id = None
+                    flash('Выбранный сервер недоступен', 'danger')
+                    return redirect(url_for('register'))
+                registration_id = insert_registration(db, ip, nickname, reserved_id)
+                if registration_id is None:
+                    placement.reject(reserved_id)
+                    reserved_id = None
+                    flash('Выбранный сервер недоступен', 'danger')
+                    return redirect(url_for('register'))
+
+            # Учет лимита - до commit: параллельная заявка с того же IP могла успеть раньше
+            try:
+                limiter.hit('register', ip)
+            except RateLimited as e:
+                db.rollback()
+                flash(f'Превышен лимит заявок, повторите через {e.retry_after} сек.', 'danger')
+                return redirect(url_for('register'))
+
+            # До commit: иначе ChangeFeed этого процесса может учесть заявку второй раз.
+            # Остальные процессы получат ее приращением, без перечитывания индекса
+            placement.confirm(registration_id)
             db.commit()
+            reserved_id = None
             flash('Заявка успешно отправлена!', 'success')
             return redirect(url_for('register'))
             
@@ -493,21 +1159,20 @@ def register():
             flash('Неожиданная ошибка', 'danger')
             app.logger.error(f"Unexpected error: {str(e)}", exc_info=True)
         finally:
+            # Заявка не сохранилась - возвращаем зарезервированное место
+            if reserved_id is not None:
+                placement.release(reserved_id)
             if db:
                 db.close()
     
     # GET запрос
     try:
-        db = get_db()
-        servers = db.execute("SELECT * FROM servers WHERE is_available = 1").fetchall()
-        return render_template('register.html', servers=servers)
+        servers = snapshot.servers(available_only=True)
+        return render_template('register.html', servers=servers, purposes=placement.purposes())
     except Exception as e:
         flash('Ошибка загрузки списка серверов', 'danger')
         app.logger.error(f"Server list error: {str(e)}", exc_info=True)
         return redirect(url_for('index'))
-    finally:
-        if db:
-            db.close()
 
 @app.route('/admin/toggle_server/<int:server_id>', methods=['POST'])
 @login_required
@@ -525,7 +1190,10 @@ def toggle_server(server_id):
                 "UPDATE servers SET is_available = ? WHERE id = ?",
                 (new_status, server_id)
             )
+            bump_generation(db, 'servers')
             db.commit()
+            snapshot.set_available(server_id, int(new_status))
+            placement.set_available(server_id, new_status)
             flash('Статус сервера обновлен', 'success')
     except sqlite3.Error as e:
         flash('Ошибка при изменении статуса сервера', 'error')
@@ -534,13 +1202,241 @@ def toggle_server(server_id):
         db.close()
     return redirect(url_for('admin'))
 
+def bulk_import_servers(rows):
+    """Добавление серверов из импорта одной транзакцией"""
+    db = get_db()
+    try:
+        created, errors = bulk.import_servers(db, rows)
+        if created:
+            bump_generation(db, 'servers')
+        db.commit()
+    finally:
+        db.close()
+    for server in created:
+        snapshot.add_server(server)
+        placement.add_server(dict(server))
+        watchdog.track(server['id'])
+    return {'created': [dict(server) for server in created], 'errors': errors}
+
+def bulk_set_available(server_ids, is_available=None):
+    """Включение/отключение серверов одной транзакцией (None - инвертировать)"""
+    db = get_db()
+    try:
+        changes = bulk.set_servers_available(db, server_ids, is_available)
+        if changes:
+            bump_generation(db, 'servers')
+        db.commit()
+    finally:
+        db.close()
+    for server_id, available in changes:
+        snapshot.set_available(server_id, int(available))
+        placement.set_available(server_id, available)
+    return {'servers': [{'id': server_id, 'is_available': available} for server_id, available in changes]}
+
+def bulk_delete_servers(server_ids):
+    """Удаление серверов без заявок одной транзакцией"""
+    db = get_db()
+    try:
+        deleted, errors = bulk.delete_servers(db, server_ids, history_store)
+        if archive is not None:
+            archive.delete_servers(db, deleted)
+        retention.delete_servers(db, deleted)
+        if deleted:
+            bump_generation(db, 'servers')
+        db.commit()
+    finally:
+        db.close()
+    for server_id in deleted:
+        snapshot.remove_server(server_id)
+        placement.remove_server(server_id)
+        watchdog.forget(server_id)
+    return {'deleted': deleted, 'errors': errors}
+
+def bulk_delete_registrations(ids=None, **filters):
+    """Удаление заявок по id и/или фильтрам одной транзакцией"""
+    db = get_db()
+    try:
+        counts = delete_registrations(db, ids, **filters)
+        if counts:
+            bump_generation(db, 'registrations')
+        db.commit()
+    finally:
+        db.close()
+    for server_id, count in counts.items():
+        placement.release(server_id, count)
+    return {'deleted': sum(counts.values())}
+
+@app.route('/admin/import_servers', methods=['POST'])
+@login_required
+def import_servers():
+    upload = request.files.get('file')
+    if not upload or not upload.filename:
+        flash('Выберите файл CSV или JSON', 'danger')
+        return redirect(url_for('admin'))
+    try:
+        result = bulk_import_servers(bulk.parse_import(upload.read(), upload.filename))
+    except ValueError as e:
+        flash(str(e), 'danger')
+        return redirect(url_for('admin'))
+    except sqlite3.Error as e:
+        flash(f'Ошибка при импорте серверов: {str(e)}', 'danger')
+        return redirect(url_for('admin'))
+
+    flash(f"Добавлено серверов: {len(result['created'])}", 'success' if result['created'] else 'warning')
+    for error in result['errors'][:10]:
+        flash(f"Строка {error['row']}: {error['error']}", 'danger')
+    if len(result['errors']) > 10:
+        flash(f"...и еще ошибок: {len(result['errors']) - 10}", 'danger')
+    return redirect(url_for('admin'))
+
+@app.route('/admin/bulk_servers', methods=['POST'])
+@login_required
+def bulk_servers():
+    server_ids = request.form.getlist('server_ids', type=int)
+    action = request.form.get('action')
+    if not server_ids:
+        flash('Не выбран ни один сервер', 'danger')
+        return redirect(url_for('admin'))
+    try:
+        if action == 'delete':
+            result = bulk_delete_servers(server_ids)
+            flash(f"Удалено серверов: {len(result['deleted'])}", 'success')
+            for error in result['errors']:
+                flash(f"Сервер {error['id']}: {error['error']}", 'danger')
+        elif action in ('enable', 'disable'):
+            result = bulk_set_available(server_ids, action == 'enable')
+            flash(f"Статус обновлен у серверов: {len(result['servers'])}", 'success')
+        else:
+            flash('Неизвестное действие', 'danger')
+    except sqlite3.Error as e:
+        flash('Ошибка базы данных', 'danger')
+        print(f"Database error: {e}")
+    return redirect(url_for('admin'))
+
+@app.route('/admin/delete_registrations', methods=['POST'])
+@login_required
+def delete_registrations_by_filter():
+    filters = registration_filters(request.form)
+    try:
+        result = bulk_delete_registrations(**filters)
+        flash(f"Удалено заявок: {result['deleted']}", 'success')
+    except ValueError:
+        flash('Задайте хотя бы один фильтр заявок', 'danger')
+    except sqlite3.Error as e:
+        flash('Ошибка при удалении заявок', 'error')
+        print(f"Database error: {e}")
+    return redirect(url_for('admin', **{key: value for key, value in filters.items() if value is not None}))
+
+def json_body():
+    """Тело JSON-запроса админского API (объект или массив)"""
+    data = request.get_json(silent=True)
+    if data is None:
+        raise ValueError('Expected JSON body')
+    return data
+
+def json_ids(data):
+    ids = data.get('ids') if isinstance(data, dict) else None
+    if not isinstance(ids, list) or not ids or not all(isinstance(i, int) for i in ids):
+        raise ValueError('ids must be a non-empty list of integers')
+    return ids
+
+def api_error(message, status=400):
+    return jsonify({"status": "error", "message": message}), status
+
+@app.route('/admin/api/servers', methods=['POST'])
+@login_required
+def api_import_servers():
+    """Добавление серверов: JSON-массив, {"servers": [...]} или файл CSV/JSON"""
+    try:
+        upload = request.files.get('file')
+        if upload:
+            rows = bulk.parse_import(upload.read(), upload.filename or '')
+        else:
+            data = json_body()
+            rows = data.get('servers') if isinstance(data, dict) else data
+            if not isinstance(rows, list) or not all(isinstance(row, dict) for row in rows):
+                raise ValueError('Expected a list of server objects')
+        return jsonify(bulk_import_servers(rows))
+    except ValueError as e:
+        return api_error(str(e))
+
+@app.route('/admin/api/servers/availability', methods=['POST'])
+@login_required
+def api_set_available():
+    """{"ids": [...], "is_available": true|false|null (инвертировать)}"""
+    try:
+        data = json_body()
+        ids = json_ids(data)
+        is_available = data.get('is_available')
+        if is_available is not None and not isinstance(is_available, bool):
+            raise ValueError('is_available must be true, false or null')
+    except ValueError as e:
+        return api_error(str(e))
+    return jsonify(bulk_set_available(ids, is_available))
+
+@app.route('/admin/api/servers/load', methods=['POST'])
+@login_required
+def api_set_load():
+    """{"loads": {"<server_id>": load, ...}}"""
+    try:
+        loads = json_body().get('loads')
+        loads = {int(server_id): int(load) for server_id, load in loads.items()}
+    except (ValueError, TypeError, AttributeError):
+        return api_error('loads must be an object {server_id: load}')
+    db = get_db()
+    try:
+        cur = db.executemany(
+            "UPDATE servers SET current_load = ? WHERE id = ?",
+            [(load, server_id) for server_id, load in loads.items()]
+        )
+        bump_generation(db, 'servers')
+        db.commit()
+    finally:
+        db.close()
+    for server_id, load in loads.items():
+        snapshot.set_load(server_id, load)
+        placement.set_load(server_id, load)
+    return jsonify({'updated': cur.rowcount})
+
+@app.route('/admin/api/servers/delete', methods=['POST'])
+@login_required
+def api_delete_servers():
+    """{"ids": [...]}; серверы с заявками не удаляются и попадают в errors"""
+    try:
+        ids = json_ids(json_body())
+    except ValueError as e:
+        return api_error(str(e))
+    return jsonify(bulk_delete_servers(ids))
+
+@app.route('/admin/api/registrations/delete', methods=['POST'])
+@login_required
+def api_delete_registrations():
+    """{"ids": [...]} и/или фильтры как у /admin/api/registrations"""
+    try:
+        data = json_body()
+        if not isinstance(data, dict):
+            raise ValueError('Expected a JSON object')
+        ids = json_ids(data) if 'ids' in data else None
+        filters = registration_filters(MultiDict({
+            key: str(value) for key, value in data.items() if key != 'ids' and value is not None
+        }))
+        return jsonify(bulk_delete_registrations(ids, **filters))
+    except ValueError as e:
+        return api_error(str(e))
+
 @app.route('/admin/delete_registration/<int:reg_id>', methods=['POST'])
 @login_required
 def delete_registration(reg_id):
     db = get_db()
     try:
+        registration = db.execute(
+            "SELECT server_id FROM registrations WHERE id = ?", (reg_id,)
+        ).fetchone()
         db.execute("DELETE FROM registrations WHERE id = ?", (reg_id,))
+        bump_generation(db, 'registrations')
         db.commit()
+        if registration:
+            placement.release(registration['server_id'])
         flash('Заявка успешно удалена', 'success')
     except sqlite3.Error as e:
         flash('Ошибка при удалении заявки', 'error')
@@ -553,10 +1449,7 @@ def delete_registration(reg_id):
 
 
 if __name__ == '__main__':
-    os.makedirs(os.path.dirname(app.config['DATABASE_PATH']), exist_ok=True)
-    if not check_db_exists():
-        print("Инициализация новой БД...")
-        init_db()
-    Thread(target=reset_limits_task, daemon=True).start()
-    Thread(target=background_updater, daemon=True).start()
-    app.run(host='0.0.0.0',debug=False,port=app.config["PORT"])
\ No newline at end of file
+    create_app()
+    # SIGTERM -> штатный выход, чтобы очередь успела сброситься в БД
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    app.run(host='0.0.0.0',debug=False,port=app.config["PORT"])
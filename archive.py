@@ -0,0 +1,203 @@
+import time
+
+import numpy as np
+
+from instrumentation import registry
+
+
+def _empty_state(block_start):
+    # Отсчет от секунды перед началом блока, чтобы замер ровно в block_start был "новее"
+    return block_start - 1, 0, 0
+
+
+def _zigzag(value):
+    # Знаковое в беззнаковое: 0, -1, 1, -2 ... -> 0, 1, 2, 3 ...
+    return (value << 1) ^ (value >> 63)
+
+
+def _put_varint(out, value):
+    while value >= 0x80:
+        out.append(value & 0x7f | 0x80)
+        value >>= 7
+    out.append(value)
+
+
+def encode_points(points, state):
+    """Дописывание точек [(epoch, load), ...] к блоку.
+
+    state - (last_epoch, last_delta, last_load) после последней точки
+    блока. Каждая точка - пара varint: delta-of-delta времени и delta
+    нагрузки в zigzag; при ровном интервале агента это 2 байта на замер.
+    Возвращает (байты, новое состояние).
+    """
+    last_epoch, last_delta, last_load = state
+    out = bytearray()
+    for epoch, load in points:
+        delta = epoch - last_epoch
+        _put_varint(out, _zigzag(delta - last_delta))
+        _put_varint(out, _zigzag(load - last_load))
+        last_epoch, last_delta, last_load = epoch, delta, load
+    return bytes(out), (last_epoch, last_delta, last_load)
+
+
+def iter_block(block_start, data):
+    """Потоковое декодирование блока: (epoch, load) по одной точке"""
+    epoch, delta, load = _empty_state(block_start)
+    value = shift = 0
+    first = True
+    for byte in data:
+        value |= (byte & 0x7f) << shift
+        if byte & 0x80:
+            shift += 7
+            continue
+        value = (value >> 1) ^ -(value & 1)
+        if first:
+            delta += value
+            epoch += delta
+        else:
+            load += value
+            yield epoch, load
+        first = not first
+        value = shift = 0
+
+
+def _varints(raw):
+    """Все varint из массива байт - векторно, без цикла по байтам"""
+    ends = np.flatnonzero(raw < 0x80)
+    if len(ends) == len(raw):
+        return raw.astype(np.int64)
+    starts = np.concatenate(([0], ends[:-1] + 1))
+    group = np.repeat(np.arange(len(ends)), ends - starts + 1)
+    shifts = (np.arange(len(raw)) - starts[group]) * 7
+    # Биты частей не пересекаются, поэтому сумма == побитовое ИЛИ
+    return np.add.reduceat((raw & 0x7f).astype(np.int64) << shifts, starts)
+
+
+def decode_block(block_start, data):
+    """Блок целиком в массивы (epochs, loads)"""
+    values = _varints(np.frombuffer(data, dtype=np.uint8))
+    values = (values >> 1) ^ -(values & 1)
+    epochs = _empty_state(block_start)[0] + np.cumsum(np.cumsum(values[0::2]))
+    loads = np.cumsum(values[1::2])
+    return epochs, loads
+
+
+class BlockArchive:
+    """Долгое хранение истории нагрузки сжатыми блоками (Gorilla-подобно).
+
+    Замеры сервера за block_seconds (по умолчанию час) лежат в одной
+    строке server_load_blocks как BLOB из пар varint (delta-of-delta
+    времени, delta нагрузки). Блок пишется дописыванием при приеме
+    замеров, в той же транзакции, что и основная история; закончившийся
+    час больше не меняется. Время хранится с точностью до секунды.
+    Блок - только дописывание, поэтому замер не новее последнего в
+    своем блоке отбрасывается.
+    """
+
+    def __init__(self, block_seconds=3600):
+        self.block_seconds = block_seconds
+
+    def append(self, db, samples):
+        """Дописывание пачки замеров (в транзакции вызывающего)"""
+        blocks = {}
+        for s in samples:
+            epoch = int(s['epoch'])
+            key = (s['server_id'], epoch - epoch % self.block_seconds)
+            blocks.setdefault(key, []).append((epoch, int(s['load'])))
+        if not blocks:
+            return
+
+        states = {}
+        keys = list(blocks)
+        for start in range(0, len(keys), 250):
+            chunk = keys[start:start + 250]
+            states.update(
+                ((row[0], row[1]), tuple(row[2:]))
+                for row in db.execute(f"""
+                    SELECT server_id, block_start, last_epoch, last_delta, last_load
+                    FROM server_load_blocks
+                    WHERE (server_id, block_start) IN (VALUES {','.join(['(?, ?)'] * len(chunk))})
+                """, [value for key in chunk for value in key])
+            )
+
+        rows, dropped = [], 0
+        for (server_id, block_start), points in blocks.items():
+            points.sort()
+            state = states.get((server_id, block_start)) or _empty_state(block_start)
+            fresh = []
+            for point in points:
+                if point[0] > (fresh[-1][0] if fresh else state[0]):
+                    fresh.append(point)
+            dropped += len(points) - len(fresh)
+            if not fresh:
+                continue
+            data, (last_epoch, last_delta, last_load) = encode_points(fresh, state)
+            rows.append((server_id, block_start, len(fresh), last_epoch, last_delta, last_load, data))
+        if dropped:
+            registry.inc('history_archive_dropped_total', dropped)
+
+        # || дает TEXT, CAST возвращает байты без изменений обратно в BLOB
+        db.executemany("""
+            INSERT INTO server_load_blocks
+            (server_id, block_start, count, last_epoch, last_delta, last_load, data)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT (server_id, block_start) DO UPDATE SET
+                count = count + excluded.count,
+                last_epoch = excluded.last_epoch,
+                last_delta = excluded.last_delta,
+                last_load = excluded.last_load,
+                data = CAST(data || excluded.data AS BLOB)
+        """, rows)
+
+    def _blocks(self, db, server_id, start, end):
+        return db.execute("""
+            SELECT block_start, data FROM server_load_blocks
+            WHERE server_id = ? AND block_start > ? AND block_start < ?
+            ORDER BY block_start
+        """, (server_id, start - self.block_seconds, end))
+
+    def iter_range(self, db, server_id, start, end):
+        """Замеры сервера в [start, end) по одному - для потоковой выгрузки"""
+        for block_start, data in self._blocks(db, server_id, start, end):
+            for epoch, load in iter_block(block_start, data):
+                if start <= epoch < end:
+                    yield epoch, load
+
+    def range(self, db, server_id, start, end):
+        """Замеры сервера в [start, end) как массивы (epochs, loads)"""
+        epochs, loads = [], []
+        for block_start, data in self._blocks(db, server_id, start, end):
+            block_epochs, block_loads = decode_block(block_start, data)
+            epochs.append(block_epochs)
+            loads.append(block_loads)
+        if not epochs:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+        epochs, loads = np.concatenate(epochs), np.concatenate(loads)
+        mask = (epochs >= start) & (epochs < end)
+        return epochs[mask], loads[mask]
+
+    def arrays(self, db, server_ids, start, end):
+        """Замеры серверов в [start, end) массивами (server_id, epoch, load) по серверам и времени"""
+        ids, epochs, loads = [], [], []
+        # По серверу за раз - чтение идет по первичному ключу, а не по всей таблице
+        for server_id in server_ids:
+            server_epochs, server_loads = self.range(db, server_id, start, end)
+            if len(server_epochs):
+                ids.append(np.full(len(server_epochs), server_id, dtype=np.int64))
+                epochs.append(server_epochs)
+                loads.append(server_loads)
+        if not ids:
+            return np.empty(0, dtype=np.int64), np.empty(0), np.empty(0)
+        return (np.concatenate(ids), np.concatenate(epochs).astype(np.float64),
+                np.concatenate(loads).astype(np.float64))
+
+    def purge(self, db, retention_hours):
+        """Удаление блоков, целиком вышедших за срок хранения"""
+        cutoff = int(time.time() - retention_hours * 3600) - self.block_seconds
+        cur = db.execute("DELETE FROM server_load_blocks WHERE block_start < ?", (cutoff,))
+        db.commit()
+        return cur.rowcount
+
+    def delete_servers(self, db, server_ids):
+        db.executemany("DELETE FROM server_load_blocks WHERE server_id = ?",
+                       [(server_id,) for server_id in server_ids])
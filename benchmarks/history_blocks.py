@@ -0,0 +1,127 @@
+"""Размер и скорость чтения истории: таблица server_load_history против сжатых блоков.
+
+Генерирует замеры --servers серверов за --hours часов с интервалом
+--interval секунд (случайное блуждание нагрузки, редкие сбои интервала),
+пишет их в обе схемы в отдельные временные БД и сравнивает размер файла
+после VACUUM (байт на замер) и скорость чтения всей истории сервера.
+
+Запуск из корня репозитория:
+    python benchmarks/history_blocks.py [--servers 20 --hours 24 --interval 5]
+"""
+import argparse
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import database  # noqa: E402
+from archive import BlockArchive  # noqa: E402
+from history import SQLiteHistory  # noqa: E402
+from wire import from_epoch  # noqa: E402
+
+# Схема таблицы истории как в schema.sql + индекс из миграции 2
+TABLE_SCHEMA = """
+    CREATE TABLE server_load_history (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        server_id INTEGER NOT NULL,
+        load_value INTEGER NOT NULL,
+        timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    );
+    CREATE INDEX idx_load_history_server_ts ON server_load_history (server_id, timestamp);
+"""
+BLOCKS_SCHEMA = dict(database.MIGRATIONS)[10]
+
+
+def generate(servers, hours, interval, start):
+    """Замеры по тикам агентов: [[sample, ...], ...] - один список на тик"""
+    loads = {server_id: random.randint(10, 60) for server_id in range(1, servers + 1)}
+    ticks = []
+    epoch = start
+    while epoch < start + hours * 3600:
+        tick = []
+        for server_id in loads:
+            loads[server_id] = min(max(loads[server_id] + random.randint(-3, 3), 0), 100)
+            # Иногда агент опаздывает на секунду-другую
+            jitter = random.choice((0,) * 18 + (1, 2))
+            tick.append({'server_id': server_id, 'load': loads[server_id],
+                         'epoch': epoch + jitter, 'timestamp': from_epoch(epoch + jitter)})
+        ticks.append(tick)
+        epoch += interval
+    return ticks
+
+
+def file_size(db):
+    db.execute("VACUUM")
+    return db.execute("PRAGMA page_count").fetchone()[0] * db.execute("PRAGMA page_size").fetchone()[0]
+
+
+def build(path, schema, write, batches):
+    db = sqlite3.connect(path)
+    db.executescript(schema)
+    started = time.perf_counter()
+    for batch in batches:
+        write(db, batch)
+        db.commit()
+    elapsed = time.perf_counter() - started
+    return db, elapsed
+
+
+def throughput(read, server_ids, points):
+    """Лучшее из трех прогонов чтения всех серверов, замеров в секунду"""
+    best = float('inf')
+    for _ in range(3):
+        started = time.perf_counter()
+        total = sum(read(server_id) for server_id in server_ids)
+        best = min(best, time.perf_counter() - started)
+    assert total == points, (total, points)
+    return points / best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--servers', type=int, default=20)
+    parser.add_argument('--hours', type=float, default=24)
+    parser.add_argument('--interval', type=int, default=5, help='секунд между замерами агента')
+    parser.add_argument('--flush', type=int, default=12, help='тиков в одной транзакции записи')
+    args = parser.parse_args()
+
+    random.seed(42)
+    start = int(time.time()) // 3600 * 3600 - int(args.hours * 3600)
+    ticks = generate(args.servers, args.hours, args.interval, start)
+    batches = [sum(ticks[i:i + args.flush], []) for i in range(0, len(ticks), args.flush)]
+    points = sum(len(tick) for tick in ticks)
+    server_ids = list(range(1, args.servers + 1))
+    end = start + int(args.hours * 3600) + 3600
+
+    directory = tempfile.mkdtemp(prefix='history_blocks_')
+    table = SQLiteHistory()
+    blocks = BlockArchive()
+    table_db, table_write = build(os.path.join(directory, 'table.db'), TABLE_SCHEMA, table.append, batches)
+    blocks_db, blocks_write = build(os.path.join(directory, 'blocks.db'), BLOCKS_SCHEMA, blocks.append, batches)
+    table_size, blocks_size = file_size(table_db), file_size(blocks_db)
+    payload = blocks_db.execute("SELECT SUM(length(data)) FROM server_load_blocks").fetchone()[0]
+
+    rows = [
+        ('таблица: range() с разбором времени', table_size, table_write,
+         throughput(lambda sid: len(table.range(table_db, sid, start, end)[0]), server_ids, points)),
+        ('блоки: range() векторно', blocks_size, blocks_write,
+         throughput(lambda sid: len(blocks.range(blocks_db, sid, start, end)[0]), server_ids, points)),
+        ('блоки: iter_range() потоком', blocks_size, blocks_write,
+         throughput(lambda sid: sum(1 for _ in blocks.iter_range(blocks_db, sid, start, end)), server_ids, points)),
+    ]
+
+    print(f"{points} замеров: {args.servers} серверов x {args.hours:g} ч, интервал {args.interval} с")
+    print(f"{'хранение / чтение':<38}{'байт/замер':>12}{'запись, с':>12}{'чтение, замеров/с':>20}")
+    for name, size, write_seconds, rate in rows:
+        print(f"{name:<38}{size / points:>12.1f}{write_seconds:>12.2f}{rate:>20,.0f}")
+    print(f"Полезная нагрузка блоков (BLOB): {payload / points:.2f} байт/замер, "
+          f"сжатие файла БД в {table_size / blocks_size:.1f} раза")
+
+
+if __name__ == '__main__':
+    main()
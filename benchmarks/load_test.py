@@ -0,0 +1,284 @@
+"""Нагрузочный тест центрального сервера: N агентов и M зрителей.
+
+Поднимает app.py в отдельном процессе на временной БД (или работает
+против уже запущенного сервера через --url), затем в течение --duration
+секунд агенты шлют зашифрованные замеры в /api/update_load с частотой
+--rate, а зрители открывают /, /register и /get_chart_data/<id>.
+Результат - пропускная способность, p50/p95/p99 и доля ошибок по каждому
+эндпоинту плюс рост файла БД - пишется в JSON для сравнения прогонов.
+
+Запуск из корня репозитория:
+    python benchmarks/load_test.py --agents 50 --viewers 10 --duration 30
+    python benchmarks/load_test.py --output new.json --compare old.json
+"""
+import argparse
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+
+import requests
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import wire  # noqa: E402
+from config import Config  # noqa: E402
+
+VIEWER_PAGES = ['/', '/register', '/get_chart_data/{server_id}']
+
+
+def serve(db_path, port, servers):
+    """Режим дочернего процесса: приложение на временной БД"""
+    import app as central
+
+    central.app.config['DATABASE_PATH'] = db_path
+    central.database.init_app(central.app, on_bootstrap=central.ensure_default_admin)
+    central.database.bootstrap()
+    db = central.get_db()
+    db.executemany(
+        "INSERT OR IGNORE INTO servers (ip_address, purpose) VALUES (?, ?)",
+        [(f'10.255.{i // 256}.{i % 256}', f'bench-{i % 4}') for i in range(servers)]
+    )
+    db.commit()
+    db.close()
+    # Все агенты приходят с 127.0.0.1 - лимиты приема замеров снимаем
+    for policy in ('ingest_client', 'ingest_server'):
+        central.limiter.policies[policy] = [(10 ** 9, 1)]
+    if central.app.config['INGEST_MODE'] == 'write_behind':
+        central.ingest_queue.start()
+    central.app.run(host='127.0.0.1', port=port, threaded=True)
+
+
+class Recorder:
+    """Задержки и коды ответов по эндпоинтам"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.latencies = {}
+        self.statuses = {}
+
+    def record(self, endpoint, seconds, status):
+        with self._lock:
+            self.latencies.setdefault(endpoint, []).append(seconds)
+            counts = self.statuses.setdefault(endpoint, {})
+            counts[status] = counts.get(status, 0) + 1
+
+    def summary(self, duration):
+        result = {}
+        for endpoint, latencies in sorted(self.latencies.items()):
+            latencies = sorted(latencies)
+            statuses = self.statuses[endpoint]
+            errors = sum(n for status, n in statuses.items() if status == 'error' or status >= 400)
+            result[endpoint] = {
+                'requests': len(latencies),
+                'throughput_rps': round(len(latencies) / duration, 1),
+                'error_rate': round(errors / len(latencies), 4),
+                'p50_ms': percentile(latencies, 50),
+                'p95_ms': percentile(latencies, 95),
+                'p99_ms': percentile(latencies, 99),
+                'statuses': {str(status): n for status, n in statuses.items()},
+            }
+        return result
+
+
+def percentile(sorted_values, q):
+    index = min(int(round(q / 100 * (len(sorted_values) - 1))), len(sorted_values) - 1)
+    return round(sorted_values[index] * 1000, 2)
+
+
+def timed(recorder, endpoint, call):
+    started = time.perf_counter()
+    try:
+        status = call().status_code
+    except requests.RequestException:
+        status = 'error'
+    recorder.record(endpoint, time.perf_counter() - started, status)
+
+
+def agent(base_url, server_id, rate, wire_format, deadline, recorder):
+    """Агент: замеры одного сервера с частотой rate в секунду"""
+    session = requests.Session()
+    interval = 1 / rate
+    next_tick = time.monotonic() + random.uniform(0, interval)
+    while next_tick < deadline:
+        time.sleep(max(next_tick - time.monotonic(), 0))
+        sample = {
+            'server_id': server_id,
+            'load': random.randint(0, 100),
+            'timestamp': datetime.utcnow().isoformat(),
+        }
+        if wire_format == 'binary':
+            body = wire.encode_frame([sample], Config.SECRET_KEY)
+            call = lambda: session.post(  # noqa: E731
+                f'{base_url}/api/update_load', data=body,
+                headers={'Content-Type': wire.FRAME_MIMETYPE}, timeout=10)
+        else:
+            payload = {'data': wire.encrypt_json(sample, Config.SECRET_KEY)}
+            call = lambda: session.post(f'{base_url}/api/update_load', json=payload, timeout=10)  # noqa: E731
+        timed(recorder, '/api/update_load', call)
+        next_tick += interval
+
+
+def viewer(base_url, server_ids, think_time, deadline, recorder):
+    """Зритель: страницы по кругу с паузой think_time"""
+    session = requests.Session()
+    while time.monotonic() < deadline:
+        for page in VIEWER_PAGES:
+            url = base_url + page.format(server_id=random.choice(server_ids))
+            timed(recorder, page.format(server_id='<id>'), lambda: session.get(url, timeout=10))
+            if think_time:
+                time.sleep(think_time)
+
+
+def db_size(db_path):
+    """Размер БД вместе с WAL, байт"""
+    if not db_path:
+        return None
+    return sum(
+        os.path.getsize(path) for path in (db_path, f'{db_path}-wal', f'{db_path}-shm')
+        if os.path.exists(path)
+    )
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def wait_ready(base_url, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            requests.get(f'{base_url}/about', timeout=1)
+            return
+        except requests.RequestException:
+            time.sleep(0.2)
+    raise RuntimeError(f'Сервер {base_url} не ответил за {timeout} с')
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, stderr=subprocess.DEVNULL
+        ).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(result, baseline_path):
+    """Разница с прошлым прогоном по пропускной способности и p95"""
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+    print(f"\nСравнение с {baseline_path} ({baseline.get('revision')}):")
+    for endpoint, stats in result['endpoints'].items():
+        old = baseline['endpoints'].get(endpoint)
+        if not old:
+            continue
+        print(f"{endpoint:<28}"
+              f"{stats['throughput_rps'] - old['throughput_rps']:>+12.1f} rps"
+              f"{stats['p95_ms'] - old['p95_ms']:>+12.2f} мс p95"
+              f"{(stats['error_rate'] - old['error_rate']) * 100:>+10.2f} % ошибок")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--agents', type=int, default=20)
+    parser.add_argument('--rate', type=float, default=1.0, help='замеров в секунду на агента')
+    parser.add_argument('--viewers', type=int, default=5)
+    parser.add_argument('--think-time', type=float, default=0.0, help='пауза зрителя между страницами, с')
+    parser.add_argument('--duration', type=float, default=20.0)
+    parser.add_argument('--servers', type=int, default=20, help='серверов во временной БД')
+    parser.add_argument('--wire', choices=['json', 'binary'], default='json')
+    parser.add_argument('--url', help='адрес уже запущенного сервера (без запуска своего)')
+    parser.add_argument('--db', help='файл БД сервера для --url, чтобы измерить рост')
+    parser.add_argument('--output', default='load_test.json')
+    parser.add_argument('--compare', help='JSON прошлого прогона')
+    parser.add_argument('--serve', nargs=3, metavar=('DB', 'PORT', 'SERVERS'), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve:
+        serve(args.serve[0], int(args.serve[1]), int(args.serve[2]))
+        return
+
+    process = None
+    if args.url:
+        base_url, db_path = args.url.rstrip('/'), args.db
+    else:
+        db_path = os.path.join(tempfile.mkdtemp(prefix='load_test_'), 'servers.db')
+        port = free_port()
+        base_url = f'http://127.0.0.1:{port}'
+        process = subprocess.Popen(
+            [sys.executable, os.path.abspath(__file__), '--serve', db_path, str(port), str(args.servers)],
+            cwd=ROOT, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+        )
+
+    try:
+        wait_ready(base_url)
+        server_ids = list(range(1, args.servers + 1))
+        recorder = Recorder()
+        size_before = db_size(db_path)
+        started = time.monotonic()
+        deadline = started + args.duration
+        threads = [
+            threading.Thread(target=agent, args=(
+                base_url, server_ids[i % len(server_ids)], args.rate, args.wire, deadline, recorder
+            ))
+            for i in range(args.agents)
+        ] + [
+            threading.Thread(target=viewer, args=(base_url, server_ids, args.think_time, deadline, recorder))
+            for _ in range(args.viewers)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        duration = time.monotonic() - started
+        # Даем очереди отложенной записи сброситься, прежде чем мерить БД
+        time.sleep(Config.INGEST_FLUSH_INTERVAL_MS / 1000 * 2)
+        size_after = db_size(db_path)
+    finally:
+        if process:
+            process.terminate()
+            process.wait()
+
+    result = {
+        'revision': git_revision(),
+        'started_at': datetime.now().isoformat(timespec='seconds'),
+        'config': {
+            'agents': args.agents, 'rate': args.rate, 'viewers': args.viewers,
+            'think_time': args.think_time, 'duration': args.duration,
+            'servers': args.servers, 'wire': args.wire, 'url': args.url,
+        },
+        'duration_s': round(duration, 2),
+        'endpoints': recorder.summary(duration),
+        'db': {
+            'size_before': size_before,
+            'size_after': size_after,
+            'growth': size_after - size_before if db_path else None,
+        },
+    }
+    with open(args.output, 'w') as f:
+        json.dump(result, f, indent=2, ensure_ascii=False)
+
+    print(f"{'эндпоинт':<28}{'запросов':>10}{'rps':>10}{'p50, мс':>10}{'p95, мс':>10}{'p99, мс':>10}{'ошибки':>9}")
+    for endpoint, stats in result['endpoints'].items():
+        print(f"{endpoint:<28}{stats['requests']:>10}{stats['throughput_rps']:>10.1f}"
+              f"{stats['p50_ms']:>10.2f}{stats['p95_ms']:>10.2f}{stats['p99_ms']:>10.2f}"
+              f"{stats['error_rate'] * 100:>8.2f}%")
+    if db_path:
+        print(f"Рост БД: {result['db']['growth'] / 1024:.1f} КБ")
+    print(f"Результат записан в {args.output}")
+    if args.compare:
+        compare(result, args.compare)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,101 @@
+"""Микробенчмарк форматов сообщений агента: legacy JSON+CBC против кадра v1.
+
+decode - вся работа сервера до записи: расшифровка и validate_sample
+каждого замера (legacy разбирает ISO-время, кадр v1 передает epoch).
+
+Запуск из корня репозитория:
+    python benchmarks/wire_format.py [--number 20000]
+"""
+import argparse
+import json
+import os
+import sys
+import timeit
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import wire  # noqa: E402
+from ingest import validate_sample  # noqa: E402
+
+SECRET = 'secret-key'
+SAMPLE = {
+    'server_id': 1,
+    'load': 42,
+    'timestamp': datetime.utcnow().isoformat(),
+}
+
+
+def legacy_encode(uncached=False):
+    if uncached:
+        wire.derive_key.cache_clear()
+    return json.dumps({'data': wire.encrypt_json(SAMPLE, SECRET)}).encode()
+
+
+def legacy_decode(body, uncached=False):
+    if uncached:
+        wire.derive_key.cache_clear()
+    data = wire.decrypt_json(json.loads(body)['data'], SECRET)
+    return [validate_sample(raw) for raw in data.get('samples', [data])]
+
+
+def frame_encode():
+    return wire.encode_frame([SAMPLE], SECRET)
+
+
+def frame_decode(body):
+    return [validate_sample(raw) for raw in wire.decode_frame(body, SECRET)]
+
+
+BATCH = 100
+
+
+def legacy_batch_encode():
+    return json.dumps({'data': wire.encrypt_json({'samples': [SAMPLE] * BATCH}, SECRET)}).encode()
+
+
+def frame_batch_encode():
+    return wire.encode_frame([SAMPLE] * BATCH, SECRET)
+
+
+def measure(func, number):
+    """Лучшее из трех прогонов, микросекунд на вызов"""
+    return min(timeit.repeat(func, number=number, repeat=3)) / number * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--number', type=int, default=20000)
+    args = parser.parse_args()
+
+    legacy_body = legacy_encode()
+    frame_body = frame_encode()
+    legacy_batch = legacy_batch_encode()
+    frame_batch = frame_batch_encode()
+    batch_number = max(args.number // BATCH, 1)
+    rows = [
+        ('legacy (ключ на каждый вызов)', len(legacy_body),
+         measure(lambda: legacy_encode(True), args.number),
+         measure(lambda: legacy_decode(legacy_body, True), args.number)),
+        ('legacy (кэш ключа)', len(legacy_body),
+         measure(legacy_encode, args.number),
+         measure(lambda: legacy_decode(legacy_body), args.number)),
+        ('frame v1 (AES-OCB)', len(frame_body),
+         measure(frame_encode, args.number),
+         measure(lambda: frame_decode(frame_body), args.number)),
+        # Для пакетов - стоимость в пересчете на один замер
+        (f'legacy, пакет из {BATCH}', len(legacy_batch) / BATCH,
+         measure(legacy_batch_encode, batch_number) / BATCH,
+         measure(lambda: legacy_decode(legacy_batch), batch_number) / BATCH),
+        (f'frame v1, пакет из {BATCH}', len(frame_batch) / BATCH,
+         measure(frame_batch_encode, batch_number) / BATCH,
+         measure(lambda: frame_decode(frame_batch), batch_number) / BATCH),
+    ]
+
+    print(f"{'формат':<32}{'байт':>8}{'encode, мкс':>14}{'decode, мкс':>14}")
+    for name, size, encode_us, decode_us in rows:
+        print(f"{name:<32}{size:>8.0f}{encode_us:>14.2f}{decode_us:>14.2f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,83 @@
+import threading
+from collections import deque
+
+
+class Subscriber:
+    """Подписчик потока событий с ограниченным буфером"""
+
+    def __init__(self, buffer_size):
+        self.buffer_size = buffer_size
+        self.closed = False
+        self._events = deque()
+        self._cond = threading.Condition()
+
+    def offer(self, events):
+        """Добавление событий; False если буфер переполнен (медленный клиент)"""
+        with self._cond:
+            if self.closed:
+                return False
+            if len(self._events) + len(events) > self.buffer_size:
+                self.closed = True
+                self._cond.notify()
+                return False
+            self._events.extend(events)
+            self._cond.notify()
+            return True
+
+    def get(self, timeout):
+        """Накопленные события; [] по таймауту, None если подписка закрыта"""
+        with self._cond:
+            if not self._events and not self.closed:
+                self._cond.wait(timeout)
+            if self.closed:
+                return None
+            events = list(self._events)
+            self._events.clear()
+            return events
+
+    def close(self):
+        with self._cond:
+            self.closed = True
+            self._cond.notify()
+
+
+class Broadcaster:
+    """Рассылка событий всем подключенным клиентам (fan-out).
+
+    publish() не блокируется на клиентах: каждому достается только
+    дописывание в его буфер, переполнивший буфер клиент отключается.
+    """
+
+    def __init__(self, max_clients=200, buffer_size=256):
+        self.max_clients = max_clients
+        self.buffer_size = buffer_size
+        self.dropped = 0
+        self._subscribers = set()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._subscribers)
+
+    def subscribe(self):
+        """Новый подписчик или None, если достигнут лимит подключений"""
+        with self._lock:
+            if len(self._subscribers) >= self.max_clients:
+                return None
+            subscriber = Subscriber(self.buffer_size)
+            self._subscribers.add(subscriber)
+            return subscriber
+
+    def unsubscribe(self, subscriber):
+        subscriber.close()
+        with self._lock:
+            self._subscribers.discard(subscriber)
+
+    def publish(self, events):
+        if not events or not self._subscribers:
+            return
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for subscriber in subscribers:
+            if not subscriber.offer(events):
+                self.dropped += 1
+                self.unsubscribe(subscriber)
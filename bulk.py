@@ -0,0 +1,145 @@
+import csv
+import io
+import json
+import sqlite3
+
+IMPORT_COLUMNS = ['ip_address', 'purpose', 'is_available', 'capacity']
+_TRUE = {'1', 'true', 'yes', 'on', 'да'}
+_FALSE = {'0', 'false', 'no', 'off', 'нет', ''}
+
+
+def parse_import(data, filename=''):
+    """Строки импорта серверов из CSV (с заголовком) или JSON-массива объектов"""
+    if isinstance(data, bytes):
+        try:
+            data = data.decode('utf-8-sig')
+        except UnicodeDecodeError:
+            raise ValueError('Файл должен быть в UTF-8')
+    if filename.lower().endswith('.json') or data.lstrip().startswith('['):
+        try:
+            rows = json.loads(data)
+        except json.JSONDecodeError as e:
+            raise ValueError(f'Некорректный JSON: {e}')
+        if not isinstance(rows, list) or not all(isinstance(row, dict) for row in rows):
+            raise ValueError('JSON должен быть массивом объектов')
+        return rows
+    reader = csv.DictReader(io.StringIO(data))
+    if not reader.fieldnames or 'ip_address' not in reader.fieldnames:
+        raise ValueError(f"В CSV нужен заголовок с колонками: {', '.join(IMPORT_COLUMNS)}")
+    return list(reader)
+
+
+def _flag(value, default=True):
+    if value is None:
+        return default
+    if isinstance(value, bool):
+        return value
+    text = str(value).strip().lower()
+    if text in _TRUE:
+        return True
+    if text in _FALSE:
+        return False
+    raise ValueError(f'is_available: ожидается да/нет, получено {value!r}')
+
+
+def validate_server(row):
+    """Значения для INSERT из строки импорта; ValueError с текстом ошибки"""
+    ip = str(row.get('ip_address') or '').strip()
+    purpose = str(row.get('purpose') or '').strip()
+    if not ip or not purpose:
+        raise ValueError('ip_address и purpose обязательны')
+    capacity = row.get('capacity')
+    if capacity in (None, ''):
+        capacity = None
+    else:
+        try:
+            capacity = int(capacity)
+        except (TypeError, ValueError):
+            capacity = 0
+        if capacity <= 0:
+            raise ValueError('capacity должна быть положительным числом')
+    return ip, purpose, _flag(row.get('is_available')), capacity
+
+
+def import_servers(db, rows):
+    """Добавление серверов одной транзакцией (commit - за вызывающим).
+
+    Ошибочные строки пропускаются и возвращаются в errors с номером
+    строки (с 1, без заголовка); остальные добавляются. Возвращает
+    (добавленные строки servers, errors).
+    """
+    created, errors = [], []
+    for number, row in enumerate(rows, 1):
+        try:
+            values = validate_server(row)
+        except ValueError as e:
+            errors.append({'row': number, 'error': str(e)})
+            continue
+        try:
+            # Нарушение UNIQUE откатывает только эту вставку, не транзакцию
+            cur = db.execute(
+                "INSERT INTO servers (ip_address, purpose, is_available, capacity) VALUES (?, ?, ?, ?)",
+                values
+            )
+        except sqlite3.IntegrityError:
+            errors.append({'row': number, 'error': f'Сервер с IP {values[0]} уже существует'})
+            continue
+        created.append(cur.lastrowid)
+    return _servers_by_id(db, created), errors
+
+
+def _servers_by_id(db, server_ids):
+    rows = []
+    # Не больше 500 параметров на запрос (лимит SQLite - 999 в старых сборках)
+    for start in range(0, len(server_ids), 500):
+        chunk = server_ids[start:start + 500]
+        rows += db.execute(
+            f"SELECT * FROM servers WHERE id IN ({','.join('?' * len(chunk))}) ORDER BY id", chunk
+        ).fetchall()
+    return rows
+
+
+def set_servers_available(db, server_ids, is_available=None):
+    """Включение/отключение серверов; is_available=None - инвертировать каждый.
+
+    Возвращает [(server_id, новый статус), ...] для найденных серверов.
+    """
+    servers = _servers_by_id(db, list(server_ids))
+    changes = [
+        (server['id'], bool(is_available) if is_available is not None else not server['is_available'])
+        for server in servers
+    ]
+    db.executemany(
+        "UPDATE servers SET is_available = ? WHERE id = ?",
+        [(available, server_id) for server_id, available in changes]
+    )
+    return changes
+
+
+def delete_servers(db, server_ids, history):
+    """Удаление серверов без заявок вместе с историей нагрузки.
+
+    Возвращает (удаленные id, errors) - ошибки по id, которые не найдены
+    или еще имеют регистрации.
+    """
+    server_ids = list(dict.fromkeys(server_ids))
+    existing = {server['id'] for server in _servers_by_id(db, server_ids)}
+    busy = set()
+    for start in range(0, len(server_ids), 500):
+        chunk = server_ids[start:start + 500]
+        busy.update(row[0] for row in db.execute(
+            f"SELECT DISTINCT server_id FROM registrations WHERE server_id IN ({','.join('?' * len(chunk))})",
+            chunk
+        ))
+    deleted, errors = [], []
+    for server_id in server_ids:
+        if server_id not in existing:
+            errors.append({'id': server_id, 'error': 'Сервер не найден'})
+        elif server_id in busy:
+            errors.append({'id': server_id, 'error': 'Есть активные регистрации'})
+        else:
+            deleted.append(server_id)
+    for server_id in deleted:
+        history.delete_server(db, server_id)
+    db.executemany("DELETE FROM servers WHERE id = ?", [(server_id,) for server_id in deleted])
+    return deleted, errors
@@ -0,0 +1,206 @@
+import logging
+import os
+import socket
+import threading
+import time
+import uuid
+
+from instrumentation import registry
+
+logger = logging.getLogger(__name__)
+
+
+def bump_generation(db, name):
+    """Сигнал другим процессам: кэш name устарел (в транзакции вызывающего)"""
+    db.execute("""
+        INSERT INTO cache_generations (name, generation) VALUES (?, 1)
+        ON CONFLICT (name) DO UPDATE SET generation = generation + 1
+    """, (name,))
+
+
+class LeaderLease:
+    """Аренда лидерства в SQLite: фоновые задачи выполняет один процесс.
+
+    Владелец продлевает аренду каждые ttl/3 секунд. Если он завис или
+    умер, через ttl секунд аренду перехватывает другой процесс.
+    """
+
+    def __init__(self, connect, name='background', ttl=30):
+        self._connect = connect
+        self.name = name
+        self.ttl = ttl
+        self.holder = f'{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}'
+        self._valid_until = 0
+        self._stopping = threading.Event()
+        self._thread = None
+
+    @property
+    def is_leader(self):
+        return time.monotonic() < self._valid_until
+
+    def try_acquire(self):
+        """Захват или продление аренды; True если процесс - лидер"""
+        started = time.monotonic()
+        now = time.time()
+        db = self._connect()
+        try:
+            cur = db.execute("""
+                INSERT INTO leases (name, holder, expires_at) VALUES (?, ?, ?)
+                ON CONFLICT (name) DO UPDATE SET
+                    holder = excluded.holder,
+                    expires_at = excluded.expires_at
+                WHERE leases.holder = excluded.holder OR leases.expires_at < ?
+            """, (self.name, self.holder, now + self.ttl, now))
+            db.commit()
+            acquired = cur.rowcount == 1
+        finally:
+            db.close()
+
+        was_leader = self.is_leader
+        # Локально считаем аренду истекшей чуть раньше, чем в БД
+        self._valid_until = started + self.ttl * 0.8 if acquired else 0
+        if acquired != was_leader:
+            logger.info(f"Leader lease {self.name}: {'acquired' if acquired else 'lost'} by {self.holder}")
+        return acquired
+
+    def release(self):
+        self._stopping.set()
+        self._valid_until = 0
+        db = self._connect()
+        try:
+            db.execute("DELETE FROM leases WHERE name = ? AND holder = ?", (self.name, self.holder))
+            db.commit()
+        finally:
+            db.close()
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='leader-lease', daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while not self._stopping.is_set():
+            try:
+                self.try_acquire()
+            except Exception as e:
+                self._valid_until = 0
+                logger.error(f"Leader lease error: {e}", exc_info=True)
+            self._stopping.wait(self.ttl / 3)
+
+
+class Scheduler:
+    """Периодические фоновые задачи; при аренде - только в процессе-лидере"""
+
+    def __init__(self, lease=None, tick=1.0):
+        self.lease = lease
+        self.tick = tick
+        self._jobs = []
+        self._thread = None
+
+    @property
+    def is_leader(self):
+        return self.lease is None or self.lease.is_leader
+
+    def add(self, name, func, interval):
+        self._jobs.append({'name': name, 'func': func, 'interval': interval, 'next_run': 0})
+
+    def start(self):
+        if self._thread is not None:
+            return
+        if self.lease is not None:
+            self.lease.start()
+        self._thread = threading.Thread(target=self._run, name='scheduler', daemon=True)
+        self._thread.start()
+
+    def run_pending(self):
+        for job in self._jobs:
+            if not self.is_leader:
+                return
+            if time.monotonic() < job['next_run']:
+                continue
+            try:
+                with registry.task_run(job['name']):
+                    job['func']()
+            except Exception as e:
+                logger.error(f"Background job {job['name']} failed: {e}", exc_info=True)
+            job['next_run'] = time.monotonic() + job['interval']
+
+    def _run(self):
+        while True:
+            self.run_pending()
+            time.sleep(self.tick)
+
+
+class ChangeFeed:
+    """Синхронизация кэшей процесса с изменениями, сделанными другими.
+
+    Раз в interval секунд читает новые замеры из хранилища истории и
+    счетчики поколений кэшей. Новые замеры передаются в on_samples,
+    имена изменившихся кэшей - в on_invalidate, новые заявки
+    [(id, server_id), ...] - в on_registrations.
+    """
+
+    def __init__(self, connect, history, on_samples, on_invalidate, on_registrations=None,
+                 interval=1.0, batch_size=5000):
+        self._connect = connect
+        self.history = history
+        self.on_samples = on_samples
+        self.on_invalidate = on_invalidate
+        self.on_registrations = on_registrations
+        self.interval = interval
+        self.batch_size = batch_size
+        self._cursor = None
+        self._registration_cursor = None
+        self._generations = None
+        self._thread = None
+
+    def poll(self):
+        """Один опрос; True если замеров больше, чем влезло в пачку"""
+        db = self._connect()
+        try:
+            generations = dict(db.execute("SELECT name, generation FROM cache_generations").fetchall())
+            # Первый опрос только запоминает позицию: снимок и так свежий
+            samples, self._cursor = self.history.changes(db, self._cursor, self.batch_size)
+            registrations = self._registrations(db) if self.on_registrations is not None else []
+        finally:
+            db.close()
+
+        if self._generations is not None:
+            changed = [name for name, generation in generations.items()
+                       if self._generations.get(name) != generation]
+            if changed:
+                self.on_invalidate(changed)
+        self._generations = generations
+        if registrations:
+            self.on_registrations(registrations)
+        if samples:
+            self.on_samples(samples)
+        return len(samples) >= self.batch_size or len(registrations) >= self.batch_size
+
+    def _registrations(self, db):
+        if self._registration_cursor is None:
+            self._registration_cursor = db.execute(
+                "SELECT COALESCE(MAX(id), 0) FROM registrations"
+            ).fetchone()[0]
+            return []
+        rows = [tuple(row) for row in db.execute(
+            "SELECT id, server_id FROM registrations WHERE id > ? ORDER BY id LIMIT ?",
+            (self._registration_cursor, self.batch_size)
+        )]
+        if rows:
+            self._registration_cursor = rows[-1][0]
+        return rows
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='change-feed', daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            try:
+                if self.poll():
+                    continue
+            except Exception as e:
+                logger.error(f"Change feed error: {e}", exc_info=True)
+            time.sleep(self.interval)
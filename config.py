@@ -9,7 +9,80 @@ class Config:
     PORT=5000
     DATABASE_PATH = INSTANCE_PATH / 'servers.db'
     SCHEMA_PATH = BASE_DIR / 'schema.sql'
+    # Пул соединений SQLite
+    DB_POOL_SIZE = 16  # макс. простаивающих соединений в пуле
+    DB_BUSY_TIMEOUT_MS = 5000  # ожидание блокировки записи
+    DB_CACHE_SIZE_KB = 16384  # кэш страниц на соединение
+    DB_MMAP_SIZE = 256 * 1024 * 1024  # отображение файла БД в память
     REGISTRATION_LIMITS = {
         'MAX_REQUESTS_PER_DAY': 200,  # Макс. заявок в сутки
         'MIN_SECONDS_BETWEEN': 60   # секунд между заявками
-    }
\ No newline at end of file
+    }
+    # Ограничение частоты в памяти: политика -> [(лимит, окно в секундах), ...]
+    RATE_LIMITS = {
+        'ingest_client': [(600, 60)],  # запросов агентов с одного IP
+        'ingest_server': [(3000, 60)],  # замеров на один сервер
+    }
+    RATE_LIMIT_SNAPSHOT_PATH = INSTANCE_PATH / 'rate_limits.json'
+    RATE_LIMIT_SNAPSHOT_INTERVAL = 60  # секунд между сохранениями счетчиков
+    # Прием замеров от агентов: 'write_behind' (через очередь) или 'sync'
+    INGEST_MODE = 'write_behind'
+    INGEST_FLUSH_INTERVAL_MS = 500  # макс. задержка сброса очереди в БД
+    INGEST_BATCH_SIZE = 500  # макс. замеров в одной транзакции
+    INGEST_QUEUE_MAX = 10000  # глубина очереди, сверх нее отвечаем 429
+    INGEST_MAX_BATCH = 1000  # макс. замеров в одном пакетном запросе
+    # Прием кадров v1 без HTTP (см. listener.py); None - порт не слушать
+    INGEST_LISTEN_HOST = '0.0.0.0'
+    INGEST_UDP_PORT = None  # например 5001
+    INGEST_TCP_PORT = None  # например 5001
+    # Хранение истории нагрузки: 'sqlite' (таблица) или 'mmap' (файлы на сервер)
+    HISTORY_BACKEND = 'sqlite'
+    HISTORY_DIR = INSTANCE_PATH / 'history'  # каталог файлов для 'mmap'
+    HISTORY_WINDOW = 40  # макс. последних замеров на сервер
+    HISTORY_RETENTION_HOURS = 24  # замеры старше удаляются фоновой задачей
+    HISTORY_PURGE_INTERVAL = 300  # секунд между проходами очистки
+    HISTORY_PURGE_BATCH = 1000  # строк за одну транзакцию удаления
+    # Сжатый архив истории для долгих диапазонов (None - не вести)
+    ARCHIVE_BLOCK_SECONDS = 3600  # замеров сервера в одном блоке - за час
+    ARCHIVE_RETENTION_HOURS = 24 * 365
+    METRICS_RETENTION_HOURS = 24  # хранение дополнительных метрик агентов
+    # Агрегаты истории: (секунд в корзине, часов хранения)
+    ROLLUP_TIERS = [
+        (60, 48),  # 1 минута - 2 суток
+        (900, 24 * 14),  # 15 минут - 2 недели
+        (3600, 24 * 365),  # 1 час - год
+    ]
+    CHART_MAX_POINTS = 500  # бюджет точек графика по умолчанию
+    CHART_POINTS_LIMIT = 5000  # макс. points в запросе графика
+    RAW_SAMPLE_INTERVAL = 5  # секунд между замерами агента - оценка числа точек для resolution=raw
+    HISTORY_API_LIMIT = 5000  # макс. замеров в одном ответе /api/history
+    ADMIN_PAGE_SIZE = 50  # заявок на странице админки
+    ADMIN_PAGE_SIZE_MAX = 500  # макс. limit для /admin/api/registrations
+    SNAPSHOT_TTL = 30  # секунд до перечитывания снимка из БД (только при нескольких процессах)
+    # Сжатие ответов и кэширование в браузере
+    GZIP_MIN_SIZE = 1024  # байт; меньшие ответы не сжимаются
+    GZIP_LEVEL = 6
+    STATIC_MAX_AGE = 365 * 24 * 3600  # секунд для статики с хэшем в URL (?v=)
+    # Серверы без замеров дольше HEARTBEAT_TIMEOUT помечаются "нет связи"
+    HEARTBEAT_TIMEOUT = 180  # секунд; агент шлет полный отчет не реже раза в минуту
+    HEARTBEAT_CHECK_INTERVAL = 5  # секунд между проверками
+    # Несколько процессов (wsgi.py под gunicorn)
+    LEADER_LEASE_TTL = 30  # секунд до перехвата аренды у зависшего лидера
+    CHANGE_FEED_INTERVAL = 1.0  # секунд между опросами изменений других процессов
+    WORKER_THREADS = 16  # потоков gthread на процесс (gunicorn.conf.py)
+    # Под gthread каждый /api/stream занимает поток целиком; столько потоков
+    # процесса всегда остается обычным запросам (прием замеров, регистрация)
+    STREAM_RESERVED_THREADS = 8
+    # Поток живых обновлений (/api/stream)
+    STREAM_MAX_CLIENTS = 200  # макс. одновременных подключений (под gunicorn - не больше
+                              # WORKER_THREADS - STREAM_RESERVED_THREADS на процесс)
+    STREAM_CLIENT_BUFFER = 256  # событий в буфере клиента, дальше отключаем
+    STREAM_KEEPALIVE = 15  # секунд между keepalive-комментариями
+    # Аналитика нагрузки (/admin/analytics)
+    ANALYTICS_LOAD_THRESHOLD = 80  # порог для "времени выше порога", %
+    ANALYTICS_EWMA_ALPHA = 0.3  # коэффициент сглаживания EWMA
+    ANALYTICS_Z_THRESHOLD = 3.0  # |z| выше - аномалия
+    # Окно статистики по архиву (без архива - только последние HISTORY_WINDOW замеров)
+    ANALYTICS_WINDOW_HOURS = 24
+    ANALYTICS_CACHED_WINDOWS = (1, 6, 24, 168)  # окна (ч), результат которых кэшируется
+    PLACEMENT_PENDING_WEIGHT = 5  # "вес" регистрации до следующего замера, % нагрузки
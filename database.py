@@ -1,13 +1,318 @@
 import sqlite3
 import contextlib
+import os
+import threading
+import time
+from collections import deque
 from config import Config
+from instrumentation import registry, statement_template
 
-def get_db():
-    """Получение соединения с БД"""
-    db = sqlite3.connect(Config.DATABASE_PATH)
+# Миграции схемы: (версия, SQL). Версия 1 - исходный schema.sql,
+# новые изменения схемы добавляются сюда, а не в schema.sql
+MIGRATIONS = [
+    (1, None),
+    (2, """
+        CREATE INDEX IF NOT EXISTS idx_load_history_server_ts
+            ON server_load_history (server_id, timestamp);
+    """),
+    (3, """
+        CREATE TABLE IF NOT EXISTS server_load_rollups (
+            resolution INTEGER NOT NULL,
+            server_id INTEGER NOT NULL,
+            bucket INTEGER NOT NULL,
+            min_load INTEGER NOT NULL,
+            max_load INTEGER NOT NULL,
+            sum_load INTEGER NOT NULL,
+            count INTEGER NOT NULL,
+            PRIMARY KEY (resolution, server_id, bucket)
+        ) WITHOUT ROWID;
+        -- Заполняем агрегаты из уже накопленной истории
+        INSERT OR IGNORE INTO server_load_rollups
+        SELECT r.resolution, h.server_id,
+               CAST(strftime('%s', h.timestamp) AS INTEGER) / r.resolution * r.resolution AS bucket,
+               MIN(h.load_value), MAX(h.load_value), SUM(h.load_value), COUNT(*)
+        FROM server_load_history h
+        CROSS JOIN (SELECT 60 AS resolution UNION ALL SELECT 900 UNION ALL SELECT 3600) r
+        WHERE strftime('%s', h.timestamp) IS NOT NULL
+        GROUP BY r.resolution, h.server_id, bucket;
+    """),
+    (4, """
+        CREATE TABLE IF NOT EXISTS server_metrics (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            server_id INTEGER NOT NULL,
+            metric TEXT NOT NULL,
+            value REAL NOT NULL,
+            timestamp TIMESTAMP NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS idx_server_metrics_server_ts
+            ON server_metrics (server_id, timestamp);
+        CREATE TABLE IF NOT EXISTS server_metrics_latest (
+            server_id INTEGER NOT NULL,
+            metric TEXT NOT NULL,
+            value REAL NOT NULL,
+            timestamp TIMESTAMP NOT NULL,
+            PRIMARY KEY (server_id, metric)
+        ) WITHOUT ROWID;
+    """),
+    (5, """
+        -- Макс. число регистраций на сервере (NULL - без ограничения)
+        ALTER TABLE servers ADD COLUMN capacity INTEGER;
+    """),
+    (6, """
+        -- Лимиты регистраций теперь считаются в памяти (ratelimit.py)
+        DROP TABLE IF EXISTS registration_limits;
+    """),
+    (7, """
+        -- Keyset-пагинация и фильтры таблицы заявок в админке
+        CREATE INDEX IF NOT EXISTS idx_registrations_date
+            ON registrations (registration_date, id);
+        CREATE INDEX IF NOT EXISTS idx_registrations_server_date
+            ON registrations (server_id, registration_date, id);
+        CREATE INDEX IF NOT EXISTS idx_registrations_nickname
+            ON registrations (nickname);
+        CREATE INDEX IF NOT EXISTS idx_registrations_ip
+            ON registrations (request_ip);
+    """),
+    (8, """
+        -- Аренда лидера фоновых задач и поколения кэшей процессов
+        CREATE TABLE IF NOT EXISTS leases (
+            name TEXT PRIMARY KEY,
+            holder TEXT NOT NULL,
+            expires_at REAL NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS cache_generations (
+            name TEXT PRIMARY KEY,
+            generation INTEGER NOT NULL DEFAULT 0
+        );
+    """),
+    (9, """
+        -- Агент сервера перестал присылать замеры (heartbeat.py)
+        ALTER TABLE servers ADD COLUMN is_stale INTEGER NOT NULL DEFAULT 0;
+    """),
+    (10, """
+        -- Долгое хранение истории сжатыми блоками (archive.py)
+        CREATE TABLE IF NOT EXISTS server_load_blocks (
+            server_id INTEGER NOT NULL,
+            block_start INTEGER NOT NULL,
+            count INTEGER NOT NULL,
+            last_epoch INTEGER NOT NULL,
+            last_delta INTEGER NOT NULL,
+            last_load INTEGER NOT NULL,
+            data BLOB NOT NULL,
+            PRIMARY KEY (server_id, block_start)
+        );
+    """),
+    (11, """
+        -- Очистка по времени, а не по списку серверов (retention.py, rollups.py)
+        CREATE INDEX IF NOT EXISTS idx_load_history_ts
+            ON server_load_history (timestamp);
+        CREATE INDEX IF NOT EXISTS idx_server_metrics_ts
+            ON server_metrics (timestamp);
+        CREATE INDEX IF NOT EXISTS idx_rollups_resolution_bucket
+            ON server_load_rollups (resolution, bucket);
+        -- Агрегаты и метрики уже удаленных серверов
+        DELETE FROM server_load_rollups WHERE server_id NOT IN (SELECT id FROM servers);
+        DELETE FROM server_metrics WHERE server_id NOT IN (SELECT id FROM servers);
+        DELETE FROM server_metrics_latest WHERE server_id NOT IN (SELECT id FROM servers);
+    """),
+    (12, """
+        -- Время замеров в одной форме (wire.from_epoch, UTC): строки с пробелом
+        -- (CURRENT_TIMESTAMP) и со смещением ломали сравнение по хранению
+        UPDATE server_load_history SET timestamp = strftime('%Y-%m-%dT%H:%M:%S', timestamp)
+        WHERE (substr(timestamp, 11, 1) <> 'T' OR substr(timestamp, 20) GLOB '*[+Z-]*')
+            AND strftime('%s', timestamp) IS NOT NULL;
+        UPDATE server_metrics SET timestamp = strftime('%Y-%m-%dT%H:%M:%S', timestamp)
+        WHERE (substr(timestamp, 11, 1) <> 'T' OR substr(timestamp, 20) GLOB '*[+Z-]*')
+            AND strftime('%s', timestamp) IS NOT NULL;
+        UPDATE server_metrics_latest SET timestamp = strftime('%Y-%m-%dT%H:%M:%S', timestamp)
+        WHERE (substr(timestamp, 11, 1) <> 'T' OR substr(timestamp, 20) GLOB '*[+Z-]*')
+            AND strftime('%s', timestamp) IS NOT NULL;
+    """),
+]
+
+_settings = {
+    'path': Config.DATABASE_PATH,
+    'schema_path': Config.SCHEMA_PATH,
+    'pool_size': Config.DB_POOL_SIZE,
+    'busy_timeout': Config.DB_BUSY_TIMEOUT_MS,
+    'cache_size': Config.DB_CACHE_SIZE_KB,
+    'mmap_size': Config.DB_MMAP_SIZE,
+    'on_bootstrap': None,
+}
+_local = threading.local()
+_pool = deque()
+_pool_lock = threading.Lock()
+_bootstrapped = set()
+_bootstrap_lock = threading.Lock()
+
+
+class TimedCursor(sqlite3.Cursor):
+    """Курсор, замеряющий время выполнения запросов по их шаблонам"""
+
+    def execute(self, sql, *args):
+        started = time.perf_counter()
+        try:
+            return super().execute(sql, *args)
+        finally:
+            registry.observe('db_statement_duration_seconds', time.perf_counter() - started,
+                             statement=statement_template(sql))
+
+    def executemany(self, sql, *args):
+        started = time.perf_counter()
+        try:
+            return super().executemany(sql, *args)
+        finally:
+            registry.observe('db_statement_duration_seconds', time.perf_counter() - started,
+                             statement=statement_template(sql))
+
+
+class PooledConnection(sqlite3.Connection):
+    """Соединение из пула: close() возвращает его в пул, а не закрывает"""
+
+    def cursor(self, factory=TimedCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, *args):
+        return self.cursor().execute(sql, *args)
+
+    def executemany(self, sql, *args):
+        return self.cursor().executemany(sql, *args)
+
+    def close(self):
+        if self._refs <= 0:
+            return
+        self._refs -= 1
+        if self._refs > 0:
+            return
+        # Незакоммиченное откатываем, как это сделал бы настоящий close()
+        if self.in_transaction:
+            self.rollback()
+        _local.db = None
+        _release(self)
+
+    def release(self):
+        """Настоящее закрытие соединения"""
+        super().close()
+
+
+def init_app(app, on_bootstrap=None):
+    """Настройка слоя БД из конфигурации приложения"""
+    _settings.update(
+        path=app.config['DATABASE_PATH'],
+        schema_path=app.config['SCHEMA_PATH'],
+        pool_size=app.config['DB_POOL_SIZE'],
+        busy_timeout=app.config['DB_BUSY_TIMEOUT_MS'],
+        cache_size=app.config['DB_CACHE_SIZE_KB'],
+        mmap_size=app.config['DB_MMAP_SIZE'],
+    )
+    if on_bootstrap is not None:
+        _settings['on_bootstrap'] = on_bootstrap
+    close_pool()
+
+
+def _connect():
+    db = sqlite3.connect(
+        _settings['path'],
+        factory=PooledConnection,
+        timeout=_settings['busy_timeout'] / 1000,
+        check_same_thread=False
+    )
     db.row_factory = sqlite3.Row
+    db.execute(f"PRAGMA busy_timeout = {int(_settings['busy_timeout'])}")
+    db.execute("PRAGMA synchronous = NORMAL")
+    db.execute(f"PRAGMA cache_size = -{int(_settings['cache_size'])}")
+    db.execute(f"PRAGMA mmap_size = {int(_settings['mmap_size'])}")
+    db.path = str(_settings['path'])
+    return db
+
+
+def _release(db):
+    with _pool_lock:
+        if db.path == str(_settings['path']) and len(_pool) < _settings['pool_size']:
+            _pool.append(db)
+            return
+    db.release()
+
+
+def close_pool():
+    """Закрытие всех простаивающих соединений пула"""
+    with _pool_lock:
+        while _pool:
+            _pool.pop().release()
+
+
+def get_db():
+    """Получение соединения с БД.
+
+    Внутри одного потока повторные вызовы возвращают то же соединение,
+    освобожденное соединение возвращается в общий пул.
+    """
+    path = str(_settings['path'])
+    if path not in _bootstrapped:
+        bootstrap()
+    db = getattr(_local, 'db', None)
+    if db is None:
+        with _pool_lock:
+            db = _pool.pop() if _pool else None
+        if db is None:
+            db = _connect()
+        db._refs = 0
+        _local.db = db
+    db._refs += 1
     return db
 
+
+def bootstrap():
+    """Создание и миграция схемы; выполняется один раз на процесс"""
+    path = str(_settings['path'])
+    with _bootstrap_lock:
+        if path in _bootstrapped:
+            return
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        db = sqlite3.connect(path)
+        db.row_factory = sqlite3.Row
+        try:
+            db.execute("PRAGMA journal_mode = WAL")
+            migrate(db)
+            if _settings['on_bootstrap']:
+                _settings['on_bootstrap'](db)
+        finally:
+            db.close()
+        _bootstrapped.add(path)
+
+
+def schema_version(db):
+    """Текущая версия схемы (0 - пустая БД)"""
+    db.execute("CREATE TABLE IF NOT EXISTS schema_version (version INTEGER NOT NULL)")
+    row = db.execute("SELECT MAX(version) FROM schema_version").fetchone()
+    if row[0] is not None:
+        return row[0]
+    # БД, созданная до появления версий: таблицы есть, версии нет
+    legacy = db.execute(
+        "SELECT 1 FROM sqlite_master WHERE type='table' AND name='servers'"
+    ).fetchone()
+    return 1 if legacy else 0
+
+
+def migrate(db):
+    """Применение недостающих миграций"""
+    current = schema_version(db)
+    for version, sql in MIGRATIONS:
+        if version <= current:
+            continue
+        if version == 1:
+            with open(_settings['schema_path'], encoding='utf-8') as f:
+                sql = f.read()
+        db.executescript(sql)
+        db.execute("INSERT INTO schema_version (version) VALUES (?)", (version,))
+        db.commit()
+        current = version
+    if not db.execute("SELECT 1 FROM schema_version").fetchone():
+        db.execute("INSERT INTO schema_version (version) VALUES (?)", (current,))
+        db.commit()
+    return current
+
+
 @contextlib.contextmanager
 def db_connection():
     """Контекстный менеджер для работы с БД"""
@@ -17,11 +322,11 @@ def db_connection():
     finally:
         db.close()
 
+
 def init_db():
     """Инициализация БД"""
-    with db_connection() as db, open(Config.SCHEMA_PATH) as f:
-        db.executescript(f.read())
-        db.commit()
+    bootstrap()
+
 
 def query_db(query, args=(), one=False):
     """Выполнение запроса к БД"""
@@ -30,8 +335,9 @@ def query_db(query, args=(), one=False):
         rv = cur.fetchall()
         return (rv[0] if rv else None) if one else rv
 
+
 def execute_db(query, args=()):
     """Выполнение запроса без возврата данных"""
     with db_connection() as db:
         db.execute(query, args)
-        db.commit()
\ No newline at end of file
+        db.commit()
@@ -0,0 +1,19 @@
+import multiprocessing
+
+from config import Config
+
+bind = f'0.0.0.0:{Config.PORT}'
+workers = multiprocessing.cpu_count()
+# Поток на запрос; долгие /api/stream ограничены так, чтобы
+# STREAM_RESERVED_THREADS потоков всегда оставались остальным запросам
+worker_class = 'gthread'
+threads = Config.WORKER_THREADS
+# Без preload: фоновые потоки каждого процесса стартуют уже после fork
+preload_app = False
+graceful_timeout = 15
+
+
+def worker_exit(server, worker):
+    # Сброс очереди замеров и освобождение аренды лидера
+    from app import shutdown
+    shutdown()
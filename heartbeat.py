@@ -0,0 +1,110 @@
+import heapq
+import threading
+import time
+
+
+class HeartbeatWatchdog:
+    """Отслеживание серверов, агенты которых перестали присылать замеры.
+
+    Время последнего замера хранится в памяти, сроки проверки - в куче
+    дедлайнов (не больше одной записи на сервер). tick() снимает только
+    наступившие дедлайны: если замер пришел позже, дедлайн переносится,
+    иначе сервер считается молчащим. Первый замер после этого
+    возвращает сервер в строй.
+    """
+
+    def __init__(self, timeout, on_stale, on_alive, clock=time.monotonic):
+        self.timeout = timeout
+        self.on_stale = on_stale
+        self.on_alive = on_alive
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._last_seen = {}
+        self._stale = set()
+        self._scheduled = set()
+        self._deadlines = []
+
+    def __len__(self):
+        return len(self._last_seen)
+
+    def _schedule(self, server_id, deadline):
+        if server_id not in self._scheduled:
+            self._scheduled.add(server_id)
+            heapq.heappush(self._deadlines, (deadline, server_id))
+
+    def track(self, server_id, stale=False):
+        """Начать отслеживание; отсчет молчания идет с текущего момента"""
+        with self._lock:
+            if server_id in self._last_seen:
+                return
+            self._last_seen[server_id] = self._clock()
+            if stale:
+                self._stale.add(server_id)
+            else:
+                self._schedule(server_id, self._last_seen[server_id] + self.timeout)
+
+    def sync(self, servers):
+        """Сверка со списком {server_id: stale} из БД.
+
+        Новые серверы начинают отслеживаться, удаленные забываются, а у
+        известных флаг stale приводится к сохраненному - после смены
+        лидера БД могла пометить сервер иначе, чем этот процесс.
+        """
+        now = self._clock()
+        with self._lock:
+            for server_id in set(self._last_seen) - set(servers):
+                self._forget(server_id)
+            for server_id, stale in servers.items():
+                if server_id not in self._last_seen:
+                    self._last_seen[server_id] = now
+                if stale:
+                    self._stale.add(server_id)
+                    continue
+                if server_id in self._stale:
+                    # Снова на связи по данным БД: отсчет молчания заново
+                    self._stale.discard(server_id)
+                    self._last_seen[server_id] = now
+                self._schedule(server_id, self._last_seen[server_id] + self.timeout)
+
+    def _forget(self, server_id):
+        # Запись в куче станет ненужной и отбросится при снятии
+        self._last_seen.pop(server_id, None)
+        self._stale.discard(server_id)
+
+    def forget(self, server_id):
+        with self._lock:
+            self._forget(server_id)
+
+    def beat(self, server_ids):
+        """Замеры от серверов пришли сейчас"""
+        now = self._clock()
+        revived = []
+        with self._lock:
+            for server_id in server_ids:
+                self._last_seen[server_id] = now
+                if server_id in self._stale:
+                    self._stale.discard(server_id)
+                    revived.append(server_id)
+                self._schedule(server_id, now + self.timeout)
+        if revived:
+            self.on_alive(revived)
+
+    def tick(self):
+        """Проверка наступивших дедлайнов; O(число снятых записей)"""
+        now = self._clock()
+        expired = []
+        with self._lock:
+            while self._deadlines and self._deadlines[0][0] <= now:
+                _, server_id = heapq.heappop(self._deadlines)
+                self._scheduled.discard(server_id)
+                last_seen = self._last_seen.get(server_id)
+                if last_seen is None or server_id in self._stale:
+                    continue
+                if now - last_seen >= self.timeout:
+                    self._stale.add(server_id)
+                    expired.append(server_id)
+                else:
+                    self._schedule(server_id, last_seen + self.timeout)
+        if expired:
+            self.on_stale(expired)
+        return expired
@@ -0,0 +1,309 @@
+import base64
+import fcntl
+import json
+import mmap
+import os
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+import numpy as np
+
+import analytics
+import retention
+from instrumentation import registry
+from wire import from_epoch, to_epoch
+
+# Запись файлового хранилища: время замера (epoch) и нагрузка
+RECORD = np.dtype([('epoch', '<f8'), ('load', '<f4')])
+
+
+class SQLiteHistory:
+    """История нагрузки в таблице server_load_history (по умолчанию).
+
+    Методы с db работают в транзакции вызывающего; окно истории
+    поддерживается удалением всего, что старше window замеров.
+    """
+
+    def append(self, db, samples):
+        db.executemany(
+            """INSERT INTO server_load_history
+            (server_id, load_value, timestamp)
+            VALUES (?, ?, ?)""",
+            [(s['server_id'], s['load'], s['timestamp']) for s in samples]
+        )
+
+    def trim(self, db, server_ids, window):
+        retention.trim_history(db, server_ids, window)
+
+    def recent(self, db, window):
+        """Последние window замеров каждого сервера: [(server_id, timestamp, load), ...]"""
+        rows = db.execute("""
+            SELECT server_id, timestamp, load_value FROM (
+                SELECT server_id, load_value, timestamp,
+                       ROW_NUMBER() OVER (
+                           PARTITION BY server_id ORDER BY timestamp DESC
+                       ) AS rn
+                FROM server_load_history
+            )
+            WHERE rn <= ?
+            ORDER BY server_id, timestamp
+        """, (window,)).fetchall()
+        return [tuple(row) for row in rows]
+
+    def range(self, db, server_id, start, end):
+        """Замеры сервера в [start, end) как массивы (epochs, loads)"""
+        cur = db.cursor()
+        cur.row_factory = None
+        cur.execute("""
+            SELECT timestamp, load_value FROM server_load_history
+            WHERE server_id = ? AND timestamp >= ? AND timestamp < ?
+            ORDER BY timestamp
+        """, (server_id, from_epoch(start), from_epoch(end)))
+        rows = cur.fetchall()
+        epochs = np.fromiter((to_epoch(ts) for ts, _ in rows), dtype=np.float64, count=len(rows))
+        loads = np.fromiter((load for _, load in rows), dtype=np.float64, count=len(rows))
+        return epochs, loads
+
+    def arrays(self, db):
+        return analytics.load_history(db)
+
+    def purge(self, db, retention_hours, batch_size):
+        return retention.purge_expired(db, retention_hours, batch_size)
+
+    def delete_server(self, db, server_id):
+        db.execute("DELETE FROM server_load_history WHERE server_id = ?", (server_id,))
+
+    def changes(self, db, cursor, limit=5000):
+        """Замеры, записанные после cursor (в том числе другими процессами)"""
+        if cursor is None:
+            return [], db.execute("SELECT COALESCE(MAX(id), 0) FROM server_load_history").fetchone()[0]
+        rows = db.execute("""
+            SELECT id, server_id, load_value, timestamp FROM server_load_history
+            WHERE id > ? ORDER BY id LIMIT ?
+        """, (cursor, limit)).fetchall()
+        samples = [
+            {'server_id': row['server_id'], 'load': row['load_value'], 'timestamp': row['timestamp']}
+            for row in rows
+        ]
+        return samples, rows[-1]['id'] if rows else cursor
+
+    def since(self, db, cursor, server_ids=None, limit=5000):
+        """Замеры после cursor (id последнего) по серверам: {server_id: (epochs, loads)}.
+
+        Без cursor возвращает только текущую позицию. Третий элемент -
+        True, если замеров больше limit и нужен следующий запрос.
+        """
+        if cursor is None:
+            return {}, db.execute("SELECT COALESCE(MAX(id), 0) FROM server_load_history").fetchone()[0], False
+        if not isinstance(cursor, int):
+            raise ValueError('Invalid cursor')
+        params = [cursor]
+        condition = ''
+        if server_ids:
+            condition = f"AND server_id IN ({','.join('?' * len(server_ids))})"
+            params += list(server_ids)
+        cur = db.cursor()
+        cur.row_factory = None
+        rows = cur.execute(f"""
+            SELECT id, server_id, timestamp, load_value FROM server_load_history
+            WHERE id > ? {condition} ORDER BY id LIMIT ?
+        """, params + [limit]).fetchall()
+        series = {}
+        for _, server_id, timestamp, load in rows:
+            epochs, loads = series.setdefault(server_id, ([], []))
+            epochs.append(to_epoch(timestamp))
+            loads.append(load)
+        return series, rows[-1][0] if rows else cursor, len(rows) == limit
+
+
+class FileHistory:
+    """История нагрузки в файлах: по файлу записей RECORD на сервер.
+
+    Запись - только дописывание в конец, чтение - через mmap и
+    np.frombuffer без копирования; диапазон ищется бинарным поиском по
+    epoch. Поэтому в файл попадают только замеры новее последнего
+    записанного, опоздавшие отбрасываются (как в TSDB). Окно истории
+    не обрезается на каждой записи: старое удаляет purge() по времени.
+    """
+
+    def __init__(self, directory):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        for server_id in self._server_ids():
+            with self._locked(server_id), open(self._path(server_id), 'r+b') as f:
+                self._drop_partial(f)
+
+    @staticmethod
+    def _drop_partial(f):
+        """Обрезка недописанной (после сбоя) записи в конце файла; размер файла"""
+        size = f.seek(0, os.SEEK_END)
+        if size % RECORD.itemsize:
+            size -= size % RECORD.itemsize
+            f.truncate(size)
+        return size
+
+    def _path(self, server_id):
+        return self.directory / f'{int(server_id)}.bin'
+
+    @contextmanager
+    def _locked(self, server_id):
+        # Блокировка на отдельном файле: сам файл данных purge() подменяет
+        with self._lock, open(self.directory / f'{int(server_id)}.lock', 'a') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _records(self, server_id):
+        """Все записи сервера - представление над mmap, без копирования"""
+        try:
+            with open(self._path(server_id), 'rb') as f:
+                size = os.fstat(f.fileno()).st_size
+                if size < RECORD.itemsize:
+                    return np.empty(0, dtype=RECORD)
+                mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except FileNotFoundError:
+            return np.empty(0, dtype=RECORD)
+        # Недописанный хвост параллельной записи не читаем
+        return np.frombuffer(mapped, dtype=RECORD, count=size // RECORD.itemsize)
+
+    def _server_ids(self):
+        return sorted(int(path.stem) for path in self.directory.glob('*.bin'))
+
+    def append(self, db, samples):
+        by_server = {}
+        for s in samples:
+            by_server.setdefault(s['server_id'], []).append((s['epoch'], s['load']))
+        for server_id, points in by_server.items():
+            points.sort()
+            with self._locked(server_id):
+                path = self._path(server_id)
+                with open(path, 'a+b') as f:
+                    # Иначе новые записи легли бы со сдвигом после обрывка
+                    size = self._drop_partial(f)
+                    last_epoch = -np.inf
+                    if size >= RECORD.itemsize:
+                        tail = os.pread(f.fileno(), RECORD.itemsize, size - RECORD.itemsize)
+                        last_epoch = np.frombuffer(tail, dtype=RECORD)[0]['epoch']
+                    records = np.array([p for p in points if p[0] > last_epoch], dtype=RECORD)
+                    if len(records) < len(points):
+                        registry.inc('history_out_of_order_total', len(points) - len(records))
+                    f.write(records.tobytes())
+
+    def trim(self, db, server_ids, window):
+        pass
+
+    def recent(self, db, window):
+        result = []
+        for server_id in self._server_ids():
+            for epoch, load in self._records(server_id)[-window:].tolist():
+                result.append((server_id, from_epoch(epoch), int(load)))
+        return result
+
+    def range(self, db, server_id, start, end):
+        records = self._records(server_id)
+        lo, hi = np.searchsorted(records['epoch'], [start, end])
+        return records['epoch'][lo:hi], records['load'][lo:hi]
+
+    def arrays(self, db):
+        ids, epochs, loads = [], [], []
+        for server_id in self._server_ids():
+            records = self._records(server_id)
+            ids.append(np.full(len(records), server_id, dtype=np.int64))
+            epochs.append(records['epoch'])
+            loads.append(records['load'].astype(np.float64))
+        if not ids:
+            return np.empty(0, np.int64), np.empty(0), np.empty(0)
+        return np.concatenate(ids), np.concatenate(epochs), np.concatenate(loads)
+
+    def purge(self, db, retention_hours, batch_size):
+        """Перезапись файлов без записей старше окна хранения"""
+        cutoff = time.time() - retention_hours * 3600
+        deleted = 0
+        for server_id in self._server_ids():
+            with self._locked(server_id):
+                records = self._records(server_id)
+                drop = int(np.searchsorted(records['epoch'], cutoff))
+                if not drop:
+                    continue
+                path = self._path(server_id)
+                tmp_path = path.with_suffix('.tmp')
+                with open(tmp_path, 'wb') as f:
+                    f.write(records[drop:].tobytes())
+                os.replace(tmp_path, path)
+                deleted += drop
+        return deleted
+
+    def delete_server(self, db, server_id):
+        with self._locked(server_id):
+            self._path(server_id).unlink(missing_ok=True)
+        (self.directory / f'{int(server_id)}.lock').unlink(missing_ok=True)
+
+    def changes(self, db, cursor, limit=5000):
+        """Записи, дописанные после cursor ({server_id: epoch последней записи}).
+
+        Курсор по времени, а не по смещению, переживает перезапись файла в purge().
+        """
+        last_epochs = {}
+        samples = []
+        for server_id in self._server_ids():
+            records = self._records(server_id)
+            if not len(records):
+                continue
+            last_epochs[server_id] = float(records['epoch'][-1])
+            if cursor is None:
+                continue
+            start = np.searchsorted(records['epoch'], cursor.get(server_id, -np.inf), side='right')
+            for epoch, load in records[start:].tolist():
+                samples.append({'server_id': server_id, 'load': int(load), 'timestamp': from_epoch(epoch)})
+        return samples, last_epochs
+
+    def since(self, db, cursor, server_ids=None, limit=5000):
+        """Записи после cursor ({server_id: epoch}) - срезы массивов без обхода по строкам"""
+        if cursor is not None and not isinstance(cursor, dict):
+            raise ValueError('Invalid cursor')
+        # Ключи курсора после JSON - строки
+        position = {int(server_id): epoch for server_id, epoch in (cursor or {}).items()}
+        series, total, more = {}, 0, False
+        for server_id in server_ids or self._server_ids():
+            records = self._records(server_id)
+            if not len(records):
+                continue
+            if cursor is None:
+                position[server_id] = float(records['epoch'][-1])
+                continue
+            start = np.searchsorted(records['epoch'], position.get(server_id, -np.inf), side='right')
+            chunk = records[start:start + limit - total]
+            if len(chunk):
+                series[server_id] = (chunk['epoch'].tolist(), chunk['load'].astype(np.int64).tolist())
+                position[server_id] = float(chunk['epoch'][-1])
+                total += len(chunk)
+            if total >= limit:
+                more = True
+                break
+        return series, position, more
+
+
+def dump_cursor(cursor):
+    """Курсор хранилища (id или словарь epoch) -> непрозрачная строка для клиента"""
+    return base64.urlsafe_b64encode(json.dumps(cursor, separators=(',', ':')).encode()).decode()
+
+
+def load_cursor(value):
+    try:
+        return json.loads(base64.urlsafe_b64decode(value.encode()))
+    except (ValueError, UnicodeDecodeError):
+        raise ValueError('Invalid cursor')
+
+
+def create_backend(config):
+    """Хранилище истории по Config.HISTORY_BACKEND"""
+    if config['HISTORY_BACKEND'] == 'sqlite':
+        return SQLiteHistory()
+    if config['HISTORY_BACKEND'] == 'mmap':
+        return FileHistory(config['HISTORY_DIR'])
+    raise ValueError(f"Unknown history backend: {config['HISTORY_BACKEND']}")
@@ -0,0 +1,85 @@
+import gzip
+import hashlib
+import os
+from functools import lru_cache
+
+from flask import Response
+
+# Сжимаем только текстовые ответы: картинки и так сжаты
+COMPRESSIBLE_MIMETYPES = {'application/json', 'text/html', 'text/csv', 'text/plain', 'text/css',
+                          'application/javascript', 'text/javascript'}
+
+
+class CachedBody:
+    """Тело ответа, готовое к повторной отдаче.
+
+    ETag (хэш тела) и gzip-версия вычисляются один раз на сборку тела,
+    то есть на версию снимка, а не на каждый запрос.
+    """
+
+    __slots__ = ('body', 'mimetype', 'etag', 'last_modified', '_gzipped')
+
+    def __init__(self, body, mimetype, last_modified=None):
+        self.body = body.encode() if isinstance(body, str) else body
+        self.mimetype = mimetype
+        self.etag = hashlib.blake2b(self.body, digest_size=12).hexdigest()
+        self.last_modified = last_modified
+        self._gzipped = None
+
+    def gzipped(self, level):
+        # Гонка двух потоков безвредна: оба получат одинаковый результат
+        if self._gzipped is None:
+            self._gzipped = gzip.compress(self.body, level)
+        return self._gzipped
+
+
+def wants_gzip(request, size, min_size):
+    return size >= min_size and 'gzip' in request.accept_encodings
+
+
+def cached_response(entry, request, min_size, level):
+    """Ответ из CachedBody: 304 при совпадении ETag/Last-Modified, иначе тело (возможно, сжатое)"""
+    compressed = wants_gzip(request, len(entry.body), min_size)
+    response = Response(entry.gzipped(level) if compressed else entry.body, mimetype=entry.mimetype)
+    # У сжатого представления свой ETag - это другие байты
+    response.set_etag(entry.etag + ('-gz' if compressed else ''))
+    if compressed:
+        response.headers['Content-Encoding'] = 'gzip'
+    if entry.last_modified is not None:
+        response.last_modified = entry.last_modified
+    # Кэшировать можно, но перед использованием - перепроверять
+    response.cache_control.no_cache = True
+    response.vary.add('Accept-Encoding')
+    return response.make_conditional(request)
+
+
+def compress_response(response, request, min_size, level):
+    """gzip для обычного (не потокового) текстового ответа крупнее min_size"""
+    if (response.status_code != 200 or response.direct_passthrough or response.is_streamed
+            or 'Content-Encoding' in response.headers
+            or response.mimetype not in COMPRESSIBLE_MIMETYPES):
+        return response
+    response.vary.add('Accept-Encoding')
+    body = response.get_data()
+    if wants_gzip(request, len(body), min_size):
+        response.set_data(gzip.compress(body, level))
+        response.headers['Content-Encoding'] = 'gzip'
+    return response
+
+
+@lru_cache(maxsize=256)
+def _file_hash(path, mtime, size):
+    hasher = hashlib.blake2b(digest_size=6)
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(65536), b''):
+            hasher.update(chunk)
+    return hasher.hexdigest()
+
+
+def file_hash(path):
+    """Короткий хэш содержимого файла (пересчитывается при его изменении)"""
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return _file_hash(path, stat.st_mtime_ns, stat.st_size)
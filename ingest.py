@@ -0,0 +1,285 @@
+import atexit
+import logging
+import math
+import re
+import sqlite3
+import threading
+import time
+from collections import deque
+
+from history import SQLiteHistory
+from instrumentation import registry
+from rollups import rollup_samples
+from wire import check_epoch, from_epoch, to_epoch
+
+logger = logging.getLogger(__name__)
+
+METRIC_NAME = re.compile(r'^[a-z][a-z0-9_]{0,31}$')
+MAX_METRICS_PER_SAMPLE = 32
+
+
+class QueueFull(Exception):
+    """Очередь отложенной записи переполнена"""
+
+
+def is_transient(error) -> bool:
+    """Ошибка записи, которая проходит сама (занятая БД), а не из-за данных"""
+    if not isinstance(error, sqlite3.OperationalError):
+        return False
+    message = str(error).lower()
+    return 'locked' in message or 'busy' in message
+
+
+def validate_sample(data: dict) -> dict:
+    """Проверка и нормализация одного замера нагрузки (время - 'epoch' или ISO 'timestamp')"""
+    try:
+        server_id = int(data['server_id'])
+        load = float(data['load'])
+        if not math.isfinite(load):
+            raise ValueError('Invalid sample')
+        load = int(round(load))
+        if 'epoch' in data:
+            # Кадр v1 передает время числом - строку собираем один раз, без разбора
+            epoch = check_epoch(float(data['epoch']))
+        else:
+            epoch = check_epoch(to_epoch(str(data['timestamp'])))
+        # В историю пишется только одна форма времени (from_epoch, UTC):
+        # отбор по диапазонам и хранению сравнивает строки
+        timestamp = from_epoch(epoch)
+    except (KeyError, TypeError, ValueError, OverflowError):
+        raise ValueError('Invalid sample')
+    if server_id <= 0 or not 0 <= load <= 100:
+        raise ValueError('Invalid sample')
+
+    # Дополнительные метрики: произвольные имена, только числовые значения
+    metrics = data.get('metrics') or {}
+    if not isinstance(metrics, dict) or len(metrics) > MAX_METRICS_PER_SAMPLE:
+        raise ValueError('Invalid metrics')
+    clean_metrics = {}
+    for name, value in metrics.items():
+        if not isinstance(name, str) or not METRIC_NAME.match(name):
+            raise ValueError('Invalid metrics')
+        try:
+            value = float(value)
+        except (TypeError, ValueError):
+            raise ValueError('Invalid metrics')
+        if math.isfinite(value):
+            clean_metrics[name] = value
+
+    return {
+        'server_id': server_id,
+        'load': load,
+        'timestamp': timestamp,
+        'epoch': epoch,
+        'metrics': clean_metrics,
+    }
+
+
+def store_samples(db, samples, history_window=40, rollup_tiers=(), history=None, archive=None):
+    """Запись пачки замеров одной транзакцией"""
+    history = history or SQLiteHistory()
+    history.append(db, samples)
+
+    # Для current_load достаточно последнего значения по каждому серверу
+    latest = {}
+    for s in samples:
+        latest[s['server_id']] = s['load']
+    db.executemany(
+        "UPDATE servers SET current_load = ? WHERE id = ?",
+        [(load, server_id) for server_id, load in latest.items()]
+    )
+
+    # Метрики хранятся строками (сервер, имя, значение), без колонки на метрику
+    metric_rows = [
+        (s['server_id'], name, value, s['timestamp'])
+        for s in samples
+        for name, value in s['metrics'].items()
+    ]
+    if metric_rows:
+        db.executemany(
+            """INSERT INTO server_metrics (server_id, metric, value, timestamp)
+            VALUES (?, ?, ?, ?)""",
+            metric_rows
+        )
+        db.executemany(
+            """INSERT INTO server_metrics_latest (server_id, metric, value, timestamp)
+            VALUES (?, ?, ?, ?)
+            ON CONFLICT (server_id, metric) DO UPDATE SET
+                value = excluded.value, timestamp = excluded.timestamp
+            WHERE excluded.timestamp >= server_metrics_latest.timestamp""",
+            metric_rows
+        )
+
+    # Агрегаты для длинных диапазонов графиков
+    if rollup_tiers:
+        rollup_samples(db, samples, rollup_tiers)
+    if archive is not None:
+        archive.append(db, samples)
+
+    # Чистим старые данные один раз на сервер, а не на каждый замер
+    history.trim(db, latest, history_window)
+
+    db.commit()
+
+
+class IngestQueue:
+    """Очередь отложенной записи (write-behind) замеров нагрузки.
+
+    Эндпоинт только кладет замер в очередь, а фоновый поток сбрасывает
+    накопленное в БД раз в flush_interval секунд или по batch_size замеров.
+    Пачка, которую не удалось записать, возвращается в начало очереди:
+    при занятой БД - без ограничений, при прочих ошибках - max_retries раз,
+    после чего пачка пишется по половинам и отбрасывается только замер,
+    который не записывается сам по себе.
+    """
+
+    def __init__(self, connect, max_size=10000, batch_size=500, flush_interval=0.5,
+                 history_window=40, rollup_tiers=(), on_stored=None, history=None, archive=None,
+                 max_retries=3):
+        self._connect = connect
+        self.history = history
+        self.archive = archive
+        self.history_window = history_window
+        self.rollup_tiers = rollup_tiers
+        self.on_stored = on_stored
+        self.max_size = max_size
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_retries = max_retries
+        self._items = deque()
+        self._cond = threading.Condition()
+        self._flush_lock = threading.Lock()
+        self._thread = None
+        self._stopping = False
+        # Неудачные попытки подряд для пачки в начале очереди
+        self._attempts = 0
+
+    def __len__(self):
+        return len(self._items)
+
+    def start(self):
+        """Запуск фонового потока сброса (повторный вызов безопасен)"""
+        with self._cond:
+            if self._thread and self._thread.is_alive():
+                return
+            self._stopping = False
+            self._thread = threading.Thread(target=self._run, name='ingest-flusher', daemon=True)
+            self._thread.start()
+
+    def put_many(self, samples):
+        """Постановка замеров в очередь; QueueFull если места не хватает"""
+        if self._thread is None or not self._thread.is_alive():
+            self.start()
+        with self._cond:
+            if len(self._items) + len(samples) > self.max_size:
+                raise QueueFull()
+            self._items.extend(samples)
+            if len(self._items) >= self.batch_size:
+                self._cond.notify()
+
+    def put(self, sample):
+        self.put_many([sample])
+
+    def _take(self):
+        with self._cond:
+            count = min(len(self._items), self.batch_size)
+            return [self._items.popleft() for _ in range(count)]
+
+    def _requeue(self, batch):
+        # Возвращаем пачку в начало очереди, чтобы не потерять замеры
+        with self._cond:
+            room = self.max_size - len(self._items)
+            if room < len(batch):
+                logger.error("Ingest queue overflow, dropped %d samples", len(batch) - room)
+                batch = batch[len(batch) - room:] if room > 0 else []
+            self._items.extendleft(reversed(batch))
+
+    def _store(self, batch):
+        db = self._connect()
+        try:
+            with registry.timer('ingest_flush_duration_seconds'):
+                store_samples(db, batch, self.history_window, self.rollup_tiers, self.history,
+                              self.archive)
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+        if self.on_stored:
+            self.on_stored(batch)
+
+    def _isolate(self, batch):
+        """Запись пачки по половинам; незаписываемые замеры отбрасываются"""
+        pending = [batch]
+        while pending:
+            part = pending.pop()
+            try:
+                self._store(part)
+            except Exception as e:
+                if is_transient(e):
+                    # Остаток, включая еще не записанные половины, - обратно в очередь
+                    self._requeue(part + [s for rest in reversed(pending) for s in rest])
+                    raise
+                if len(part) > 1:
+                    middle = len(part) // 2
+                    pending.extend((part[middle:], part[:middle]))
+                    continue
+                registry.inc('ingest_rejected_samples_total', reason='store_failed')
+                logger.error("Dropped sample that cannot be stored: %r (%s)", part[0], e)
+
+    def flush(self):
+        """Сброс всего содержимого очереди в БД"""
+        with self._flush_lock:
+            while True:
+                batch = self._take()
+                if not batch:
+                    return
+                if self._attempts >= self.max_retries:
+                    self._attempts = 0
+                    self._isolate(batch)
+                    continue
+                try:
+                    self._store(batch)
+                except Exception as e:
+                    if not is_transient(e):
+                        self._attempts += 1
+                    self._requeue(batch)
+                    raise
+                self._attempts = 0
+
+    def _run(self):
+        while True:
+            with self._cond:
+                deadline = time.monotonic() + self.flush_interval
+                while not self._stopping and len(self._items) < self.batch_size:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+                stopping = self._stopping
+            if stopping:
+                return
+            try:
+                self.flush()
+            except Exception as e:
+                logger.error(f"Ingest flush error: {e}", exc_info=True)
+
+    def stop(self):
+        """Остановка потока и финальный сброс очереди"""
+        with self._cond:
+            self._stopping = True
+            self._cond.notify()
+        if self._thread:
+            self._thread.join(timeout=10)
+        # Сбойная пачка успевает дойти до записи по половинам
+        for _ in range(self.max_retries + 1):
+            try:
+                self.flush()
+                return
+            except Exception as e:
+                logger.error(f"Ingest final flush error: {e}", exc_info=True)
+        if self._items:
+            logger.error("Ingest queue stopped with %d unsaved samples", len(self._items))
+
+    def register_shutdown(self):
+        atexit.register(self.stop)
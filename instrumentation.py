@@ -0,0 +1,217 @@
+import re
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from functools import lru_cache
+
+# Границы корзин гистограмм задержек, секунды
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+
+class _Shard:
+    """Счетчики одного потока: пишет только поток-владелец, без блокировок"""
+
+    __slots__ = ('counters', 'histograms')
+
+    def __init__(self):
+        self.counters = {}
+        self.histograms = {}
+
+    def merge(self, other):
+        for key, value in list(other.counters.items()):
+            self.counters[key] = self.counters.get(key, 0) + value
+        for key, values in list(other.histograms.items()):
+            values = list(values)
+            mine = self.histograms.get(key)
+            if mine is None:
+                self.histograms[key] = values
+            else:
+                for i, value in enumerate(values):
+                    mine[i] += value
+
+
+class Registry:
+    """Метрики процесса в текстовом формате Prometheus.
+
+    Счетчики и гистограммы пишутся в шард текущего потока, поэтому
+    горячий путь не берет блокировок; при выдаче /metrics шарды
+    суммируются. Шарды завершившихся потоков сворачиваются в общий,
+    чтобы поток-на-запрос не раздувал память.
+    """
+
+    FOLD_EVERY = 64
+
+    def __init__(self):
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._shards = []
+        self._retired = _Shard()
+        self._gauges = {}
+        self._callbacks = {}
+        self._kinds = {}
+        self._help = {}
+        self._buckets = {}
+
+    def describe(self, name, kind, help_text, buckets=None):
+        self._kinds[name] = kind
+        self._help[name] = help_text
+        if buckets is not None:
+            self._buckets[name] = tuple(buckets)
+
+    def _shard(self):
+        shard = getattr(self._local, 'shard', None)
+        if shard is None:
+            shard = self._local.shard = _Shard()
+            with self._lock:
+                self._shards.append((threading.current_thread(), shard))
+                if len(self._shards) % self.FOLD_EVERY == 0:
+                    self._fold_dead()
+        return shard
+
+    def _fold_dead(self):
+        alive = []
+        for thread, shard in self._shards:
+            if thread.is_alive():
+                alive.append((thread, shard))
+            else:
+                self._retired.merge(shard)
+        self._shards = alive
+
+    def inc(self, name, value=1, **labels):
+        counters = self._shard().counters
+        key = (name, tuple(sorted(labels.items())))
+        counters[key] = counters.get(key, 0) + value
+
+    def observe(self, name, value, **labels):
+        histograms = self._shard().histograms
+        buckets = self._buckets.get(name, LATENCY_BUCKETS)
+        key = (name, tuple(sorted(labels.items())))
+        values = histograms.get(key)
+        if values is None:
+            # Корзины (последняя - +Inf), затем сумма и количество
+            values = histograms[key] = [0] * (len(buckets) + 3)
+        values[bisect_left(buckets, value)] += 1
+        values[-2] += value
+        values[-1] += 1
+
+    def set_gauge(self, name, value, **labels):
+        self._gauges[(name, tuple(sorted(labels.items())))] = value
+
+    def gauge_callback(self, name, func):
+        """Датчик, значение которого вычисляется при выдаче метрик"""
+        self._callbacks[name] = func
+
+    @contextmanager
+    def timer(self, name, **labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - started, **labels)
+
+    @contextmanager
+    def task_run(self, task):
+        """Длительность и время последнего запуска фоновой задачи"""
+        started = time.perf_counter()
+        try:
+            yield
+        except Exception:
+            self.inc('background_task_failures_total', task=task)
+            raise
+        finally:
+            self.observe('background_task_duration_seconds', time.perf_counter() - started, task=task)
+            self.set_gauge('background_task_last_run_timestamp_seconds', time.time(), task=task)
+
+    def collect(self):
+        """Сумма шардов всех потоков"""
+        total = _Shard()
+        with self._lock:
+            self._fold_dead()
+            total.merge(self._retired)
+            for _, shard in self._shards:
+                total.merge(shard)
+        return total
+
+    def render(self):
+        total = self.collect()
+        series = {}
+        for (name, labels), value in total.counters.items():
+            series.setdefault(name, []).append((name, labels, value))
+        for (name, labels), values in total.histograms.items():
+            buckets = self._buckets.get(name, LATENCY_BUCKETS)
+            cumulative = 0
+            lines = series.setdefault(name, [])
+            for bound, count in zip(buckets + ('+Inf',), values):
+                cumulative += count
+                lines.append((f'{name}_bucket', labels + (('le', str(bound)),), cumulative))
+            lines.append((f'{name}_sum', labels, values[-2]))
+            lines.append((f'{name}_count', labels, values[-1]))
+        for (name, labels), value in list(self._gauges.items()):
+            series.setdefault(name, []).append((name, labels, value))
+        for name, func in list(self._callbacks.items()):
+            series.setdefault(name, []).append((name, (), func()))
+
+        out = []
+        for name in sorted(series):
+            if name in self._help:
+                out.append(f'# HELP {name} {self._help[name]}')
+                out.append(f'# TYPE {name} {self._kinds[name]}')
+            for sample_name, labels, value in series[name]:
+                out.append(f'{sample_name}{_format_labels(labels)} {_format_value(value)}')
+        return '\n'.join(out) + '\n'
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{key}="{_escape(value)}"' for key, value in labels) + '}'
+
+
+def _format_value(value):
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+_WHITESPACE = re.compile(r'\s+')
+_NUMBER = re.compile(r'\b\d+(\.\d+)?\b')
+# Списки параметров переменной длины: IN (?, ?, ...) и VALUES (?, ?), (?, ?), ...
+_PLACEHOLDER_LIST = re.compile(r'\(\s*\?(?:\s*,\s*\?)*\s*\)')
+_PLACEHOLDER_ROWS = re.compile(r'\(\?…\)(?:\s*,\s*\(\?…\))+')
+
+
+@lru_cache(maxsize=1024)
+def statement_template(sql):
+    """Шаблон SQL-запроса для группировки: без лишних пробелов и литералов-чисел.
+
+    Списки плейсхолдеров любой длины сворачиваются в (?…), чтобы пачки
+    разного размера не порождали отдельные серии метрик.
+    """
+    template = _NUMBER.sub('?', _WHITESPACE.sub(' ', sql).strip())
+    template = _PLACEHOLDER_ROWS.sub('(?…)', _PLACEHOLDER_LIST.sub('(?…)', template))
+    return template[:200]
+
+
+registry = Registry()
+registry.describe('http_requests_total', 'counter', 'HTTP requests by endpoint, method and status')
+registry.describe('http_request_duration_seconds', 'histogram', 'HTTP request latency by endpoint')
+registry.describe('db_statement_duration_seconds', 'histogram', 'SQL statement execution time by template')
+registry.describe('ingest_samples_total', 'counter', 'Load samples accepted from agents')
+registry.describe('ingest_rejected_samples_total', 'counter', 'Load samples rejected by reason')
+registry.describe('ingest_decrypt_failures_total', 'counter', 'Agent payloads that failed to decrypt')
+registry.describe('ingest_listener_frames_total', 'counter', 'Frames received by the UDP/TCP ingest listener by result')
+registry.describe('ingest_flush_duration_seconds', 'histogram', 'Write-behind queue flush time')
+registry.describe('background_task_duration_seconds', 'histogram', 'Background task run time')
+registry.describe('background_task_last_run_timestamp_seconds', 'gauge', 'Unix time of the last background task run')
+registry.describe('background_task_failures_total', 'counter', 'Background task runs that raised')
+registry.describe('ingest_queue_depth', 'gauge', 'Samples waiting in the write-behind queue')
+registry.describe('stream_clients', 'gauge', 'Connected /api/stream clients')
+registry.describe('stream_dropped_clients_total', 'counter', 'Stream clients dropped for falling behind')
+registry.describe('snapshot_version', 'gauge', 'In-memory server snapshot version')
+registry.describe('history_archive_dropped_total', 'counter', 'Samples not archived as not newer than the last one in their block')
+registry.describe('history_out_of_order_total', 'counter', 'Samples dropped by the file history store as older than the stored tail')
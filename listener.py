@@ -0,0 +1,191 @@
+import logging
+import socket
+import socketserver
+import threading
+
+import wire
+from ingest import QueueFull
+from instrumentation import registry
+from ratelimit import RateLimited
+
+logger = logging.getLogger(__name__)
+
+
+def _reuse_port(sock):
+    # Под gunicorn каждый процесс слушает тот же порт, ядро делит нагрузку
+    if hasattr(socket, 'SO_REUSEPORT'):
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+
+
+class FrameListener:
+    """Прием кадров v1 от агентов без HTTP.
+
+    До расшифровки кадр проходит admit(client) (лимит на адрес, как у
+    HTTP-маршрутов - мусор не должен стоить AES), затем проверяется и
+    расшифровывается (wire.decode_frame), замеры передаются в
+    handle(raw_samples, client) - тот же путь проверок и записи, что у
+    /api/update_load_batch. Исход каждого кадра считается в
+    ingest_listener_frames_total{transport, result}: accepted,
+    malformed (не расшифровался), rejected (ValueError из handle),
+    rate_limited, queue_full, error.
+    """
+
+    transport = None
+
+    def __init__(self, host, port, secret, handle, admit=None):
+        self.host = host
+        self.port = port
+        self.secret = secret
+        self.handle = handle
+        self.admit = admit
+
+    def _count(self, result):
+        registry.inc('ingest_listener_frames_total', transport=self.transport, result=result)
+
+    def process(self, frame, client):
+        """Один кадр; False - если кадр не расшифровался"""
+        if self.admit is not None:
+            try:
+                self.admit(client)
+            except RateLimited:
+                self._count('rate_limited')
+                return True
+        try:
+            raw_samples = wire.decode_frame(frame, self.secret)
+        except ValueError:
+            registry.inc('ingest_decrypt_failures_total')
+            self._count('malformed')
+            return False
+        try:
+            self.handle(raw_samples, client)
+        except RateLimited:
+            self._count('rate_limited')
+        except QueueFull:
+            self._count('queue_full')
+        except ValueError:
+            self._count('rejected')
+        except Exception as e:
+            logger.error(f"Ingest listener error from {client}: {e}", exc_info=True)
+            self._count('error')
+        else:
+            self._count('accepted')
+        return True
+
+
+class UDPListener(FrameListener):
+    """Одна датаграмма - один кадр; потерянное агент не досылает"""
+
+    transport = 'udp'
+
+    def __init__(self, host, port, secret, handle, admit=None, recv_buffer=4 << 20):
+        super().__init__(host, port, secret, handle, admit)
+        self.recv_buffer = recv_buffer
+        self._sock = None
+        self._thread = None
+        self._stopping = threading.Event()
+
+    def start(self):
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        _reuse_port(sock)
+        # Очередь ядра сглаживает всплески, пока поток занят расшифровкой
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, self.recv_buffer)
+        sock.bind((self.host, self.port))
+        # Таймаут нужен только чтобы поток заметил остановку
+        sock.settimeout(0.5)
+        self._sock = sock
+        self.port = sock.getsockname()[1]
+        self._stopping.clear()
+        self._thread = threading.Thread(target=self._run, name='ingest-udp', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stopping.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+        if self._sock is not None:
+            self._sock.close()
+            self._sock = None
+
+    def _run(self):
+        recvfrom = self._sock.recvfrom
+        while not self._stopping.is_set():
+            try:
+                frame, address = recvfrom(65535)
+            except socket.timeout:
+                continue
+            except OSError as e:
+                logger.error(f"UDP receive error: {e}")
+                continue
+            # Поток приема один на сокет: любая ошибка кадра не должна его остановить
+            try:
+                self.process(frame, address[0])
+            except Exception as e:
+                logger.error(f"UDP frame from {address[0]} failed: {e}", exc_info=True)
+                self._count('error')
+
+
+class _TCPServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+    request_queue_size = 128
+
+    def server_bind(self):
+        _reuse_port(self.socket)
+        super().server_bind()
+
+
+class TCPListener(FrameListener):
+    """Постоянные соединения агентов: длина кадра '<H', затем кадр.
+
+    Ответов нет - агент пишет кадры подряд. Кадр, который не
+    расшифровался, означает сбитую разметку потока, поэтому соединение
+    закрывается; молчащее дольше idle_timeout - тоже.
+    """
+
+    transport = 'tcp'
+
+    def __init__(self, host, port, secret, handle, admit=None, idle_timeout=600):
+        super().__init__(host, port, secret, handle, admit)
+        self.idle_timeout = idle_timeout
+        self._server = None
+        self._thread = None
+
+    def start(self):
+        listener = self
+
+        class Handler(socketserver.StreamRequestHandler):
+            timeout = self.idle_timeout
+
+            def handle(self):
+                client = self.client_address[0]
+                read = self.rfile.read
+                size = wire.FRAME_LENGTH.size
+                try:
+                    while True:
+                        header = read(size)
+                        if len(header) < size:
+                            return
+                        (length,) = wire.FRAME_LENGTH.unpack(header)
+                        frame = read(length)
+                        if len(frame) < length:
+                            return
+                        if not listener.process(frame, client):
+                            return
+                except OSError:
+                    return
+                except Exception as e:
+                    logger.error(f"TCP frame from {client} failed: {e}", exc_info=True)
+                    listener._count('error')
+
+        self._server = _TCPServer((self.host, self.port), Handler)
+        self.port = self._server.server_address[1]
+        self._thread = threading.Thread(target=self._server.serve_forever, name='ingest-tcp', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+            self._thread = None
@@ -0,0 +1,204 @@
+import heapq
+import threading
+import time
+
+
+class PlacementIndex:
+    """Индекс автоматического размещения игроков по серверам.
+
+    Для каждого назначения (purpose) - куча доступных серверов по ключу
+    current_load + pending * pending_weight, где pending - регистрации,
+    принятые после последнего замера нагрузки. Устаревшие записи кучи
+    удаляются лениво, поэтому выбор и обновление стоят O(log n).
+
+    Индекс только выбирает сервер: вместимость окончательно проверяет
+    вставка заявки в БД. Регистрации других процессов приходят
+    приращениями через apply_registrations, без перечитывания индекса.
+    """
+
+    def __init__(self, load_state, pending_weight=5, ttl=30):
+        self._load_state = load_state
+        self.pending_weight = pending_weight
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._servers = {}
+        self._heaps = {}
+        self._loaded_at = None
+        # id последней заявки, учтенной при загрузке, и заявки этого процесса после нее
+        self._last_registration_id = 0
+        self._own_registrations = set()
+
+    def _ensure_fresh(self):
+        if self._loaded_at is None or time.monotonic() - self._loaded_at > self.ttl:
+            servers, registration_counts, last_registration_id = self._load_state()
+            self._servers = {}
+            self._heaps = {}
+            for server in servers:
+                self._store(server, registration_counts.get(server['id'], 0), 0)
+            self._last_registration_id = last_registration_id
+            self._own_registrations = {
+                registration_id for registration_id in self._own_registrations
+                if registration_id > last_registration_id
+            }
+            self._loaded_at = time.monotonic()
+
+    def _store(self, server, registrations, pending):
+        entry = {
+            'id': server['id'],
+            'purpose': server['purpose'],
+            'is_available': bool(server['is_available']),
+            'is_stale': bool(server.get('is_stale')),
+            'load': server['current_load'] or 0,
+            'capacity': server.get('capacity'),
+            'registrations': registrations,
+            'pending': pending,
+            'version': 0,
+        }
+        self._servers[server['id']] = entry
+        self._push(entry)
+
+    def _push(self, entry):
+        entry['version'] += 1
+        if not entry['is_available'] or entry['is_stale']:
+            return
+        if entry['capacity'] is not None and entry['registrations'] >= entry['capacity']:
+            return
+        heap = self._heaps.setdefault(entry['purpose'], [])
+        score = entry['load'] + entry['pending'] * self.pending_weight
+        heapq.heappush(heap, (score, entry['id'], entry['version']))
+        # Устаревших записей стало слишком много - пересобираем кучу
+        if len(heap) > 2 * len(self._servers) + 32:
+            self._heaps[entry['purpose']] = [
+                item for item in heap if self._is_current(item)
+            ]
+            heapq.heapify(self._heaps[entry['purpose']])
+
+    def _is_current(self, item):
+        entry = self._servers.get(item[1])
+        return entry is not None and entry['version'] == item[2]
+
+    def _reserve(self, entry):
+        entry['registrations'] += 1
+        entry['pending'] += 1
+        self._push(entry)
+
+    def invalidate(self):
+        """Пометить индекс устаревшим (перечитается при следующем выборе)"""
+        with self._lock:
+            self._loaded_at = None
+
+    def place(self, purpose):
+        """Наименее загруженный доступный сервер назначения (с резервированием)"""
+        with self._lock:
+            self._ensure_fresh()
+            heap = self._heaps.get(purpose, [])
+            while heap and not self._is_current(heap[0]):
+                heapq.heappop(heap)
+            if not heap:
+                return None
+            entry = self._servers[heap[0][1]]
+            self._reserve(entry)
+            return entry['id']
+
+    def reserve(self, server_id):
+        """Резервирование места на выбранном вручную сервере"""
+        with self._lock:
+            self._ensure_fresh()
+            entry = self._servers.get(server_id)
+            if entry is None or not entry['is_available'] or entry['is_stale']:
+                return False
+            if entry['capacity'] is not None and entry['registrations'] >= entry['capacity']:
+                return False
+            self._reserve(entry)
+            return True
+
+    def release(self, server_id, count=1):
+        """Отмена резервирования (регистрации не сохранились или удалены)"""
+        with self._lock:
+            entry = self._servers.get(server_id)
+            if entry is not None and entry['registrations'] > 0:
+                entry['registrations'] = max(entry['registrations'] - count, 0)
+                entry['pending'] = max(entry['pending'] - count, 0)
+                self._push(entry)
+
+    def reject(self, server_id):
+        """БД не приняла заявку (мест нет или сервер выключен другим процессом).
+
+        Резервирование отменяется, сервер выпадает из выбора до
+        следующего перечитывания индекса.
+        """
+        with self._lock:
+            entry = self._servers.get(server_id)
+            if entry is not None:
+                entry['registrations'] = max(entry['registrations'] - 1, 0)
+                entry['pending'] = max(entry['pending'] - 1, 0)
+                entry['is_available'] = False
+                self._push(entry)
+
+    def confirm(self, registration_id):
+        """Заявка этого процесса сохранена - в apply_registrations она уже учтена"""
+        with self._lock:
+            if registration_id > self._last_registration_id:
+                self._own_registrations.add(registration_id)
+
+    def apply_registrations(self, rows):
+        """Новые заявки [(id, server_id), ...] из ChangeFeed: +1 к счетчику сервера"""
+        with self._lock:
+            for registration_id, server_id in rows:
+                if registration_id <= self._last_registration_id:
+                    continue  # уже в счетчиках последней загрузки
+                if registration_id in self._own_registrations:
+                    self._own_registrations.discard(registration_id)
+                    continue
+                entry = self._servers.get(server_id)
+                if entry is not None:
+                    entry['registrations'] += 1
+                    entry['pending'] += 1
+                    self._push(entry)
+
+    def purposes(self):
+        with self._lock:
+            self._ensure_fresh()
+            return sorted({
+                entry['purpose'] for entry in self._servers.values()
+                if entry['is_available'] and not entry['is_stale']
+            })
+
+    def set_load(self, server_id, load):
+        """Новый замер: нагрузка уже учитывает прежние регистрации"""
+        with self._lock:
+            entry = self._servers.get(server_id)
+            if entry is not None:
+                entry['load'] = load
+                entry['pending'] = 0
+                self._push(entry)
+
+    def apply_samples(self, samples):
+        latest = {}
+        for sample in samples:
+            latest[sample['server_id']] = sample['load']
+        for server_id, load in latest.items():
+            self.set_load(server_id, load)
+
+    def set_available(self, server_id, is_available):
+        with self._lock:
+            entry = self._servers.get(server_id)
+            if entry is not None:
+                entry['is_available'] = bool(is_available)
+                self._push(entry)
+
+    def set_stale(self, server_id, is_stale):
+        with self._lock:
+            entry = self._servers.get(server_id)
+            if entry is not None:
+                entry['is_stale'] = bool(is_stale)
+                self._push(entry)
+
+    def add_server(self, server):
+        with self._lock:
+            if self._loaded_at is not None:
+                self._store(dict(server), 0, 0)
+
+    def remove_server(self, server_id):
+        with self._lock:
+            self._servers.pop(server_id, None)
@@ -0,0 +1,119 @@
+import json
+import os
+import threading
+import time
+import zlib
+
+
+class RateLimited(Exception):
+    """Лимит исчерпан; retry_after - секунд до следующей попытки"""
+
+    def __init__(self, retry_after):
+        super().__init__('Rate limit exceeded')
+        self.retry_after = retry_after
+
+
+class RateLimiter:
+    """Ограничение частоты запросов в памяти (token bucket, алгоритм GCRA).
+
+    Политика - список правил (limit, window): не более limit единиц за
+    window секунд, емкость "ведра" восстанавливается равномерно. На правило
+    хранится одно число - теоретическое время прихода (TAT), так что
+    (1, 60) - ровно "не чаще раза в минуту". Ключи разбиты на полосы со
+    своими блокировками; записи с полным ведром не нужны и удаляются
+    лениво - при обращении и периодически по ходу вставок.
+    """
+
+    def __init__(self, policies, stripes=16, sweep_every=1024):
+        self.policies = {name: [tuple(rule) for rule in rules] for name, rules in policies.items()}
+        self.sweep_every = sweep_every
+        self._stripes = [({}, threading.Lock()) for _ in range(stripes)]
+        self._inserts = [0] * stripes
+
+    def _stripe(self, policy, key):
+        index = zlib.crc32(f'{policy}:{key}'.encode()) % len(self._stripes)
+        return index, self._stripes[index]
+
+    @staticmethod
+    def _sweep(entries, now):
+        for entry_key in [k for k, tats in entries.items() if max(tats) <= now]:
+            del entries[entry_key]
+
+    def hit(self, policy, key, cost=1, now=None):
+        """Учет cost единиц; RateLimited, если хоть одно правило превышено"""
+        self._apply(policy, key, cost, now, charge=True)
+
+    def check(self, policy, key, cost=1, now=None):
+        """Как hit, но без учета: RateLimited, если cost единиц сейчас не пройдут"""
+        self._apply(policy, key, cost, now, charge=False)
+
+    def _apply(self, policy, key, cost, now, charge):
+        rules = self.policies[policy]
+        now = time.time() if now is None else now
+        entry_key = (policy, str(key))
+        index, (entries, lock) = self._stripe(policy, key)
+        with lock:
+            tats = entries.get(entry_key)
+            if tats is None:
+                tats = [now] * len(rules)
+            if charge and entry_key not in entries:
+                self._inserts[index] += 1
+                if self._inserts[index] % self.sweep_every == 0:
+                    self._sweep(entries, now)
+
+            new_tats = []
+            retry_after = 0
+            for tat, (limit, window) in zip(tats, rules):
+                new_tat = max(tat, now) + cost * window / limit
+                new_tats.append(new_tat)
+                retry_after = max(retry_after, new_tat - window - now)
+            if retry_after > 0:
+                raise RateLimited(max(int(retry_after + 0.999), 1))
+
+            if charge:
+                entries[entry_key] = new_tats
+
+    def allow(self, policy, key, cost=1):
+        try:
+            self.hit(policy, key, cost)
+            return True
+        except RateLimited:
+            return False
+
+    def dump(self, now=None):
+        """Непросроченные состояния всех политик"""
+        now = time.time() if now is None else now
+        state = {}
+        for entries, lock in self._stripes:
+            with lock:
+                self._sweep(entries, now)
+                for (policy, key), tats in entries.items():
+                    state.setdefault(policy, {})[key] = list(tats)
+        return state
+
+    def restore(self, state, now=None):
+        now = time.time() if now is None else now
+        for policy, keys in state.items():
+            rules = self.policies.get(policy)
+            if rules is None:
+                continue
+            for key, tats in keys.items():
+                if len(tats) != len(rules) or max(tats) <= now:
+                    continue
+                _, (entries, lock) = self._stripe(policy, key)
+                with lock:
+                    entries[(policy, key)] = list(tats)
+
+    def save(self, path):
+        """Снимок состояния в файл (атомарная замена)"""
+        tmp_path = f'{path}.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(self.dump(), f)
+        os.replace(tmp_path, path)
+
+    def load(self, path):
+        try:
+            with open(path) as f:
+                self.restore(json.load(f))
+        except FileNotFoundError:
+            pass
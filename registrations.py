@@ -0,0 +1,116 @@
+import base64
+import csv
+import io
+
+# Не больше id в одном IN (...) (лимит параметров SQLite - 999 в старых сборках)
+MAX_IDS = 500
+CSV_COLUMNS = ['id', 'nickname', 'request_ip', 'server_id', 'purpose', 'ip_address', 'registration_date']
+
+
+def encode_cursor(row):
+    """Курсор страницы - позиция последней строки (registration_date, id)"""
+    raw = f"{row['registration_date']}|{row['id']}".encode()
+    return base64.urlsafe_b64encode(raw).decode()
+
+
+def decode_cursor(cursor):
+    try:
+        date, reg_id = base64.urlsafe_b64decode(cursor.encode()).decode().rsplit('|', 1)
+        return date, int(reg_id)
+    except (ValueError, UnicodeDecodeError):
+        raise ValueError('Invalid cursor')
+
+
+def _filter_clause(server_id=None, nickname=None, ip=None, date_from=None, date_to=None):
+    # Префиксный поиск диапазоном, чтобы работал обычный индекс (LIKE его не использует)
+    conditions, params = [], []
+    if date_from:
+        conditions.append("r.registration_date >= ?")
+        params.append(date_from)
+    if date_to:
+        # Дата без времени - включительно весь день
+        conditions.append("r.registration_date < ?")
+        params.append(date_to + '\U0010ffff' if len(date_to) == 10 else date_to)
+    if server_id is not None:
+        conditions.append("r.server_id = ?")
+        params.append(server_id)
+    if nickname:
+        conditions.append("r.nickname >= ? AND r.nickname < ?")
+        params += [nickname, nickname + '\U0010ffff']
+    if ip:
+        conditions.append("r.request_ip >= ? AND r.request_ip < ?")
+        params += [ip, ip + '\U0010ffff']
+    return conditions, params
+
+
+def _select(conditions):
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+    return f"""
+        SELECT r.id, r.nickname, r.request_ip, r.server_id, r.registration_date,
+               s.ip_address, s.purpose
+        FROM registrations r
+        JOIN servers s ON r.server_id = s.id
+        {where}
+        ORDER BY r.registration_date DESC, r.id DESC
+    """
+
+
+def registrations_page(db, limit=50, cursor=None, **filters):
+    """Страница заявок (новые первыми) и курсор следующей страницы.
+
+    Keyset-пагинация: следующая страница начинается строго после
+    (registration_date, id) последней строки, без OFFSET.
+    """
+    conditions, params = _filter_clause(**filters)
+    if cursor:
+        conditions.append("(r.registration_date, r.id) < (?, ?)")
+        params += list(decode_cursor(cursor))
+    rows = db.execute(_select(conditions) + " LIMIT ?", params + [limit + 1]).fetchall()
+    next_cursor = encode_cursor(rows[limit - 1]) if len(rows) > limit else None
+    return rows[:limit], next_cursor
+
+
+def delete_registrations(db, ids=None, **filters):
+    """Удаление заявок по списку id и/или фильтрам (commit - за вызывающим).
+
+    Без id и фильтров - ValueError, чтобы случайно не удалить все.
+    Возвращает {server_id: число удаленных заявок} - для освобождения
+    мест в индексе размещения.
+    """
+    conditions, params = _filter_clause(**filters)
+    if ids is not None:
+        ids = list(ids)
+        if len(ids) > MAX_IDS:
+            raise ValueError(f'Не больше {MAX_IDS} id за раз')
+        conditions.append(f"r.id IN ({','.join('?' * len(ids))})" if ids else "0")
+        params += ids
+    if not conditions:
+        raise ValueError('Не задан ни один фильтр')
+    where = ' AND '.join(conditions)
+    counts = dict(db.execute(
+        f"SELECT r.server_id, COUNT(*) FROM registrations r WHERE {where} GROUP BY r.server_id", params
+    ).fetchall())
+    if counts:
+        db.execute(f"DELETE FROM registrations AS r WHERE {where}", params)
+    return counts
+
+
+def export_registrations_csv(db, **filters):
+    """CSV по строкам прямо из курсора, без загрузки выборки в память"""
+    conditions, params = _filter_clause(**filters)
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+
+    def flush():
+        data = buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+        return data
+
+    writer.writerow(CSV_COLUMNS)
+    yield flush()
+    for row in db.execute(_select(conditions), params):
+        writer.writerow([row[column] for column in CSV_COLUMNS])
+        if buffer.tell() > 8192:
+            yield flush()
+    yield flush()
@@ -0,0 +1,55 @@
+import time
+
+from wire import from_epoch
+
+
+def trim_history(db, server_ids, window):
+    """Оставляет не более window последних замеров по каждому серверу.
+
+    Граница находится по индексу (server_id, timestamp) за O(window),
+    поэтому стоимость не зависит от размера всей таблицы.
+    """
+    db.executemany("""
+        DELETE FROM server_load_history
+        WHERE server_id = ? AND timestamp < (
+            SELECT timestamp FROM server_load_history
+            WHERE server_id = ?
+            ORDER BY timestamp DESC
+            LIMIT 1 OFFSET ?
+        )
+    """, [(server_id, server_id, window - 1) for server_id in server_ids])
+
+
+def purge_expired(db, retention_hours, batch_size, table='server_load_history'):
+    """Удаление замеров старше окна хранения небольшими пачками.
+
+    table - таблица с колонками id, server_id, timestamp и индексом по
+    timestamp. Отбор по времени, а не по списку серверов, поэтому
+    строки удаленных серверов тоже уходят. Возвращает количество
+    удаленных строк.
+    """
+    # Граница в той же форме, что и хранимое время (from_epoch), иначе строки сравниваются неверно
+    cutoff = from_epoch(time.time() - retention_hours * 3600)
+    deleted = 0
+    while True:
+        cur = db.execute(f"""
+            DELETE FROM {table}
+            WHERE id IN (
+                SELECT id FROM {table}
+                WHERE timestamp < ?
+                LIMIT ?
+            )
+        """, (cutoff, batch_size))
+        # Коммитим каждую пачку, чтобы не держать блокировку записи
+        db.commit()
+        deleted += cur.rowcount
+        if cur.rowcount < batch_size:
+            break
+    return deleted
+
+
+def delete_servers(db, server_ids):
+    """Удаление агрегатов и метрик серверов (в транзакции вызывающего)"""
+    params = [(server_id,) for server_id in server_ids]
+    for table in ('server_load_rollups', 'server_metrics', 'server_metrics_latest'):
+        db.executemany(f"DELETE FROM {table} WHERE server_id = ?", params)
@@ -0,0 +1,76 @@
+import time
+
+# Метки разрешений для параметра resolution в get_chart_data
+RESOLUTION_NAMES = {60: '1m', 900: '15m', 3600: '1h'}
+
+
+def rollup_samples(db, samples, tiers):
+    """Инкрементальная агрегация пачки замеров во все уровни (min/avg/max/count).
+
+    Пачка сначала сворачивается в памяти, затем каждая корзина
+    обновляется одним UPSERT.
+    """
+    buckets = {}
+    for s in samples:
+        for resolution, _ in tiers:
+            key = (resolution, s['server_id'], int(s['epoch']) // resolution * resolution)
+            agg = buckets.get(key)
+            if agg is None:
+                buckets[key] = [s['load'], s['load'], s['load'], 1]
+            else:
+                agg[0] = min(agg[0], s['load'])
+                agg[1] = max(agg[1], s['load'])
+                agg[2] += s['load']
+                agg[3] += 1
+
+    db.executemany("""
+        INSERT INTO server_load_rollups
+        (resolution, server_id, bucket, min_load, max_load, sum_load, count)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+        ON CONFLICT (resolution, server_id, bucket) DO UPDATE SET
+            min_load = MIN(min_load, excluded.min_load),
+            max_load = MAX(max_load, excluded.max_load),
+            sum_load = sum_load + excluded.sum_load,
+            count = count + excluded.count
+    """, [key + tuple(agg) for key, agg in buckets.items()])
+
+
+def purge_expired(db, tiers):
+    """Удаление корзин старше срока хранения своего уровня (по индексу (resolution, bucket))"""
+    now = time.time()
+    deleted = 0
+    for resolution, retention_hours in tiers:
+        cutoff = int(now - retention_hours * 3600)
+        cur = db.execute(
+            "DELETE FROM server_load_rollups WHERE resolution = ? AND bucket < ?",
+            (resolution, cutoff)
+        )
+        deleted += cur.rowcount
+        db.commit()
+    return deleted
+
+
+def choose_resolution(start, end, max_points, tiers, now=None):
+    """Самый детальный уровень, который укладывается в бюджет точек.
+
+    Уровни, чей срок хранения не покрывает начало диапазона, пропускаются;
+    если не подходит ни один - берется самый грубый.
+    """
+    now = now or time.time()
+    ordered = sorted(tiers)
+    for resolution, retention_hours in ordered:
+        if start < now - retention_hours * 3600:
+            continue
+        if (end - start) / resolution <= max_points:
+            return resolution
+    return ordered[-1][0]
+
+
+def query_rollups(db, server_id, start, end, resolution):
+    """Корзины уровня resolution в диапазоне [start, end)"""
+    return db.execute("""
+        SELECT bucket, min_load, max_load, sum_load * 1.0 / count AS avg_load, count
+        FROM server_load_rollups
+        WHERE resolution = ? AND server_id = ? AND bucket >= ? AND bucket < ?
+        ORDER BY bucket
+    """, (resolution, server_id, start // resolution * resolution, end)).fetchall()
@@ -2,23 +2,93 @@ import requests
 import psutil  # Для получения нагрузки
 import time
 from Crypto.Cipher import AES
-from Crypto.Util.Padding import pad, unpad
+from Crypto.Util.Padding import pad
+from Crypto.Random import get_random_bytes
 import base64
+import glob
 import hashlib
 import json
-from datetime import datetime
+import os
+import random
+import select
+import socket
+import struct
+from datetime import datetime, timezone
+from functools import lru_cache
 
 SERVER_ID = 1  # Уникальный ID каждого сервера
 CENTRAL_SERVER_URL = "http://127.0.0.1:5000/api/update_load"
+CENTRAL_BATCH_URL = "http://127.0.0.1:5000/api/update_load_batch"
 SECRET_KEY = "secret-key"
+SPOOL_PATH = "server_mon.spool"  # локальный буфер на время недоступности сервера
+SPOOL_BATCH_SIZE = 200  # замеров в одном пакете при выгрузке буфера
+WIRE_FORMAT = "binary"  # "binary" (кадр v1, AES-OCB) или "json" (legacy)
+# "http"; "udp" - датаграммы без подтверждения (потерянное не досылается);
+# "tcp" - постоянное соединение. Для udp/tcp всегда кадр v1 на INGEST-порт
+TRANSPORT = "http"
+CENTRAL_INGEST_HOST = "127.0.0.1"
+CENTRAL_INGEST_PORT = 5001  # INGEST_UDP_PORT / INGEST_TCP_PORT на сервере
+UDP_FRAME_SAMPLES = 20  # замеров в датаграмме, чтобы кадр помещался в MTU
+REPORT_INTERVAL = 5  # секунд между замерами
+REPORT_JITTER = 0.5  # случайный сдвиг отправки, секунд (+/-)
+REQUEST_TIMEOUT = 5  # таймаут HTTP-запроса, секунд
+BACKOFF_BASE = 2  # первая пауза после ошибки, секунд
+BACKOFF_MAX = 300  # максимальная пауза между попытками, секунд
+GAME_PROCESS_NAME = ""  # имя процесса игрового сервера (пусто - без метрик процесса)
+GAME_PORT = 0  # порт игроков для подсчета подключений (0 - не считать)
+# Несколько серверов на хосте: JSON вида
+# {"servers": [{"server_id": 1, "process": "srcds_linux", "cmdline": "-port 27015", "port": 27015},
+#              {"server_id": 2, "container": "3f2a..."}, {"server_id": 3, "cgroup": "/sys/fs/cgroup/mc.slice"}]}
+# Если файла нет - один сервер SERVER_ID с настройками выше
+AGENT_CONFIG_PATH = "server_mon.json"
+CGROUP_ROOT = "/sys/fs/cgroup"
+HEARTBEAT_INTERVAL = 60  # полный отчет со всеми метриками не реже, секунд
+# Метрика отправляется, только если сдвинулась больше чем на deadband
+METRIC_DEADBANDS = {
+    'load': 0,  # CPU, % (0 - любое изменение)
+    'ram': 1.0,  # %
+    'net_rx_bps': 64 * 1024,  # байт/с
+    'net_tx_bps': 64 * 1024,
+    'disk_read_bps': 256 * 1024,
+    'disk_write_bps': 256 * 1024,
+    'proc_cpu': 2.0,  # % CPU процесса игрового сервера
+    'proc_rss_mb': 16.0,
+    'players': 0,
+}
+
+# Раскладка бинарного кадра v1 (см. wire.py на центральном сервере). Агент
+# переносится на хосты один, без wire.py, поэтому раскладка повторена здесь;
+# совпадение проверяет tests/test_wire.py
+FRAME_MAGIC = b'GS'
+FRAME_VERSION = 1
+FRAME_HEADER = struct.Struct('<2sB12s')
+FRAME_COUNT = struct.Struct('<H')
+FRAME_SAMPLE = struct.Struct('<IBdB')
+FRAME_METRIC = struct.Struct('<Bf')
+FRAME_LENGTH = struct.Struct('<H')  # перед каждым кадром в TCP-потоке
+METRIC_IDS = {
+    'ram': 1,
+    'net_rx_bps': 2,
+    'net_tx_bps': 3,
+    'disk_read_bps': 4,
+    'disk_write_bps': 5,
+    'proc_cpu': 6,
+    'proc_rss_mb': 7,
+    'players': 8,
+}
+
+@lru_cache(maxsize=1)
+def get_key() -> bytes:
+    """Ключ AES из секрета (вычисляется один раз)"""
+    return hashlib.sha256(SECRET_KEY.encode()).digest()
 
 def encrypt_data(data: dict) -> str:
     """Шифрование данных с использованием AES"""
     # Преобразуем словарь в строку JSON
     json_data = json.dumps(data)
     
-    # Создаем ключ из секрета
-    key = hashlib.sha256(SECRET_KEY.encode()).digest()
+    # Ключ из секрета
+    key = get_key()
     
     # Создаем объект шифрования
     cipher = AES.new(key, AES.MODE_CBC)
@@ -33,61 +103,493 @@ def encrypt_data(data: dict) -> str:
     # Кодируем в base64 для передачи
     return base64.b64encode(encrypted_data).decode('utf-8')
 
-def decrypt_data(encrypted_data: str) -> dict:
-    """Дешифрование данных с использованием AES"""
-    # Декодируем из base64
-    encrypted_data = base64.b64decode(encrypted_data)
-    
-    # Извлекаем IV и зашифрованные данные
-    iv = encrypted_data[:AES.block_size]
-    ct = encrypted_data[AES.block_size:]
-    
-    # Создаем ключ из секрета
-    key = hashlib.sha256(SECRET_KEY.encode()).digest()
-    
-    # Создаем объект дешифрования
-    cipher = AES.new(key, AES.MODE_CBC, iv=iv)
-    
-    # Дешифруем данные и убираем дополнение
-    pt = unpad(cipher.decrypt(ct), AES.block_size)
-    
-    # Преобразуем JSON обратно в словарь
-    return json.loads(pt.decode('utf-8'))
+def encode_frame(samples: list) -> bytes:
+    """Упаковка и шифрование замеров в бинарный кадр v1"""
+    parts = [FRAME_COUNT.pack(len(samples))]
+    for sample in samples:
+        metrics = [
+            (METRIC_IDS[name], value)
+            for name, value in (sample.get('metrics') or {}).items()
+            if name in METRIC_IDS and value is not None
+        ]
+        epoch = datetime.fromisoformat(sample['timestamp']).replace(tzinfo=timezone.utc).timestamp()
+        parts.append(FRAME_SAMPLE.pack(sample['server_id'], sample['load'], epoch, len(metrics)))
+        parts.extend(FRAME_METRIC.pack(metric_id, value) for metric_id, value in metrics)
+
+    cipher = AES.new(get_key(), AES.MODE_OCB, nonce=get_random_bytes(12))
+    header = FRAME_HEADER.pack(FRAME_MAGIC, FRAME_VERSION, cipher.nonce)
+    cipher.update(header)
+    ciphertext, tag = cipher.encrypt_and_digest(b''.join(parts))
+    return header + ciphertext + tag
+
+# Одна сессия на весь процесс: TCP-соединение переиспользуется (keep-alive)
+session = requests.Session()
+
+def post_payload(url: str, payload, samples: list = None):
+    """POST замеров в выбранном формате; payload - объект для legacy JSON"""
+    if WIRE_FORMAT == "binary":
+        return session.post(
+            url,
+            data=encode_frame(samples if samples is not None else [payload]),
+            headers={"Content-Type": "application/octet-stream"},
+            timeout=REQUEST_TIMEOUT
+        )
+    return session.post(
+        url,
+        json={"data": encrypt_data(payload)},
+        headers={"Content-Type": "application/json"},
+        timeout=REQUEST_TIMEOUT
+    )
+
+class FrameSender:
+    """Отправка кадров v1 на ingest-порт по UDP или TCP; OSError - если не удалось"""
+
+    def __init__(self, transport: str, host: str, port: int):
+        self.transport = transport
+        self.address = (host, port)
+        self.sock = None
+
+    def _connect(self):
+        if self.transport == "udp":
+            sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            sock.connect(self.address)
+            return sock
+        sock = socket.create_connection(self.address, timeout=REQUEST_TIMEOUT)
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        return sock
+
+    def _stale(self) -> bool:
+        # Сервер в TCP ничего не пишет: читаемый сокет - это закрытое соединение
+        if self.transport != "tcp":
+            return False
+        readable, _, _ = select.select([self.sock], [], [], 0)
+        return bool(readable)
+
+    def close(self):
+        if self.sock is not None:
+            self.sock.close()
+            self.sock = None
+
+    def send(self, samples: list):
+        if self.sock is not None and self._stale():
+            self.close()
+        if self.sock is None:
+            self.sock = self._connect()
+        step = UDP_FRAME_SAMPLES if self.transport == "udp" else SPOOL_BATCH_SIZE
+        try:
+            for start in range(0, len(samples), step):
+                frame = encode_frame(samples[start:start + step])
+                if self.transport == "udp":
+                    self.sock.send(frame)
+                else:
+                    self.sock.sendall(FRAME_LENGTH.pack(len(frame)) + frame)
+        except OSError:
+            self.close()
+            raise
+
+sender = FrameSender(TRANSPORT, CENTRAL_INGEST_HOST, CENTRAL_INGEST_PORT) if TRANSPORT != "http" else None
 
 def get_server_load():
-    """Получаем текущую нагрузку сервера"""
-    cpu_load = psutil.cpu_percent(interval=1)
-    ram_load = psutil.virtual_memory().percent
+    """Получаем текущую нагрузку сервера.
+
+    Без блокировки: psutil считает загрузку CPU по разнице счетчиков
+    с предыдущего вызова, т.е. за прошедший интервал между замерами.
+    """
+    cpu_load = psutil.cpu_percent(interval=None)
     return round((cpu_load))
 
+class MetricsCollector:
+    """Сбор метрик хоста (RAM, сеть, диск) без блокирующих вызовов.
+
+    Скорости считаются по разнице счетчиков между вызовами.
+    """
+
+    def __init__(self):
+        self.prev_time = time.monotonic()
+        self.prev_net = psutil.net_io_counters()
+        self.prev_disk = psutil.disk_io_counters()
+
+    def collect(self) -> dict:
+        now = time.monotonic()
+        elapsed = max(now - self.prev_time, 1e-6)
+        metrics = {'ram': psutil.virtual_memory().percent}
+
+        net = psutil.net_io_counters()
+        if net and self.prev_net:
+            metrics['net_rx_bps'] = (net.bytes_recv - self.prev_net.bytes_recv) / elapsed
+            metrics['net_tx_bps'] = (net.bytes_sent - self.prev_net.bytes_sent) / elapsed
+        disk = psutil.disk_io_counters()
+        if disk and self.prev_disk:
+            metrics['disk_read_bps'] = (disk.read_bytes - self.prev_disk.read_bytes) / elapsed
+            metrics['disk_write_bps'] = (disk.write_bytes - self.prev_disk.write_bytes) / elapsed
+        self.prev_time, self.prev_net, self.prev_disk = now, net, disk
+        return metrics
+
+class InstanceSampler:
+    """Метрики всех игровых серверов хоста за один проход по процессам.
+
+    Каждая цель (target) описывает процессы своего сервера одним из ключей:
+    pid, process (имя; cmdline - подстрока командной строки), cgroup
+    (каталог cgroup) или container (id контейнера docker/podman).
+    Потомки найденных процессов учитываются вместе с ними.
+    """
+
+    def __init__(self, targets: list):
+        self.targets = targets
+        self.cpu_count = psutil.cpu_count() or 1
+        self._cgroup_dirs = {}
+
+    def _cgroup_dir(self, target: dict):
+        if target.get('cgroup'):
+            return target['cgroup']
+        container = target.get('container')
+        if not container:
+            return None
+        if container not in self._cgroup_dirs:
+            patterns = [
+                f"{CGROUP_ROOT}/system.slice/docker-{container}*.scope",
+                f"{CGROUP_ROOT}/machine.slice/libpod-{container}*.scope",
+                f"{CGROUP_ROOT}/docker/{container}*",
+                f"{CGROUP_ROOT}/*/docker/{container}*",
+            ]
+            found = [path for pattern in patterns for path in glob.glob(pattern)]
+            self._cgroup_dirs[container] = found[0] if found else None
+        return self._cgroup_dirs[container]
+
+    @staticmethod
+    def _cgroup_pids(path: str) -> set:
+        pids = set()
+        for root, _, files in os.walk(path):
+            if 'cgroup.procs' in files:
+                try:
+                    with open(os.path.join(root, 'cgroup.procs')) as f:
+                        pids.update(int(line) for line in f if line.strip())
+                except OSError:
+                    continue
+        return pids
+
+    def _match(self, target: dict, processes: dict) -> set:
+        if target.get('pid'):
+            return {target['pid']} & processes.keys()
+        cgroup = self._cgroup_dir(target)
+        if cgroup:
+            return self._cgroup_pids(cgroup) & processes.keys()
+        name = target.get('process')
+        if not name:
+            return set()
+        cmdline = target.get('cmdline')
+        return {
+            pid for pid, proc in processes.items()
+            if proc.info['name'] == name
+            and (not cmdline or cmdline in ' '.join(proc.info['cmdline'] or ()))
+        }
+
+    @staticmethod
+    def _with_descendants(roots: set, children: dict) -> set:
+        pids, stack = set(), list(roots)
+        while stack:
+            pid = stack.pop()
+            if pid not in pids:
+                pids.add(pid)
+                stack.extend(children.get(pid, ()))
+        return pids
+
+    def _port_connections(self) -> dict:
+        ports = {target['port'] for target in self.targets if target.get('port')}
+        if not ports:
+            return {}
+        counts = dict.fromkeys(ports, 0)
+        try:
+            for c in psutil.net_connections(kind='inet'):
+                if c.laddr and c.laddr.port in counts \
+                        and c.status in (psutil.CONN_ESTABLISHED, psutil.CONN_NONE):
+                    counts[c.laddr.port] += 1
+        except psutil.AccessDenied:
+            return {}
+        return counts
+
+    def sample(self) -> dict:
+        """server_id -> метрики (load, proc_cpu, proc_rss_mb, players)"""
+        # Один проход process_iter на всех; psutil кэширует объекты Process,
+        # поэтому cpu_percent считает разницу с прошлого тика
+        processes, children = {}, {}
+        for proc in psutil.process_iter(['ppid', 'name', 'cmdline']):
+            processes[proc.pid] = proc
+            children.setdefault(proc.info['ppid'], []).append(proc.pid)
+        connections = self._port_connections()
+
+        result = {}
+        for target in self.targets:
+            pids = self._with_descendants(self._match(target, processes), children)
+            cpu = rss = 0.0
+            for pid in pids:
+                proc = processes[pid]
+                try:
+                    with proc.oneshot():
+                        cpu += proc.cpu_percent(interval=None)
+                        rss += proc.memory_info().rss
+                except (psutil.NoSuchProcess, psutil.AccessDenied):
+                    continue
+            values = {}
+            if pids:
+                values['proc_cpu'] = cpu
+                values['proc_rss_mb'] = rss / (1024 * 1024)
+                # Нагрузка экземпляра - доля всех ядер хоста
+                values['load'] = round(min(cpu / self.cpu_count, 100))
+            if target.get('port') in connections:
+                values['players'] = connections[target['port']]
+            result[target['server_id']] = values
+        return result
+
+def load_targets() -> list:
+    """Список отслеживаемых серверов: из AGENT_CONFIG_PATH или SERVER_ID"""
+    if AGENT_CONFIG_PATH and os.path.exists(AGENT_CONFIG_PATH):
+        with open(AGENT_CONFIG_PATH, encoding='utf-8') as f:
+            return json.load(f)['servers']
+    # Один сервер на хост: нагрузка - загрузка CPU всего хоста
+    return [{'server_id': SERVER_ID, 'process': GAME_PROCESS_NAME, 'port': GAME_PORT, 'load': 'host'}]
+
+class DeadbandFilter:
+    """Отбор изменившихся метрик с периодическим полным отчетом (heartbeat)"""
+
+    def __init__(self, deadbands=METRIC_DEADBANDS, heartbeat=HEARTBEAT_INTERVAL):
+        self.deadbands = deadbands
+        self.heartbeat = heartbeat
+        self.last_sent = {}
+        self.last_full = None
+
+    def select(self, values: dict) -> dict:
+        """Метрики к отправке; пустой словарь - отчет можно пропустить"""
+        now = time.monotonic()
+        if self.last_full is None or now - self.last_full >= self.heartbeat:
+            self.last_full = now
+            selected = dict(values)
+        else:
+            selected = {
+                name: value for name, value in values.items()
+                if name not in self.last_sent
+                or abs(value - self.last_sent[name]) > self.deadbands.get(name, 0)
+            }
+        self.last_sent.update(selected)
+        return selected
+
+    def reset(self):
+        """Следующий отчет будет полным (например, после потери связи)"""
+        self.last_full = None
+
+def spool_append(sample: dict):
+    """Дописываем замер в локальный буфер (одна JSON-строка на замер)"""
+    with open(SPOOL_PATH, 'a', encoding='utf-8') as f:
+        f.write(json.dumps(sample) + "\n")
+        f.flush()
+        os.fsync(f.fileno())
+
+def spool_pending() -> bool:
+    return os.path.exists(SPOOL_PATH) and os.path.getsize(SPOOL_PATH) > 0
+
+def rate_limited_samples(response, samples: list) -> list:
+    """Замеры серверов, которые сервер отбросил по лимиту, приняв остальной пакет"""
+    try:
+        limited = set(response.json().get('rate_limited_servers') or ())
+    except (ValueError, AttributeError):
+        return []
+    return [sample for sample in samples if sample['server_id'] in limited]
+
+def post_samples(samples: list):
+    """Отправка пакета замеров на центральный сервер.
+
+    Возвращает (принят ли пакет, замеры для повторной отправки).
+    """
+    if sender is not None:
+        sender.send(samples)
+        return True, []
+    response = post_payload(CENTRAL_BATCH_URL, {"samples": samples}, samples)
+    if response.status_code == 400:
+        # Сервер отверг пакет целиком - повторная отправка не поможет
+        print(f"Пакет отклонен сервером: {response.text}")
+        return True, []
+    if response.status_code != 200:
+        print(f"Ошибка отправки пакета: {response.text}")
+        return False, []
+    return True, rate_limited_samples(response, samples)
+
+def spool_drain() -> bool:
+    """Выгрузка буфера пакетами по SPOOL_BATCH_SIZE; True если буфер пуст"""
+    with open(SPOOL_PATH, encoding='utf-8') as f:
+        lines = [line for line in f if line.strip()]
+
+    sent = 0
+    deferred = []
+    try:
+        while sent < len(lines):
+            batch = []
+            for line in lines[sent:sent + SPOOL_BATCH_SIZE]:
+                try:
+                    batch.append(json.loads(line))
+                except ValueError:
+                    continue  # недописанная строка после аварийного завершения
+            if batch:
+                accepted, deferred = post_samples(batch)
+                if not accepted:
+                    break
+            sent = min(sent + SPOOL_BATCH_SIZE, len(lines))
+            if deferred:
+                # Часть серверов уперлась в лимит - остальное выгрузим позже
+                break
+    except (requests.RequestException, OSError) as e:
+        print(f"Ошибка выгрузки буфера: {str(e)}")
+
+    # Переписываем буфер неотправленным остатком; отброшенные лимитом - в начало
+    remaining = [json.dumps(sample) + "\n" for sample in deferred] + lines[sent:]
+    tmp_path = SPOOL_PATH + ".tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        f.writelines(remaining)
+    os.replace(tmp_path, SPOOL_PATH)
+    if sent:
+        print(f"Выгружено из буфера: {sent - len(deferred)} замеров")
+    return not remaining
+
+def send_samples(samples: list) -> bool:
+    """Отправка замеров одним запросом; при недоступности сервера - в буфер"""
+    # Пока буфер не пуст, новые замеры идут в его конец, чтобы сохранить порядок
+    if spool_pending():
+        for sample in samples:
+            spool_append(sample)
+        return spool_drain()
+
+    if sender is not None:
+        try:
+            sender.send(samples)
+        except OSError as e:
+            print(f"Сервер недоступен, замеры сохранены в буфер: {str(e)}")
+            for sample in samples:
+                spool_append(sample)
+            return False
+        return True
+
+    try:
+        # Шифруем и отправляем данные
+        if len(samples) == 1:
+            response = post_payload(CENTRAL_SERVER_URL, samples[0])
+        else:
+            response = post_payload(CENTRAL_BATCH_URL, {"samples": samples}, samples)
+    except requests.RequestException as e:
+        print(f"Сервер недоступен, замеры сохранены в буфер: {str(e)}")
+        for sample in samples:
+            spool_append(sample)
+        return False
+
+    if response.status_code == 200:
+        deferred = rate_limited_samples(response, samples)
+        for sample in deferred:
+            spool_append(sample)
+        return not deferred
+    if response.status_code == 429 or response.status_code >= 500:
+        for sample in samples:
+            spool_append(sample)
+    print(f"Ошибка отправки: {response.text}")
+    return False
+
+class Backoff:
+    """Экспоненциальная пауза между попытками связи со случайным разбросом"""
+
+    def __init__(self, base=BACKOFF_BASE, maximum=BACKOFF_MAX):
+        self.base = base
+        self.maximum = maximum
+        self.failures = 0
+        self.retry_at = 0.0
+
+    def ready(self) -> bool:
+        return time.monotonic() >= self.retry_at
+
+    def success(self):
+        self.failures = 0
+        self.retry_at = 0.0
+
+    def failure(self):
+        self.failures += 1
+        delay = min(self.maximum, self.base * 2 ** (self.failures - 1))
+        # "Full jitter": агенты после общего сбоя не возвращаются одновременно
+        self.retry_at = time.monotonic() + random.uniform(delay / 2, delay)
+        print(f"Следующая попытка через {self.retry_at - time.monotonic():.1f} с")
+
 def send_load_to_central():
+    backoff = Backoff()
+    collector = MetricsCollector()
+    targets = load_targets()
+    sampler = InstanceSampler(targets)
+    deadbands = {target['server_id']: DeadbandFilter() for target in targets}
+    psutil.cpu_percent(interval=None)  # первый вызов только запоминает счетчики
+
+    # Случайная фаза: агенты, запущенные одновременно, расходятся по времени
+    next_tick = time.monotonic() + random.uniform(0, REPORT_INTERVAL)
     while True:
+        delay = next_tick + random.uniform(-REPORT_JITTER, REPORT_JITTER) - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+
         try:
-            load = get_server_load()
-            data = {
-                "server_id": SERVER_ID,
-                "load": load,
-                "timestamp": datetime.utcnow().isoformat()
-            }
-            
-            # Шифруем данные перед отправкой
-            encrypted_data = encrypt_data(data)
-            
-            # Отправляем зашифрованные данные
-            response = requests.post(
-                CENTRAL_SERVER_URL,
-                json={"data": encrypted_data},
-                headers={"Content-Type": "application/json"}
-            )
-            
-            if response.status_code != 200:
-                print(f"Ошибка отправки: {response.text}")
-            else:
-                print("SENDED LOAD "+str(load)+"%")
+            host_load = get_server_load()
+            host_metrics = collector.collect()
+            instances = sampler.sample()
+            timestamp = datetime.utcnow().isoformat()
+
+            # Один общий отчет по всем серверам хоста
+            samples = []
+            host_metrics_owner = None
+            for target in targets:
+                server_id = target['server_id']
+                values = dict(instances.get(server_id, {}))
+                if target.get('load') == 'host':
+                    values['load'] = host_load
+                elif 'load' not in values:
+                    # Процессы экземпляра не найдены - не шлем ничего: сервер
+                    # пометит его молчащим, и игроков на него не отправят
+                    deadbands[server_id].reset()
+                    continue
+                if host_metrics_owner is None:
+                    # RAM, сеть и диск общие для хоста - отправляются один раз,
+                    # с первым работающим сервером из списка
+                    host_metrics_owner = server_id
+                    values.update(host_metrics)
+                load = values['load']
+                changed = deadbands[server_id].select(values)
+                if not changed:
+                    continue  # ничего не изменилось больше допуска
+                changed.pop('load', None)
+                samples.append({
+                    "server_id": server_id,
+                    "load": load,
+                    "timestamp": timestamp,
+                    "metrics": changed
+                })
+            if not samples:
+                continue
+
+            if not backoff.ready():
+                # Сервер недавно был недоступен - копим замеры до следующей попытки
+                for sample in samples:
+                    spool_append(sample)
+            elif send_samples(samples):
+                backoff.success()
+                print("SENDED LOAD " + ", ".join(f"#{s['server_id']}: {s['load']}%" for s in samples))
+            elif spool_pending():
+                backoff.failure()
+                for deadband in deadbands.values():
+                    deadband.reset()
         except Exception as e:
             print(f"Ошибка: {str(e)}")
-        
-        time.sleep(5)
+        finally:
+            next_tick = schedule_next(next_tick)
+
+def schedule_next(next_tick: float) -> float:
+    """Следующий тик по фиксированной сетке, а не от конца итерации - без дрейфа"""
+    next_tick += REPORT_INTERVAL
+    now = time.monotonic()
+    if next_tick < now:
+        # Пропущенные тики (долгая отправка, сон системы) не догоняем
+        next_tick += (int((now - next_tick) / REPORT_INTERVAL) + 1) * REPORT_INTERVAL
+    return next_tick
 
 if __name__ == "__main__":
     send_load_to_central()
\ No newline at end of file
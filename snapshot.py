@@ -0,0 +1,158 @@
+import threading
+import time
+from collections import deque
+
+from history import SQLiteHistory
+
+
+class ServerSnapshot:
+    """Снимок списка серверов, текущей нагрузки и недавней истории в памяти.
+
+    Публичные страницы читают данные отсюда, не обращаясь к БД. Прием
+    замеров и действия администратора обновляют снимок на месте и
+    увеличивают version; при нескольких процессах снимок дополнительно
+    перечитывается из БД раз в ttl секунд (ttl=None - только по invalidate).
+    """
+
+    def __init__(self, connect, history_window=40, ttl=None, history=None):
+        self._connect = connect
+        self._history_store = history or SQLiteHistory()
+        self.history_window = history_window
+        self.ttl = ttl
+        self._lock = threading.RLock()
+        self._servers = {}
+        self._history = {}
+        self._server_versions = {}
+        self._modified = {}
+        self._rendered = {}
+        self._loaded_at = None
+        self.version = 0
+
+    def _bump(self, server_id=None):
+        self.version += 1
+        self._modified[None] = time.time()
+        if server_id is not None:
+            self._server_versions[server_id] = self.version
+            self._modified[server_id] = self._modified[None]
+
+    def _ensure_fresh(self):
+        if self._loaded_at is None or (
+                self.ttl is not None and time.monotonic() - self._loaded_at > self.ttl):
+            self.reload()
+
+    def reload(self):
+        """Полная перезагрузка снимка из БД"""
+        db = self._connect()
+        try:
+            servers = db.execute("SELECT * FROM servers ORDER BY id").fetchall()
+            history = self._history_store.recent(db, self.history_window)
+        finally:
+            db.close()
+
+        with self._lock:
+            self._servers = {row['id']: dict(row) for row in servers}
+            self._history = {
+                server_id: deque(maxlen=self.history_window) for server_id in self._servers
+            }
+            for server_id, timestamp, load in history:
+                if server_id in self._history:
+                    self._history[server_id].append((timestamp, load))
+            self._rendered.clear()
+            self._loaded_at = time.monotonic()
+            self._bump()
+            self._server_versions = dict.fromkeys(self._servers, self.version)
+            self._modified = dict.fromkeys([None, *self._servers], self._modified[None])
+
+    def invalidate(self):
+        """Пометить снимок устаревшим (перечитается при следующем чтении)"""
+        with self._lock:
+            self._loaded_at = None
+
+    def servers(self, available_only=False):
+        """Список серверов (копии строк), упорядоченный по id"""
+        with self._lock:
+            self._ensure_fresh()
+            return [
+                dict(server) for server in self._servers.values()
+                if not available_only or (server['is_available'] and not server['is_stale'])
+            ]
+
+    def get_server(self, server_id):
+        with self._lock:
+            self._ensure_fresh()
+            server = self._servers.get(server_id)
+            return dict(server) if server else None
+
+    def history(self, server_id):
+        """Недавние замеры сервера [(timestamp, load), ...] по возрастанию времени"""
+        with self._lock:
+            self._ensure_fresh()
+            return sorted(self._history.get(server_id, ()))
+
+    def server_version(self, server_id):
+        with self._lock:
+            self._ensure_fresh()
+            return self._server_versions.get(server_id, 0)
+
+    def last_modified(self, server_id=None):
+        """Время (unix) последнего изменения снимка или данных сервера"""
+        with self._lock:
+            self._ensure_fresh()
+            return self._modified.get(server_id)
+
+    def cached(self, key, build, server_id=None):
+        """Значение из кэша, пока не изменилась версия снимка (или сервера)"""
+        with self._lock:
+            self._ensure_fresh()
+            version = self._server_versions.get(server_id, 0) if server_id is not None else self.version
+            entry = self._rendered.get(key)
+            if entry and entry[0] == version:
+                return entry[1]
+        value = build()
+        with self._lock:
+            self._rendered[key] = (version, value)
+        return value
+
+    def apply_samples(self, samples):
+        """Учет записанных в БД замеров"""
+        with self._lock:
+            if self._loaded_at is None:
+                return
+            for sample in samples:
+                server = self._servers.get(sample['server_id'])
+                if server is None:
+                    continue
+                server['current_load'] = sample['load']
+                self._history[sample['server_id']].append((sample['timestamp'], sample['load']))
+                self._bump(sample['server_id'])
+
+    def set_load(self, server_id, load):
+        with self._lock:
+            if server_id in self._servers:
+                self._servers[server_id]['current_load'] = load
+                self._bump(server_id)
+
+    def set_available(self, server_id, is_available):
+        with self._lock:
+            if server_id in self._servers:
+                self._servers[server_id]['is_available'] = is_available
+                self._bump(server_id)
+
+    def set_stale(self, server_id, is_stale):
+        with self._lock:
+            if server_id in self._servers:
+                self._servers[server_id]['is_stale'] = int(is_stale)
+                self._bump(server_id)
+
+    def add_server(self, server):
+        with self._lock:
+            self._servers[server['id']] = dict(server)
+            self._history[server['id']] = deque(maxlen=self.history_window)
+            self._servers = dict(sorted(self._servers.items()))
+            self._bump(server['id'])
+
+    def remove_server(self, server_id):
+        with self._lock:
+            self._servers.pop(server_id, None)
+            self._history.pop(server_id, None)
+            self._bump(server_id)
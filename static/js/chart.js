@@ -1,18 +1,84 @@
 let loadChart = null;
+let loadStream = null;
+const MAX_CHART_POINTS = 40;
+const POLL_INTERVAL_MS = 5000;
 
-function updateChart() {
-    const serverId = document.getElementById('server-select').value;
-    fetch(`/get_chart_data/${serverId}`)
+// История всех серверов: {server_id: {t: [epoch], load: [...]}} и курсор /api/history
+const series = {};
+let historyCursor = null;
+let historyRequest = null;
+
+// Время замера - UTC ЧЧ:ММ, как и раньше в подписях с сервера
+function formatLabel(epoch) {
+    return new Date(epoch * 1000).toISOString().slice(11, 16);
+}
+
+// Добавление точек сервера по времени; уже известные пропускаются
+function appendPoints(serverId, times, loads) {
+    const points = series[serverId] || (series[serverId] = {t: [], load: []});
+    let added = false;
+    for (let i = 0; i < times.length; i++) {
+        // Обычно точка новее последней; старее - если поток опередил историю
+        let index = points.t.length;
+        while (index > 0 && points.t[index - 1] > times[i]) {
+            index--;
+        }
+        if (index > 0 && points.t[index - 1] === times[i]) {
+            continue;
+        }
+        points.t.splice(index, 0, times[i]);
+        points.load.splice(index, 0, loads[i]);
+        added = true;
+    }
+    if (points.t.length > MAX_CHART_POINTS) {
+        points.t.splice(0, points.t.length - MAX_CHART_POINTS);
+        points.load.splice(0, points.load.length - MAX_CHART_POINTS);
+    }
+    return added;
+}
+
+// Первый запрос - недавняя история, дальше - только новое после курсора
+function fetchHistory() {
+    if (historyRequest) {
+        return historyRequest;
+    }
+    const url = historyCursor ? `/api/history?since=${encodeURIComponent(historyCursor)}` : '/api/history';
+    historyRequest = fetch(url)
         .then(response => response.json())
         .then(data => {
-            if (loadChart) {
-                loadChart.data.labels = data.labels;
-                loadChart.data.datasets[0].data = data.data;
-                loadChart.update();
-            } else {
-                createChart(data);
+            let selectedChanged = false;
+            const selected = document.getElementById('server-select').value;
+            for (const [serverId, points] of Object.entries(data.servers)) {
+                if (appendPoints(serverId, points.t, points.load) && serverId === selected) {
+                    selectedChanged = true;
+                }
+            }
+            historyCursor = data.cursor;
+            if (selectedChanged || !loadChart) {
+                updateChart();
+            }
+            historyRequest = null;
+            if (data.more) {
+                return fetchHistory();
             }
+        })
+        .catch(() => {
+            historyRequest = null;
         });
+    return historyRequest;
+}
+
+function updateChart() {
+    const serverId = document.getElementById('server-select').value;
+    const points = series[serverId] || {t: [], load: []};
+    const data = {labels: points.t.map(formatLabel), data: points.load.slice()};
+    if (loadChart) {
+        loadChart.data.labels = data.labels;
+        loadChart.data.datasets[0].data = data.data;
+        loadChart.update();
+    } else {
+        createChart(data);
+    }
 }
 
 function createChart(data) {
@@ -42,5 +108,78 @@ function createChart(data) {
     });
 }
 
+// Новый замер из потока: дописываем точку в график и обновляем список
+function handleLoadEvent(event) {
+    const sample = JSON.parse(event.data);
+
+    const loadValue = document.getElementById(`server-load-${sample.server_id}`);
+    if (loadValue) {
+        loadValue.textContent = `${sample.load}%`;
+    }
+    const loadBar = document.getElementById(`server-load-bar-${sample.server_id}`);
+    if (loadBar) {
+        loadBar.style.width = `${sample.load}%`;
+    }
+
+    const epoch = Math.floor(Date.parse(sample.timestamp.replace(' ', 'T') + 'Z') / 1000);
+    const serverId = String(sample.server_id);
+    const points = series[serverId] || (series[serverId] = {t: [], load: []});
+    const shown = loadChart && serverId === document.getElementById('server-select').value;
+
+    // Обычный случай - точка новее последней: дописываем на месте, без пересборки
+    if (!points.t.length || epoch > points.t[points.t.length - 1]) {
+        points.t.push(epoch);
+        points.load.push(sample.load);
+        const overflow = points.t.length > MAX_CHART_POINTS;
+        if (overflow) {
+            points.t.shift();
+            points.load.shift();
+        }
+        if (shown) {
+            loadChart.data.labels.push(formatLabel(epoch));
+            loadChart.data.datasets[0].data.push(sample.load);
+            if (overflow) {
+                loadChart.data.labels.shift();
+                loadChart.data.datasets[0].data.shift();
+            }
+            loadChart.update('none');
+        }
+        return;
+    }
+
+    // Точка из прошлого (поток опередил историю) - вставка по времени и пересборка
+    if (appendPoints(serverId, [epoch], [sample.load]) && shown) {
+        updateChart();
+    }
+}
+
+function startLoadStream() {
+    if (loadStream || !window.EventSource) {
+        return;
+    }
+    // EventSource сам переподключается после обрыва; пропущенное добираем по курсору
+    loadStream = new EventSource('/api/stream');
+    loadStream.onmessage = handleLoadEvent;
+    loadStream.onopen = () => {
+        if (historyCursor) {
+            fetchHistory();
+        }
+    };
+}
+
+// Без живого потока история дочитывается опросом по курсору
+function pollHistory() {
+    if (!loadStream || loadStream.readyState !== EventSource.OPEN) {
+        fetchHistory();
+    }
+}
+
 // Инициализация при загрузке
-document.addEventListener('DOMContentLoaded', updateChart);
+document.addEventListener('DOMContentLoaded', () => {
+    if (!document.getElementById('server-select')) {
+        return;
+    }
+    fetchHistory();
+    startLoadStream();
+    setInterval(pollHistory, POLL_INTERVAL_MS);
+});
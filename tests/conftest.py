@@ -0,0 +1,37 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app as app_module  # noqa: E402
+from ratelimit import RateLimiter  # noqa: E402
+
+
+@pytest.fixture
+def app(tmp_path, monkeypatch):
+    """Приложение на временной БД: синхронная запись, свежие счетчики лимитов"""
+    flask_app = app_module.app
+    monkeypatch.setitem(flask_app.config, 'DATABASE_PATH', tmp_path / 'servers.db')
+    monkeypatch.setitem(flask_app.config, 'INGEST_MODE', 'sync')
+    monkeypatch.setitem(flask_app.config, 'TESTING', True)
+    monkeypatch.setattr(app_module, 'limiter', RateLimiter(app_module.limiter.policies))
+    app_module.database.init_app(flask_app)
+    app_module.database.bootstrap()
+    # Снимок и кэши - от БД предыдущего теста
+    app_module.snapshot.invalidate()
+    yield flask_app
+    app_module.database.close_pool()
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+@pytest.fixture
+def db(app):
+    connection = app_module.database.get_db()
+    yield connection
+    connection.close()
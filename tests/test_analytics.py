@@ -0,0 +1,64 @@
+import numpy as np
+import pytest
+
+import analytics
+import app as app_module
+
+
+def fleet(series, **kwargs):
+    """series: server_id -> [(epoch, load), ...] по возрастанию времени"""
+    rows = [(server_id, epoch, load) for server_id, points in series.items() for epoch, load in points]
+    table = np.array(rows, dtype=np.float64)
+    return analytics.fleet_stats(table[:, 0].astype(np.int64), table[:, 1], table[:, 2], **kwargs)
+
+
+def test_percentiles_match_numpy():
+    rng = np.random.default_rng(1)
+    series = {
+        server_id: [(epoch, float(load)) for epoch, load in enumerate(rng.integers(0, 101, size))]
+        for server_id, size in ((1, 1), (2, 7), (3, 50))
+    }
+
+    stats = fleet(series)
+
+    for server_id, points in series.items():
+        loads = [load for _, load in points]
+        for q in (50, 95, 99):
+            assert stats[server_id][f'p{q}'] == round(float(np.percentile(loads, q)), 2)
+
+
+def test_ewma_matches_recurrence():
+    loads = [10, 50, 20, 90, 40]
+    alpha = 0.3
+    expected = loads[0]
+    for load in loads[1:]:
+        expected = alpha * load + (1 - alpha) * expected
+
+    stats = fleet({1: list(enumerate(loads)), 2: [(0, 5)]}, alpha=alpha)
+
+    assert stats[1]['ewma'] == pytest.approx(round(expected, 2))
+    assert stats[2]['ewma'] == 5
+
+
+def test_seconds_above_threshold_and_anomaly():
+    # Интервал засчитывается замеру, с которого он начинается
+    stats = fleet({1: [(0, 90), (10, 50), (30, 95), (60, 10)]}, threshold=80)
+    assert stats[1]['seconds_above_threshold'] == 10 + 30
+    assert stats[1]['samples'] == 4
+
+    steady = [(epoch, 20 + epoch % 2) for epoch in range(40)]
+    stats = fleet({1: steady + [(40, 100)], 2: steady}, z_threshold=3.0)
+    assert stats[1]['anomaly'] is True
+    assert stats[2]['anomaly'] is False
+
+
+def test_analytics_caches_only_standard_windows(client):
+    with client.session_transaction() as session:
+        session['is_admin'] = True
+
+    for hours in (0.5, 1.25, 2.75):
+        assert client.get(f'/admin/analytics?hours={hours}&threshold=33').status_code == 200
+    assert not any(key[0] == 'analytics' for key in app_module.snapshot._rendered if isinstance(key, tuple))
+
+    assert client.get('/admin/analytics?hours=24').status_code == 200
+    assert ('analytics', 24.0) in app_module.snapshot._rendered
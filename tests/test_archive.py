@@ -0,0 +1,69 @@
+import numpy as np
+
+from archive import BlockArchive, _empty_state, decode_block, encode_points, iter_block
+
+
+def test_codec_roundtrip_with_irregular_intervals():
+    rng = np.random.default_rng(3)
+    block_start = 1_800_000_000
+    # Ровный шаг, пропуски в сотни и тысячи секунд, скачки нагрузки в обе стороны
+    steps = rng.choice([5, 5, 5, 1, 700, 3000], size=300)
+    epochs = (block_start + np.cumsum(steps)).tolist()
+    loads = rng.integers(0, 101, size=300).tolist()
+    points = list(zip(epochs, loads))
+
+    data, state = encode_points(points, _empty_state(block_start))
+
+    assert list(iter_block(block_start, data)) == points
+    decoded_epochs, decoded_loads = decode_block(block_start, data)
+    assert decoded_epochs.tolist() == epochs
+    assert decoded_loads.tolist() == loads
+    assert state[0] == epochs[-1] and state[2] == loads[-1]
+
+
+def test_codec_appends_continue_from_state():
+    block_start = 3600
+    points = [(block_start + 5 * i, i % 100) for i in range(50)]
+    first, state = encode_points(points[:20], _empty_state(block_start))
+    rest, _ = encode_points(points[20:], state)
+
+    assert list(iter_block(block_start, first + rest)) == points
+    # Ровный интервал - по 2 байта на замер
+    assert len(rest) == 2 * 30
+
+
+def samples(server_id, points):
+    return [{'server_id': server_id, 'epoch': epoch, 'load': load} for epoch, load in points]
+
+
+def test_archive_append_range_and_purge(db):
+    archive = BlockArchive(block_seconds=3600)
+    base = 1_700_000_000 - 1_700_000_000 % 3600
+    points = [(base + 600 * i, 10 + i) for i in range(12)]  # два часовых блока
+
+    archive.append(db, samples(1, points[:4]) + samples(2, [(base, 99)]))
+    archive.append(db, samples(1, points[4:]))
+    db.commit()
+
+    epochs, loads = archive.range(db, 1, base + 600, base + 6600)
+    assert list(zip(epochs.tolist(), loads.tolist())) == points[1:11]
+    assert list(archive.iter_range(db, 1, base + 600, base + 6600)) == points[1:11]
+
+    server_ids, epochs, loads = archive.arrays(db, [1, 2], base, base + 7200)
+    assert server_ids.tolist() == [1] * 12 + [2]
+    assert loads.tolist()[-1] == 99
+
+    assert db.execute("SELECT COUNT(*) FROM server_load_blocks").fetchone()[0] == 3
+    assert archive.purge(db, retention_hours=0) == 3
+
+
+def test_archive_drops_points_not_newer_than_block_tail(db):
+    archive = BlockArchive(block_seconds=3600)
+    base = 1_700_000_000 - 1_700_000_000 % 3600
+
+    archive.append(db, samples(1, [(base + 10, 1), (base + 20, 2)]))
+    archive.append(db, samples(1, [(base + 15, 3), (base + 20, 4), (base + 30, 5)]))
+
+    epochs, loads = archive.range(db, 1, base, base + 3600)
+    assert epochs.tolist() == [base + 10, base + 20, base + 30]
+    assert loads.tolist() == [1, 2, 5]
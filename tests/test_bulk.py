@@ -0,0 +1,76 @@
+import pytest
+
+import bulk
+from history import SQLiteHistory
+
+
+def test_parse_csv_and_json():
+    rows = bulk.parse_import('\ufeffip_address,purpose,is_available\n10.1.0.1,Survival,нет\n'.encode('utf-8'))
+    assert rows == [{'ip_address': '10.1.0.1', 'purpose': 'Survival', 'is_available': 'нет'}]
+
+    rows = bulk.parse_import(b'[{"ip_address": "10.1.0.2", "purpose": "Creative"}]', 'servers.json')
+    assert rows == [{'ip_address': '10.1.0.2', 'purpose': 'Creative'}]
+
+    for data in (b'purpose\nSurvival\n', b'[1, 2]', b'[{"a": ', b'\xff\xfe'):
+        with pytest.raises(ValueError):
+            bulk.parse_import(data)
+
+
+@pytest.mark.parametrize('row, expected', [
+    ({'ip_address': ' 10.1.0.1 ', 'purpose': 'PvP'}, ('10.1.0.1', 'PvP', True, None)),
+    ({'ip_address': '10.1.0.1', 'purpose': 'PvP', 'is_available': 'off', 'capacity': '20'},
+     ('10.1.0.1', 'PvP', False, 20)),
+])
+def test_validate_server(row, expected):
+    assert bulk.validate_server(row) == expected
+
+
+@pytest.mark.parametrize('row', [
+    {'ip_address': '', 'purpose': 'PvP'},
+    {'ip_address': '10.1.0.1', 'purpose': 'PvP', 'capacity': '-1'},
+    {'ip_address': '10.1.0.1', 'purpose': 'PvP', 'capacity': 'many'},
+    {'ip_address': '10.1.0.1', 'purpose': 'PvP', 'is_available': 'maybe'},
+])
+def test_validate_server_rejects(row):
+    with pytest.raises(ValueError):
+        bulk.validate_server(row)
+
+
+def test_import_skips_bad_and_duplicate_rows(db):
+    existing_ip = db.execute("SELECT ip_address FROM servers ORDER BY id").fetchone()[0]
+    rows = [
+        {'ip_address': '10.1.0.1', 'purpose': 'PvP'},
+        {'ip_address': existing_ip, 'purpose': 'PvP'},
+        {'ip_address': '', 'purpose': 'PvP'},
+        {'ip_address': '10.1.0.1', 'purpose': 'PvP'},
+        {'ip_address': '10.1.0.2', 'purpose': 'PvE', 'capacity': 5},
+    ]
+
+    created, errors = bulk.import_servers(db, rows)
+    db.commit()
+
+    assert [(row['ip_address'], row['capacity']) for row in created] == [('10.1.0.1', None), ('10.1.0.2', 5)]
+    assert [error['row'] for error in errors] == [2, 3, 4]
+
+
+def test_set_available_toggles_or_sets(db):
+    first, second = [row[0] for row in db.execute("SELECT id FROM servers ORDER BY id LIMIT 2")]
+    db.execute("UPDATE servers SET is_available = 1 WHERE id IN (?, ?)", (first, second))
+
+    assert bulk.set_servers_available(db, [first, second, 999]) == [(first, False), (second, False)]
+    assert bulk.set_servers_available(db, [first], is_available=True) == [(first, True)]
+
+
+def test_delete_keeps_servers_with_registrations(db):
+    first, second = [row[0] for row in db.execute("SELECT id FROM servers ORDER BY id LIMIT 2")]
+    db.execute("INSERT INTO registrations (nickname, request_ip, server_id) VALUES ('p', '10.0.0.1', ?)", (first,))
+    db.execute("INSERT INTO server_load_history (server_id, load_value, timestamp) VALUES (?, 5, '2026-10-18T07:00:00')",
+               (second,))
+
+    deleted, errors = bulk.delete_servers(db, [first, second, second, 999], SQLiteHistory())
+
+    assert deleted == [second]
+    assert [(error['id'], error['error']) for error in errors] == [
+        (first, 'Есть активные регистрации'), (999, 'Сервер не найден')
+    ]
+    assert db.execute("SELECT COUNT(*) FROM server_load_history WHERE server_id = ?", (second,)).fetchone()[0] == 0
@@ -0,0 +1,23 @@
+import time
+
+
+def test_raw_chart_rejects_range_over_point_budget(client):
+    response = client.get('/get_chart_data/1?from=0&resolution=raw')
+    assert response.status_code == 400
+
+    # Сутки по 5 секунд - 17280 точек, больше бюджета даже с максимальным points
+    now = int(time.time())
+    response = client.get(f'/get_chart_data/1?from={now - 86400}&to={now}&resolution=raw&points=5000')
+    assert response.status_code == 400
+
+
+def test_raw_chart_within_budget(client):
+    now = int(time.time())
+    response = client.get(f'/get_chart_data/1?from={now - 3600}&to={now}&resolution=raw&points=720')
+    assert response.status_code == 200
+    assert response.json['resolution'] == 'raw'
+
+
+def test_chart_points_are_capped(client):
+    response = client.get('/get_chart_data/1?resolution=auto&points=100000000')
+    assert response.status_code == 400
@@ -0,0 +1,71 @@
+import sqlite3
+import threading
+
+import database
+
+
+def connect(path):
+    db = sqlite3.connect(path)
+    db.row_factory = sqlite3.Row
+    return db
+
+
+def tables(db):
+    return {row[0] for row in db.execute("SELECT name FROM sqlite_master WHERE type IN ('table', 'index')")}
+
+
+def test_fresh_database_migrates_to_latest(app, tmp_path):
+    db = connect(tmp_path / 'fresh.db')
+
+    assert database.migrate(db) == database.MIGRATIONS[-1][0]
+    assert {'servers', 'server_load_rollups', 'server_metrics', 'server_load_blocks',
+            'idx_load_history_ts'} <= tables(db)
+    # Повторный запуск ничего не применяет
+    assert database.migrate(db) == database.MIGRATIONS[-1][0]
+    assert db.execute("SELECT COUNT(*) FROM schema_version").fetchone()[0] == len(database.MIGRATIONS)
+
+
+def test_legacy_database_keeps_data(app, tmp_path):
+    # БД исходной версии: только schema.sql, без таблицы версий
+    db = connect(tmp_path / 'legacy.db')
+    with open(app.config['SCHEMA_PATH'], encoding='utf-8') as f:
+        db.executescript(f.read())
+    db.execute("INSERT INTO server_load_history (server_id, load_value, timestamp) VALUES (1, 40, ?)",
+               ('2026-10-18 07:00:30',))
+    db.commit()
+    servers = db.execute("SELECT COUNT(*) FROM servers").fetchone()[0]
+
+    assert database.schema_version(db) == 1
+    assert database.migrate(db) == database.MIGRATIONS[-1][0]
+
+    assert db.execute("SELECT COUNT(*) FROM servers").fetchone()[0] == servers
+    # Агрегаты заполнены из накопленной истории, время приведено к одной форме
+    assert db.execute(
+        "SELECT resolution, bucket, sum_load FROM server_load_rollups WHERE server_id = 1 ORDER BY resolution"
+    ).fetchall()[0][2] == 40
+    assert db.execute("SELECT timestamp FROM server_load_history").fetchone()[0] == '2026-10-18T07:00:30'
+
+
+def test_get_db_reuses_connection_per_thread(app):
+    first = database.get_db()
+    second = database.get_db()
+    assert first is second
+
+    other = []
+
+    def worker():
+        db = database.get_db()
+        other.append(db)
+        db.close()
+
+    thread = threading.Thread(target=worker)
+    thread.start()
+    thread.join()
+    assert other[0] is not first
+
+    second.close()
+    first.close()
+    # Освобожденное соединение возвращается в пул и выдается снова
+    reused = database.get_db()
+    assert reused in (first, other[0])
+    reused.close()
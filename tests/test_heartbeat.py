@@ -0,0 +1,82 @@
+from heartbeat import HeartbeatWatchdog
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def make_watchdog(timeout=60):
+    clock = FakeClock()
+    events = []
+    watchdog = HeartbeatWatchdog(
+        timeout,
+        on_stale=lambda ids: events.append(('stale', sorted(ids))),
+        on_alive=lambda ids: events.append(('alive', sorted(ids))),
+        clock=clock
+    )
+    return watchdog, clock, events
+
+
+def test_silent_server_goes_stale_after_timeout():
+    watchdog, clock, events = make_watchdog()
+    watchdog.sync({1: False, 2: False})
+
+    clock.now += 30
+    watchdog.beat({2})
+    assert watchdog.tick() == []
+
+    clock.now += 30
+    assert watchdog.tick() == [1]
+    clock.now += 30
+    assert watchdog.tick() == [2]
+    # Уже молчащий сервер повторно не сообщается
+    clock.now += 120
+    assert watchdog.tick() == []
+    assert events == [('stale', [1]), ('stale', [2])]
+
+
+def test_beat_revives_stale_server():
+    watchdog, clock, events = make_watchdog()
+    watchdog.sync({1: True})
+
+    watchdog.beat({1})
+    assert events == [('alive', [1])]
+
+    clock.now += 60
+    assert watchdog.tick() == [1]
+
+
+def test_sync_forgets_removed_servers():
+    watchdog, clock, events = make_watchdog()
+    watchdog.sync({1: False, 2: False})
+
+    watchdog.sync({2: False})
+    assert len(watchdog) == 1
+
+    clock.now += 60
+    assert watchdog.tick() == [2]
+
+
+def test_sync_applies_persisted_stale_to_known_servers():
+    watchdog, clock, events = make_watchdog()
+    watchdog.sync({1: False, 2: False})
+
+    # Другой лидер пометил 1 молчащим, а 2 - снова на связи
+    clock.now += 10
+    watchdog.sync({1: True, 2: False})
+    watchdog.beat({1})
+    assert events == [('alive', [1])]
+
+    watchdog, clock, events = make_watchdog()
+    watchdog.sync({1: False})
+    clock.now += 60
+    assert watchdog.tick() == [1]
+    watchdog.sync({1: False})
+    clock.now += 59
+    assert watchdog.tick() == []
+    clock.now += 1
+    assert watchdog.tick() == [1]
@@ -0,0 +1,75 @@
+import time
+
+import pytest
+
+from history import RECORD, FileHistory, dump_cursor, load_cursor
+
+
+def samples(server_id, points):
+    return [{'server_id': server_id, 'epoch': epoch, 'load': load} for epoch, load in points]
+
+
+def test_append_and_range_drop_out_of_order(tmp_path):
+    store = FileHistory(tmp_path)
+    store.append(None, samples(1, [(100, 10), (105, 20)]))
+    store.append(None, samples(1, [(103, 99), (105, 99), (110, 30)]) + samples(2, [(100, 5)]))
+
+    epochs, loads = store.range(None, 1, 100, 110)
+    assert epochs.tolist() == [100, 105]
+    assert loads.tolist() == [10, 20]
+    assert store.range(None, 1, 0, 1000)[1].tolist() == [10, 20, 30]
+    assert [row[0] for row in store.recent(None, 2)] == [1, 1, 2]
+
+
+def test_partial_trailing_record_is_truncated(tmp_path):
+    store = FileHistory(tmp_path)
+    store.append(None, samples(1, [(100, 10), (105, 20)]))
+    path = tmp_path / '1.bin'
+    with open(path, 'ab') as f:
+        f.write(b'\x01\x02\x03')
+
+    # Чтение обрывок не видит, новая запись ложится без сдвига
+    assert store.range(None, 1, 0, 1000)[1].tolist() == [10, 20]
+    store.append(None, samples(1, [(110, 30)]))
+    assert path.stat().st_size == 3 * RECORD.itemsize
+    assert store.range(None, 1, 0, 1000)[1].tolist() == [10, 20, 30]
+
+    with open(path, 'ab') as f:
+        f.write(b'\x01')
+    FileHistory(tmp_path)
+    assert path.stat().st_size == 3 * RECORD.itemsize
+
+
+def test_since_pages_by_cursor(tmp_path):
+    store = FileHistory(tmp_path)
+    store.append(None, samples(1, [(100, 1), (101, 2), (102, 3)]) + samples(2, [(100, 7)]))
+
+    series, cursor, more = store.since(None, None)
+    assert series == {} and cursor == {1: 102.0, 2: 100.0} and not more
+
+    store.append(None, samples(1, [(103, 4), (104, 5)]) + samples(2, [(101, 8)]))
+    # Курсор переживает выдачу клиенту и обратно
+    cursor = load_cursor(dump_cursor(cursor))
+    series, cursor, more = store.since(None, cursor, limit=2)
+    assert series == {1: ([103.0, 104.0], [4, 5])} and more
+
+    series, cursor, more = store.since(None, cursor, limit=2)
+    assert series == {2: ([101.0], [8])} and not more
+
+    with pytest.raises(ValueError):
+        store.since(None, [1, 2])
+    with pytest.raises(ValueError):
+        load_cursor('not a cursor')
+
+
+def test_purge_and_delete_server(tmp_path):
+    store = FileHistory(tmp_path)
+    now = time.time()
+    store.append(None, samples(1, [(now - 7200, 1), (now - 60, 2)]))
+
+    assert store.purge(None, retention_hours=1, batch_size=100) == 1
+    assert store.range(None, 1, 0, now + 1)[1].tolist() == [2]
+
+    store.delete_server(None, 1)
+    assert not (tmp_path / '1.bin').exists()
+    assert store.arrays(None)[0].tolist() == []
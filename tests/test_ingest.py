@@ -0,0 +1,173 @@
+import json
+import sqlite3
+import time
+
+import pytest
+
+import app as app_module
+import ingest
+import server_mon
+import wire
+from ingest import IngestQueue, validate_sample
+
+
+def post_frame(client, url, samples):
+    frame = wire.encode_frame(samples, app_module.app.config['SECRET_KEY'])
+    return client.post(url, data=frame, content_type=wire.FRAME_MIMETYPE)
+
+
+def make_samples(server_ids, start=None):
+    start = start or int(time.time()) - 60
+    return [{'server_id': server_id, 'load': 10 + i, 'timestamp': wire.from_epoch(start + i)}
+            for i, server_id in enumerate(server_ids)]
+
+
+def test_batch_partial_rate_limit_names_servers(client):
+    # Сервер 1 исчерпал лимит, сервер 2 - нет
+    app_module.limiter.policies['ingest_server'] = [(2, 60)]
+    app_module.limiter.hit('ingest_server', 1, cost=2)
+
+    response = post_frame(client, '/api/update_load_batch', make_samples([1, 2, 1, 2]))
+
+    assert response.status_code == 200
+    assert response.json['accepted'] == 2
+    assert response.json['rate_limited'] == 2
+    assert response.json['rate_limited_servers'] == [1]
+    assert int(response.headers['Retry-After']) > 0
+
+
+
+def test_update_load_accepts_servers_within_limit(client):
+    app_module.limiter.policies['ingest_server'] = [(2, 60)]
+    app_module.limiter.hit('ingest_server', 1, cost=2)
+
+    response = post_frame(client, '/api/update_load', make_samples([1, 2]))
+
+    # Замер сервера 2 принят, а не потерян вместе с отказом серверу 1
+    assert response.status_code == 200
+    assert response.json['accepted'] == 1
+    assert response.json['rate_limited_servers'] == [1]
+    assert int(response.headers['Retry-After']) > 0
+    assert app_module.snapshot.history(2)
+
+    response = post_frame(client, '/api/update_load', make_samples([1]))
+    assert response.status_code == 429
+
+class FakeResponse:
+    def __init__(self, status_code, body):
+        self.status_code = status_code
+        self.text = json.dumps(body)
+        self._body = body
+
+    def json(self):
+        return self._body
+
+
+def test_agent_respools_rate_limited_samples(tmp_path, monkeypatch):
+    monkeypatch.setattr(server_mon, 'SPOOL_PATH', str(tmp_path / 'agent.spool'))
+    monkeypatch.setattr(server_mon, 'post_payload', lambda url, payload, samples=None: FakeResponse(
+        200, {'status': 'success', 'rate_limited': 1, 'rate_limited_servers': [1]}))
+    samples = make_samples([1, 2, 3])
+
+    assert server_mon.send_samples(samples) is False
+    assert server_mon.spool_pending()
+
+    # Выгрузка буфера: отброшенные лимитом замеры остаются в нем, а не теряются
+    assert server_mon.spool_drain() is False
+    with open(server_mon.SPOOL_PATH, encoding='utf-8') as f:
+        spooled = [json.loads(line) for line in f]
+    assert spooled == [samples[0]]
+
+
+def test_legacy_timestamp_offset_is_normalized():
+    sample = validate_sample({'server_id': 1, 'load': 5, 'timestamp': '2026-10-18T10:00:00+03:00'})
+    assert sample['epoch'] == wire.to_epoch('2026-10-18T07:00:00')
+    assert sample['timestamp'] == '2026-10-18T07:00:00'
+
+    # Разделитель-пробел тоже приводится к единой форме
+    sample = validate_sample({'server_id': 1, 'load': 5, 'timestamp': '2026-10-18 07:00:00'})
+    assert sample['timestamp'] == '2026-10-18T07:00:00'
+
+
+class FakeDB:
+    def rollback(self):
+        pass
+
+    def close(self):
+        pass
+
+
+class FakeStore:
+    """store_samples, который падает по заданному сценарию"""
+
+    def __init__(self, errors=(), bad_loads=()):
+        self.errors = list(errors)
+        self.bad_loads = set(bad_loads)
+        self.stored = []
+
+    def __call__(self, db, batch, *args):
+        if self.errors:
+            raise self.errors.pop(0)
+        if any(s['load'] in self.bad_loads for s in batch):
+            raise sqlite3.IntegrityError('constraint failed')
+        self.stored.extend(batch)
+
+
+def make_queue(monkeypatch, store, **kwargs):
+    monkeypatch.setattr(ingest, 'store_samples', store)
+    return IngestQueue(FakeDB, **kwargs)
+
+
+def test_queue_flush_stores_in_batches(monkeypatch):
+    store = FakeStore()
+    queue = make_queue(monkeypatch, store, batch_size=2)
+    samples = make_samples([1, 2, 3])
+    queue._items.extend(samples)
+
+    queue.flush()
+
+    assert store.stored == samples
+    assert len(queue) == 0
+
+
+def test_queue_requeues_on_transient_error(monkeypatch):
+    locked = sqlite3.OperationalError('database is locked')
+    store = FakeStore(errors=[locked] * 5)
+    queue = make_queue(monkeypatch, store, max_retries=1)
+    samples = make_samples([1, 2])
+    queue._items.extend(samples)
+
+    # Занятая БД не считается ошибкой данных: пачка не дробится и не теряется
+    for _ in range(5):
+        with pytest.raises(sqlite3.OperationalError):
+            queue.flush()
+        assert list(queue._items) == samples
+    queue.flush()
+    assert store.stored == samples
+
+
+def test_queue_drops_only_unstorable_sample(monkeypatch):
+    store = FakeStore(bad_loads={11})
+    queue = make_queue(monkeypatch, store, max_retries=2)
+    samples = make_samples([1, 2, 3, 4])
+    queue._items.extend(samples)
+
+    for _ in range(2):
+        with pytest.raises(sqlite3.IntegrityError):
+            queue.flush()
+    queue.flush()
+
+    assert store.stored == [samples[0]] + samples[2:]
+    assert len(queue) == 0
+
+
+def test_queue_stop_drains_past_bad_sample(monkeypatch):
+    store = FakeStore(bad_loads={10})
+    queue = make_queue(monkeypatch, store, flush_interval=60)
+    samples = make_samples([1, 2, 3])
+    queue.put_many(samples)
+
+    queue.stop()
+
+    assert store.stored == samples[1:]
+    assert len(queue) == 0
@@ -0,0 +1,20 @@
+from instrumentation import statement_template
+
+
+def test_statement_template_collapses_placeholder_lists():
+    in_lists = {statement_template(f"SELECT id FROM servers WHERE id IN ({','.join('?' * n)})")
+                for n in (1, 2, 250, 500)}
+    assert in_lists == {'SELECT id FROM servers WHERE id IN (?…)'}
+
+    rows = {statement_template(f"""
+        SELECT server_id FROM server_load_blocks
+        WHERE (server_id, block_start) IN (VALUES {','.join(['(?, ?)'] * n)})
+    """) for n in (1, 3, 250)}
+    assert rows == {'SELECT server_id FROM server_load_blocks '
+                    'WHERE (server_id, block_start) IN (VALUES (?…))'}
+
+
+def test_statement_template_keeps_statement_shape():
+    assert statement_template("SELECT * FROM servers  WHERE id = 5 LIMIT 10") == \
+        'SELECT * FROM servers WHERE id = ? LIMIT ?'
+    assert statement_template("INSERT INTO t (a, b) VALUES (?, ?)") == 'INSERT INTO t (a, b) VALUES (?…)'
@@ -0,0 +1,61 @@
+import socket
+import time
+
+import pytest
+
+import wire
+from listener import UDPListener
+from ratelimit import RateLimited
+
+SECRET = 'listener-test-secret'
+
+
+def make_frame(epoch):
+    return wire.encode_frame([{'server_id': 1, 'load': 10, 'epoch': epoch}], SECRET)
+
+
+@pytest.mark.parametrize('epoch', [float('inf'), 1e20, -1.0])
+def test_out_of_range_epoch_is_malformed(epoch):
+    handled = []
+    listener = UDPListener('127.0.0.1', 0, SECRET, lambda samples, client: handled.append(samples))
+
+    assert listener.process(make_frame(epoch), '127.0.0.1') is False
+    assert handled == []
+
+
+def test_admit_runs_before_decrypt(monkeypatch):
+    def admit(client):
+        raise RateLimited(1)
+
+    def decode_frame(frame, secret):
+        raise AssertionError('frame decrypted despite the client limit')
+
+    monkeypatch.setattr(wire, 'decode_frame', decode_frame)
+    listener = UDPListener('127.0.0.1', 0, SECRET, lambda samples, client: None, admit=admit)
+
+    assert listener.process(b'junk', '127.0.0.1') is True
+
+
+def test_udp_thread_survives_failing_frame(monkeypatch):
+    handled = []
+    listener = UDPListener('127.0.0.1', 0, SECRET, lambda samples, client: handled.append(samples))
+    real_decode = wire.decode_frame
+
+    def decode_frame(frame, secret):
+        if frame == b'boom':
+            raise OverflowError('timestamp out of range')
+        return real_decode(frame, secret)
+
+    monkeypatch.setattr(wire, 'decode_frame', decode_frame)
+    listener.start()
+    try:
+        with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+            sock.sendto(b'boom', ('127.0.0.1', listener.port))
+            sock.sendto(make_frame(time.time()), ('127.0.0.1', listener.port))
+        deadline = time.monotonic() + 5
+        while not handled and time.monotonic() < deadline:
+            time.sleep(0.01)
+    finally:
+        listener.stop()
+
+    assert len(handled) == 1
@@ -0,0 +1,86 @@
+from placement import PlacementIndex
+
+
+def server(server_id, load, purpose='survival', capacity=None, is_available=1, is_stale=0):
+    return {'id': server_id, 'purpose': purpose, 'current_load': load, 'capacity': capacity,
+            'is_available': is_available, 'is_stale': is_stale}
+
+
+def make_index(servers, counts=None, last_id=0, pending_weight=5):
+    return PlacementIndex(lambda: (servers, counts or {}, last_id), pending_weight=pending_weight)
+
+
+def test_place_picks_least_loaded_and_counts_pending():
+    index = make_index([server(1, 10), server(2, 20), server(3, 0, purpose='creative')])
+
+    # Каждая регистрация до замера добавляет pending_weight к нагрузке,
+    # при равенстве выбирается меньший id
+    assert [index.place('survival') for _ in range(4)] == [1, 1, 1, 2]
+    assert index.place('creative') == 3
+    assert index.place('missing') is None
+
+
+def test_new_sample_resets_pending():
+    index = make_index([server(1, 10), server(2, 20)])
+    index.place('survival')
+    index.place('survival')
+
+    index.set_load(1, 50)
+    assert index.place('survival') == 2
+
+
+def test_capacity_unavailable_and_stale_are_skipped():
+    index = make_index([server(1, 0, capacity=1), server(2, 50), server(3, 10, is_available=0),
+                        server(4, 10, is_stale=1)], counts={2: 0})
+
+    assert index.place('survival') == 1
+    # Сервер 1 заполнен, 3 и 4 выключены
+    assert index.place('survival') == 2
+    assert index.reserve(1) is False
+    assert index.reserve(3) is False
+
+    index.set_stale(4, False)
+    assert index.place('survival') == 4
+
+
+def test_release_returns_capacity():
+    index = make_index([server(1, 0, capacity=1), server(2, 50)])
+    assert index.place('survival') == 1
+    assert index.place('survival') == 2
+
+    index.release(1)
+    assert index.place('survival') == 1
+
+
+def test_reject_drops_server_until_reload():
+    index = make_index([server(1, 0), server(2, 50)])
+    assert index.place('survival') == 1
+
+    index.reject(1)
+    assert index.place('survival') == 2
+    assert index.reserve(1) is False
+
+    index.invalidate()
+    assert index.place('survival') == 1
+
+
+def test_apply_registrations_skips_loaded_and_own():
+    index = make_index([server(1, 0), server(2, 8)], counts={1: 3}, last_id=10)
+    assert index.place('survival') == 1
+    index.confirm(11)
+
+    # 9 уже в счетчиках загрузки, 11 - своя заявка, 12 - заявка другого процесса
+    index.apply_registrations([(9, 2), (11, 1), (12, 1)])
+
+    # Сервер 1: 0 + 2 * 5 = 10, сервер 2: 8
+    assert index.place('survival') == 2
+
+
+def test_stale_heap_entries_are_compacted():
+    index = make_index([server(1, 0), server(2, 0)])
+    index.place('survival')
+    for load in range(200):
+        index.set_load(1, load % 7)
+
+    assert len(index._heaps['survival']) <= 2 * 2 + 32 + 1
+    assert index.place('survival') in (1, 2)
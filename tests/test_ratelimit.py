@@ -0,0 +1,74 @@
+import pytest
+
+from ratelimit import RateLimited, RateLimiter
+
+
+def test_gcra_allows_burst_then_spaces_requests():
+    limiter = RateLimiter({'api': [(3, 60)]})
+
+    for _ in range(3):
+        limiter.hit('api', 'a', now=1000)
+    with pytest.raises(RateLimited) as error:
+        limiter.hit('api', 'a', now=1000)
+    # Емкость восстанавливается по одной единице за window / limit секунд
+    assert error.value.retry_after == 20
+
+    limiter.hit('api', 'a', now=1020)
+    with pytest.raises(RateLimited):
+        limiter.hit('api', 'a', now=1021)
+    limiter.hit('api', 'b', now=1021)
+
+
+def test_every_rule_applies_and_cost_counts():
+    limiter = RateLimiter({'api': [(10, 1), (12, 60)]})
+
+    limiter.hit('api', 'a', cost=10, now=0)
+    with pytest.raises(RateLimited):
+        limiter.hit('api', 'a', now=0)
+    # Секундное правило уже пропускает, минутное - нет
+    limiter.hit('api', 'a', cost=2, now=1)
+    with pytest.raises(RateLimited):
+        limiter.hit('api', 'a', now=2)
+
+
+def test_check_does_not_charge():
+    limiter = RateLimiter({'api': [(1, 60)]})
+
+    for _ in range(3):
+        limiter.check('api', 'a', now=0)
+    limiter.hit('api', 'a', now=0)
+    with pytest.raises(RateLimited):
+        limiter.check('api', 'a', now=1)
+
+
+def test_dump_restore_keeps_live_state(tmp_path):
+    limiter = RateLimiter({'api': [(1, 60)], 'other': [(5, 10)]})
+    limiter.hit('api', 'a', now=0)
+    limiter.hit('other', 'b', now=0)
+
+    # Запись 'other' к моменту снимка уже восстановилась - ее не сохраняем
+    state = limiter.dump(now=30)
+    assert state == {'api': {'a': [60.0]}}
+
+    restored = RateLimiter({'api': [(1, 60)], 'other': [(5, 10)]})
+    restored.restore(state, now=30)
+    with pytest.raises(RateLimited):
+        restored.hit('api', 'a', now=30)
+    restored.hit('api', 'a', now=60)
+
+    # Правила политики сменились - старое состояние не применяется
+    changed = RateLimiter({'api': [(1, 60), (5, 3600)]})
+    changed.restore(state, now=30)
+    changed.hit('api', 'a', now=30)
+
+
+def test_save_load_roundtrip(tmp_path):
+    path = tmp_path / 'limits.json'
+    limiter = RateLimiter({'api': [(1, 3600)]})
+    limiter.hit('api', 'a')
+    limiter.save(path)
+
+    restored = RateLimiter({'api': [(1, 3600)]})
+    restored.load(path)
+    assert not restored.allow('api', 'a')
+    RateLimiter({'api': [(1, 3600)]}).load(tmp_path / 'missing.json')
@@ -0,0 +1,83 @@
+import csv
+import io
+
+import pytest
+
+from registrations import decode_cursor, delete_registrations, export_registrations_csv, registrations_page
+
+
+@pytest.fixture
+def registered(db):
+    # Несколько заявок с одинаковой датой: порядок страниц держится на id
+    rows = [
+        ('alice', '10.0.0.1', 1, '2026-10-16 09:00:00'),
+        ('bob', '10.0.0.2', 1, '2026-10-17 09:00:00'),
+        ('bobby', '10.0.1.1', 2, '2026-10-17 09:00:00'),
+        ('carol', '10.0.0.3', 2, '2026-10-17 09:00:00'),
+        ('dave', '10.0.0.4', 1, '2026-10-18 09:00:00'),
+    ]
+    db.executemany(
+        "INSERT INTO registrations (nickname, request_ip, server_id, registration_date) VALUES (?, ?, ?, ?)",
+        rows
+    )
+    db.commit()
+    return db
+
+
+def nicknames(rows):
+    return [row['nickname'] for row in rows]
+
+
+def test_keyset_pages_cover_all_rows_once(registered):
+    pages, cursor = [], None
+    while True:
+        rows, cursor = registrations_page(registered, limit=2, cursor=cursor)
+        pages.append(nicknames(rows))
+        if cursor is None:
+            break
+
+    assert pages == [['dave', 'carol'], ['bobby', 'bob'], ['alice']]
+
+
+def test_page_after_new_registration_does_not_shift(registered):
+    first, cursor = registrations_page(registered, limit=2)
+    registered.execute(
+        "INSERT INTO registrations (nickname, request_ip, server_id, registration_date) VALUES (?, ?, ?, ?)",
+        ('eve', '10.0.0.5', 1, '2026-10-18 10:00:00')
+    )
+
+    rows, _ = registrations_page(registered, limit=2, cursor=cursor)
+    assert nicknames(rows) == ['bobby', 'bob']
+
+
+def test_filters(registered):
+    assert nicknames(registrations_page(registered, nickname='bob')[0]) == ['bobby', 'bob']
+    assert nicknames(registrations_page(registered, ip='10.0.0.')[0]) == ['dave', 'carol', 'bob', 'alice']
+    assert nicknames(registrations_page(registered, server_id=2)[0]) == ['carol', 'bobby']
+    # Дата без времени - день целиком
+    assert nicknames(registrations_page(registered, date_from='2026-10-17', date_to='2026-10-17')[0]) \
+        == ['carol', 'bobby', 'bob']
+
+
+def test_invalid_cursor():
+    with pytest.raises(ValueError):
+        decode_cursor('garbage')
+
+
+def test_delete_by_filter_and_ids(registered):
+    with pytest.raises(ValueError):
+        delete_registrations(registered)
+
+    assert delete_registrations(registered, server_id=2) == {2: 2}
+    ids = [row['id'] for row in registrations_page(registered, nickname='alice')[0]]
+    assert delete_registrations(registered, ids=ids) == {1: 1}
+    assert delete_registrations(registered, ids=[]) == {}
+    assert nicknames(registrations_page(registered)[0]) == ['dave', 'bob']
+
+
+def test_csv_export_streams_filtered_rows(registered):
+    data = ''.join(export_registrations_csv(registered, server_id=1))
+
+    rows = list(csv.DictReader(io.StringIO(data)))
+    assert [row['nickname'] for row in rows] == ['dave', 'bob', 'alice']
+    assert rows[0]['ip_address']
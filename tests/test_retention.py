@@ -0,0 +1,52 @@
+import time
+
+import retention
+from database import MIGRATIONS
+from wire import from_epoch
+
+
+def insert_history(db, rows):
+    db.executemany(
+        "INSERT INTO server_load_history (server_id, load_value, timestamp) VALUES (?, ?, ?)", rows
+    )
+    db.commit()
+
+
+def history_loads(db):
+    return [row[0] for row in db.execute("SELECT load_value FROM server_load_history ORDER BY id")]
+
+
+def test_purge_cutoff_on_the_same_day(db):
+    # Оба замера в день границы: строки сравниваются посимвольно, разделитель важен
+    now = time.time()
+    insert_history(db, [
+        (1, 10, from_epoch(now - 3 * 3600)),
+        (1, 20, from_epoch(now - 3600)),
+    ])
+
+    assert retention.purge_expired(db, retention_hours=2, batch_size=1) == 1
+    assert history_loads(db) == [20]
+
+
+def test_trim_history_keeps_window(db):
+    now = time.time()
+    insert_history(db, [(1, load, from_epoch(now - 100 + load)) for load in range(5)]
+                   + [(2, 50, from_epoch(now))])
+
+    retention.trim_history(db, [1, 2], window=2)
+    db.commit()
+
+    assert history_loads(db) == [3, 4, 50]
+
+
+def test_timestamp_migration_normalizes_legacy_rows(db):
+    insert_history(db, [
+        (1, 1, '2026-10-18 07:00:00'),
+        (1, 2, '2026-10-18T10:00:00+03:00'),
+        (1, 3, '2026-10-18T07:00:00.250000'),
+    ])
+
+    db.executescript(dict(MIGRATIONS)[12])
+
+    rows = [row[0] for row in db.execute("SELECT timestamp FROM server_load_history ORDER BY id")]
+    assert rows == ['2026-10-18T07:00:00', '2026-10-18T07:00:00', '2026-10-18T07:00:00.250000']
@@ -0,0 +1,53 @@
+from database import get_db
+from snapshot import ServerSnapshot
+
+
+def test_single_process_snapshot_does_not_reload_by_timer(db, monkeypatch):
+    snapshot = ServerSnapshot(get_db)
+    snapshot.servers()
+    reloads = []
+    monkeypatch.setattr(snapshot, 'reload', lambda: reloads.append(1))
+    # Время идет, но без ttl снимок перечитывается только по invalidate
+    snapshot._loaded_at -= 3600
+    snapshot.servers()
+    assert reloads == []
+
+    snapshot.invalidate()
+    snapshot.servers()
+    assert reloads == [1]
+
+
+def test_write_updates_snapshot_and_drops_cached(db):
+    snapshot = ServerSnapshot(get_db)
+    builds = []
+
+    def build():
+        builds.append(1)
+        return [server['current_load'] for server in snapshot.servers()]
+
+    first = snapshot.cached('loads', build)
+    assert snapshot.cached('loads', build) is first
+    assert len(builds) == 1
+
+    version = snapshot.version
+    snapshot.apply_samples([{'server_id': 1, 'load': 77, 'timestamp': '2026-10-18T07:00:00'}])
+    assert snapshot.version > version
+    assert snapshot.get_server(1)['current_load'] == 77
+    assert snapshot.history(1)[-1] == ('2026-10-18T07:00:00', 77)
+
+    assert snapshot.cached('loads', build)[0] == 77
+    assert len(builds) == 2
+
+
+def test_server_cache_survives_other_server_writes(db):
+    snapshot = ServerSnapshot(get_db)
+    builds = []
+    snapshot.cached(('chart', 1), lambda: builds.append(1), server_id=1)
+
+    snapshot.set_load(2, 50)
+    snapshot.cached(('chart', 1), lambda: builds.append(1), server_id=1)
+    assert len(builds) == 1
+
+    snapshot.set_load(1, 50)
+    snapshot.cached(('chart', 1), lambda: builds.append(1), server_id=1)
+    assert len(builds) == 2
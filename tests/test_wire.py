@@ -0,0 +1,53 @@
+import pytest
+
+import server_mon
+import wire
+
+SECRET = 'wire-test-secret'
+
+
+@pytest.fixture
+def agent_secret(monkeypatch):
+    monkeypatch.setattr(server_mon, 'SECRET_KEY', SECRET)
+    server_mon.get_key.cache_clear()
+    yield SECRET
+    server_mon.get_key.cache_clear()
+
+
+def test_agent_frame_layout_matches_server():
+    assert server_mon.METRIC_IDS == wire.METRIC_IDS
+    assert (server_mon.FRAME_MAGIC, server_mon.FRAME_VERSION) == (wire.FRAME_MAGIC, wire.FRAME_VERSION)
+    for agent, server in ((server_mon.FRAME_HEADER, wire.HEADER), (server_mon.FRAME_COUNT, wire.COUNT),
+                          (server_mon.FRAME_SAMPLE, wire.SAMPLE), (server_mon.FRAME_METRIC, wire.METRIC),
+                          (server_mon.FRAME_LENGTH, wire.FRAME_LENGTH)):
+        assert agent.format == server.format
+
+
+def test_agent_frame_decodes_on_server(agent_secret):
+    metrics = {name: float(metric_id * 8) for name, metric_id in wire.METRIC_IDS.items()}
+    samples = [
+        {'server_id': 7, 'load': 42, 'timestamp': '2026-10-18T07:00:00.250000', 'metrics': metrics},
+        {'server_id': 8, 'load': 0, 'timestamp': '2026-10-18T07:00:05', 'metrics': {'unknown': 1.0}},
+    ]
+
+    decoded = wire.decode_frame(server_mon.encode_frame(samples), agent_secret)
+
+    assert decoded == [
+        {'server_id': 7, 'load': 42, 'epoch': wire.to_epoch(samples[0]['timestamp']), 'metrics': metrics},
+        {'server_id': 8, 'load': 0, 'epoch': wire.to_epoch(samples[1]['timestamp']), 'metrics': {}},
+    ]
+    assert server_mon.encode_frame(samples) != server_mon.encode_frame(samples)
+
+
+def test_agent_legacy_payload_decodes_on_server(agent_secret):
+    sample = {'server_id': 7, 'load': 42, 'timestamp': '2026-10-18T07:00:00'}
+
+    assert wire.decrypt_json(server_mon.encrypt_data(sample), agent_secret) == sample
+
+
+def test_frame_with_wrong_secret_is_rejected(agent_secret):
+    frame = server_mon.encode_frame([{'server_id': 1, 'load': 1, 'timestamp': '2026-10-18T07:00:00'}])
+    with pytest.raises(ValueError):
+        wire.decode_frame(frame, 'other-secret')
+    with pytest.raises(ValueError):
+        wire.decode_frame(frame[:-1] + bytes([frame[-1] ^ 1]), agent_secret)
@@ -0,0 +1,67 @@
+"""Локальные копии библиотек, которые шаблоны раньше брали с CDN.
+
+Скачать (один раз, затем закоммитить static/vendor):
+    python vendor_assets.py
+
+Пока локального файла нет, шаблоны ссылаются на тот же файл на CDN.
+"""
+import os
+import sys
+
+import requests
+
+STATIC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static')
+CDN = 'https://cdn.jsdelivr.net/npm'
+
+# Имя в шаблоне -> (путь внутри static, адрес на CDN); версии зафиксированы
+ASSETS = {
+    'bootstrap.css': ('vendor/bootstrap/bootstrap.min.css',
+                      f'{CDN}/bootstrap@5.1.3/dist/css/bootstrap.min.css'),
+    'bootstrap.js': ('vendor/bootstrap/bootstrap.bundle.min.js',
+                     f'{CDN}/bootstrap@5.1.3/dist/js/bootstrap.bundle.min.js'),
+    'bootstrap-icons.css': ('vendor/bootstrap-icons/bootstrap-icons.css',
+                            f'{CDN}/bootstrap-icons@1.8.1/font/bootstrap-icons.css'),
+    'chart.js': ('vendor/chart.js/chart.umd.js',
+                 f'{CDN}/chart.js@4.4.1/dist/chart.umd.js'),
+}
+# Файлы, на которые ссылаются CSS относительными путями (шрифт иконок)
+DEPENDENCIES = [
+    ('vendor/bootstrap-icons/fonts/bootstrap-icons.woff2',
+     f'{CDN}/bootstrap-icons@1.8.1/font/fonts/bootstrap-icons.woff2'),
+    ('vendor/bootstrap-icons/fonts/bootstrap-icons.woff',
+     f'{CDN}/bootstrap-icons@1.8.1/font/fonts/bootstrap-icons.woff'),
+]
+
+
+def local_path(name):
+    """Путь внутри static, если локальная копия скачана, иначе None"""
+    filename = ASSETS[name][0]
+    return filename if os.path.exists(os.path.join(STATIC_DIR, filename)) else None
+
+
+def cdn_url(name):
+    return ASSETS[name][1]
+
+
+def fetch(filename, url):
+    response = requests.get(url, timeout=30)
+    response.raise_for_status()
+    path = os.path.join(STATIC_DIR, filename)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as f:
+        f.write(response.content)
+    print(f'{url} -> static/{filename} ({len(response.content)} байт)')
+
+
+def main():
+    for filename, url in list(ASSETS.values()) + DEPENDENCIES:
+        try:
+            fetch(filename, url)
+        except requests.RequestException as e:
+            print(f'Не удалось скачать {url}: {e}', file=sys.stderr)
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
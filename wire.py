@@ -0,0 +1,158 @@
+"""Форматы сообщений агент -> центральный сервер.
+
+Legacy: JSON -> AES-CBC с дополнением -> base64 -> {"data": ...}.
+Frame v1: бинарный кадр с фиксированной раскладкой полей, AES-OCB
+(без дополнения, со встроенной проверкой целостности):
+
+    заголовок  '<2sB12s'  магия b'GS', версия, nonce
+    тело       '<H'       количество замеров
+               '<IBdB'    server_id, load, timestamp (epoch UTC), число метрик
+               '<Bf'      id метрики, значение (повторяется)
+    тег        16 байт
+
+Вне HTTP (ingest-listener) кадр v1 идет как есть: по UDP одна датаграмма -
+один кадр, по TCP перед каждым кадром его длина '<H'.
+"""
+import base64
+import hashlib
+import json
+import math
+import struct
+from datetime import datetime, timedelta, timezone
+from functools import lru_cache
+
+from Crypto.Cipher import AES
+from Crypto.Random import get_random_bytes
+from Crypto.Util.Padding import pad, unpad
+
+FRAME_MIMETYPE = 'application/octet-stream'
+FRAME_MAGIC = b'GS'
+FRAME_VERSION = 1
+HEADER = struct.Struct('<2sB12s')
+COUNT = struct.Struct('<H')
+SAMPLE = struct.Struct('<IBdB')
+METRIC = struct.Struct('<Bf')
+NONCE_SIZE = 12
+# Допустимое время замера (epoch UTC): 1970-01-01 .. 2100-01-01
+MIN_EPOCH = 0
+MAX_EPOCH = 4102444800
+UNIX_EPOCH = datetime(1970, 1, 1)
+TAG_SIZE = 16
+FRAME_LENGTH = struct.Struct('<H')
+
+# Коды метрик в кадре; новые метрики добавляются только в конец
+METRIC_IDS = {
+    'ram': 1,
+    'net_rx_bps': 2,
+    'net_tx_bps': 3,
+    'disk_read_bps': 4,
+    'disk_write_bps': 5,
+    'proc_cpu': 6,
+    'proc_rss_mb': 7,
+    'players': 8,
+}
+METRIC_NAMES = {metric_id: name for name, metric_id in METRIC_IDS.items()}
+
+
+@lru_cache(maxsize=8)
+def derive_key(secret: str) -> bytes:
+    """Ключ AES из секрета (вычисляется один раз на секрет)"""
+    return hashlib.sha256(secret.encode()).digest()
+
+
+def encrypt_json(data: dict, secret: str) -> str:
+    """Шифрование в legacy-формате (JSON + AES-CBC + base64)"""
+    cipher = AES.new(derive_key(secret), AES.MODE_CBC)
+    ct_bytes = cipher.encrypt(pad(json.dumps(data).encode(), AES.block_size))
+    return base64.b64encode(cipher.iv + ct_bytes).decode('utf-8')
+
+
+def decrypt_json(encrypted_data: str, secret: str) -> dict:
+    """Дешифрование legacy-формата"""
+    encrypted_data = base64.b64decode(encrypted_data)
+    iv = encrypted_data[:AES.block_size]
+    ct = encrypted_data[AES.block_size:]
+    cipher = AES.new(derive_key(secret), AES.MODE_CBC, iv=iv)
+    pt = unpad(cipher.decrypt(ct), AES.block_size)
+    return json.loads(pt.decode('utf-8'))
+
+
+def to_epoch(timestamp: str) -> float:
+    """ISO-время агента -> epoch; время без зоны считается UTC"""
+    moment = datetime.fromisoformat(timestamp)
+    if moment.tzinfo is None:
+        return moment.replace(tzinfo=timezone.utc).timestamp()
+    return moment.astimezone(timezone.utc).timestamp()
+
+
+def from_epoch(epoch: float) -> str:
+    """epoch -> ISO-время в формате, который хранится в истории"""
+    # Сложение с наивной эпохой вдвое дешевле fromtimestamp(tz) + replace, результат тот же
+    return (UNIX_EPOCH + timedelta(seconds=epoch)).isoformat()
+
+
+def check_epoch(epoch: float) -> float:
+    """Время замера в допустимых пределах; ValueError для nan, inf и вне диапазона"""
+    if not (math.isfinite(epoch) and MIN_EPOCH <= epoch < MAX_EPOCH):
+        raise ValueError('Invalid timestamp')
+    return epoch
+
+
+def encode_frame(samples: list, secret: str, nonce: bytes = None) -> bytes:
+    """Упаковка и шифрование замеров в кадр v1"""
+    parts = [COUNT.pack(len(samples))]
+    for sample in samples:
+        metrics = [
+            (METRIC_IDS[name], value)
+            for name, value in (sample.get('metrics') or {}).items()
+            if name in METRIC_IDS and value is not None
+        ]
+        epoch = sample['epoch'] if 'epoch' in sample else to_epoch(sample['timestamp'])
+        parts.append(SAMPLE.pack(sample['server_id'], sample['load'], epoch, len(metrics)))
+        parts.extend(METRIC.pack(metric_id, value) for metric_id, value in metrics)
+
+    cipher = AES.new(derive_key(secret), AES.MODE_OCB, nonce=nonce or get_random_bytes(NONCE_SIZE))
+    header = HEADER.pack(FRAME_MAGIC, FRAME_VERSION, cipher.nonce)
+    cipher.update(header)
+    ciphertext, tag = cipher.encrypt_and_digest(b''.join(parts))
+    return header + ciphertext + tag
+
+
+def decode_frame(frame: bytes, secret: str) -> list:
+    """Проверка, расшифровка и распаковка кадра; ValueError при ошибке.
+
+    Время замера остается числом ('epoch'), без перевода в строку -
+    validate_sample примет его как есть.
+    """
+    if len(frame) < HEADER.size + COUNT.size + TAG_SIZE:
+        raise ValueError('Frame is too short')
+    header = frame[:HEADER.size]
+    magic, version, nonce = HEADER.unpack(header)
+    if magic != FRAME_MAGIC or version != FRAME_VERSION:
+        raise ValueError('Unsupported frame')
+
+    cipher = AES.new(derive_key(secret), AES.MODE_OCB, nonce=nonce)
+    cipher.update(header)
+    body = cipher.decrypt_and_verify(frame[HEADER.size:-TAG_SIZE], frame[-TAG_SIZE:])
+
+    try:
+        (count,), offset = COUNT.unpack_from(body), COUNT.size
+        samples = []
+        for _ in range(count):
+            server_id, load, epoch, metric_count = SAMPLE.unpack_from(body, offset)
+            offset += SAMPLE.size
+            metrics = {}
+            for _ in range(metric_count):
+                metric_id, value = METRIC.unpack_from(body, offset)
+                offset += METRIC.size
+                if metric_id in METRIC_NAMES:
+                    metrics[METRIC_NAMES[metric_id]] = value
+            samples.append({
+                'server_id': server_id,
+                'load': load,
+                'epoch': check_epoch(epoch),
+                'metrics': metrics,
+            })
+    except struct.error:
+        raise ValueError('Malformed frame')
+    return samples
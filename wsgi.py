@@ -0,0 +1,7 @@
+"""Точка входа для запуска в нескольких процессах:
+
+    gunicorn -c gunicorn.conf.py wsgi:app
+"""
+from app import create_app
+
+app = create_app(multiprocess=True)